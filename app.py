@@ -1,20 +1,45 @@
+import time
+APP_STARTED_AT = time.perf_counter() # Taken before the other imports so the startup report includes them
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, Spinbox
 import os
 import threading
-import queue
 import sys
 import re
 from tkinter import ttk # Import ttk for Notebook
 
 # Import constants and PhotoOrganizer from main_logic.py
 from main_logic import PhotoOrganizer, TEMP_RESIZE_FOLDER, NUM_TOP_TAGS, TAG_CONFIDENCE_THRESHOLD
+from image_tagger import ImageTagger
+from metrics import record_import_seconds
+from tag_scoring import SCORING_MODES, TAG_SCORING_FILE
+from log_pipeline import LogPipeline, LOG_FILE, VISIBLE_LOG_LINES
+from job_queue import JobQueue, OrganizeJob, tagger_options_for
+from layout import DestinationLayout, DEFAULT_FOLDER_LAYOUT, DEFAULT_FILENAME_LAYOUT, LAYOUT_FIELDS
+from events import EVENT_GAP_HOURS, EVENT_SIMILARITY_THRESHOLD
+from metadata import METADATA_MODES
+from transfer import TRANSFER_MODES, DEFAULT_IO_CONCURRENCY
+from preview_cache import PreviewCache, library_photos, find_preview, PREVIEW_FOLDER_NAME, DEFAULT_PREVIEW_CACHE_MB
+from PIL import Image, ImageTk
 
 import tkinterdnd2 as tkdnd
 
+record_import_seconds("app", time.perf_counter() - APP_STARTED_AT)
+
 
 # Define the file where custom tags will be stored
 CUSTOM_TAGS_FILE = "custom_tags.txt"
+SCORING_MODE_FROM_FILE = "auto"
+LOG_POLL_INTERVAL_MS = 100
+MAX_LOG_EVENTS_PER_TICK = 500
+CANCEL_JOIN_TIMEOUT = 2.0
+# Lets Tk draw the window before the model starts loading in the background
+MODEL_WARMUP_DELAY_MS = 200
+GALLERY_PAGE_SIZE = 40
+GALLERY_COLUMNS = 5
+GALLERY_THUMB_SIZE = 180
+GALLERY_VIEW_SIZE = 1024
+LOG_LEVEL_TAGS = {'error': 'error_tag', 'warning': 'warning_tag', 'success': 'success_tag', 'info': 'info_tag'}
 
 class PhotoOrganizerApp:
     def __init__(self, root):
@@ -30,19 +55,47 @@ class PhotoOrganizerApp:
         self.num_top_tags_var = tk.IntVar(value=NUM_TOP_TAGS)
         self.tag_confidence_var = tk.DoubleVar(value=TAG_CONFIDENCE_THRESHOLD)
         self.processing_mode = tk.StringVar(value="jpg_and_raw")
+        self.build_search_index = tk.BooleanVar(value=False)
+        self.scoring_mode = tk.StringVar(value=SCORING_MODE_FROM_FILE)
+        self.vocabulary_path = tk.StringVar(value="")
+        self.multi_crop_tagging = tk.BooleanVar(value=False)
+        self.tagging_workers = tk.StringVar(value="")
+        self.folder_layout = tk.StringVar(value=DEFAULT_FOLDER_LAYOUT)
+        self.filename_layout = tk.StringVar(value=DEFAULT_FILENAME_LAYOUT)
+        self.event_gap_hours = tk.DoubleVar(value=EVENT_GAP_HOURS)
+        self.refine_events_by_similarity = tk.BooleanVar(value=False)
+        self.metadata_mode = tk.StringVar(value="none")
+        self.memory_budget_mb = tk.IntVar(value=0)
+        self.transfer_mode = tk.StringVar(value="move")
+        self.io_concurrency = tk.IntVar(value=DEFAULT_IO_CONCURRENCY)
+        self.verify_checksums = tk.BooleanVar(value=False)
+        self.preview_cache_mb = tk.IntVar(value=0)
+        self.gallery_folder = tk.StringVar(value="")
+        self.gallery_photos = []
+        self.gallery_page = 0
+        self.gallery_preview_cache = None
+        self.gallery_images = [] # Tk drops images that are not referenced from Python
 
         self.current_custom_tags = [] 
 
         self.create_widgets()
         self.setup_drag_and_drop()
 
-        self.log_queue = queue.Queue()
-        self.after_id = self.root.after(100, self.process_queue)
+        self.log_pipeline = LogPipeline(ring_size=VISIBLE_LOG_LINES, log_file_path=LOG_FILE)
+        self.after_id = self.root.after(LOG_POLL_INTERVAL_MS, self.process_queue)
 
         self.organizer_thread = None
+        self.active_organizer = None
+        self.job_queue = JobQueue(log_callback=self.log_message)
+        self.closing = False
+        self.cancel_requested = False
+        # (tagger options, ImageTagger) loaded in the background or by the last run, reused while the options match
+        self.warm_tagger = None
+        self.warmup_thread = None
 
         self.log_message("Application started. Ready for input.")
         self._load_custom_tags() 
+        self.root.after(MODEL_WARMUP_DELAY_MS, self._on_window_shown)
 
     def create_widgets(self):
         self.notebook = ttk.Notebook(self.root)
@@ -95,6 +148,9 @@ class PhotoOrganizerApp:
         tk.Label(input_frame, text="Min Tag Confidence (0.0 - 1.0):").grid(row=5, column=0, sticky="w", pady=2)
         self.confidence_spinbox = Spinbox(input_frame, from_=0.0, to_=1.0, increment=0.01, format="%.2f", textvariable=self.tag_confidence_var, width=5, bd=2, relief="groove")
         self.confidence_spinbox.grid(row=5, column=1, padx=5, pady=2, sticky="w")
+        self.scoring_mode_combo = ttk.Combobox(input_frame, textvariable=self.scoring_mode, values=(SCORING_MODE_FROM_FILE,) + SCORING_MODES, state="readonly", width=10)
+        self.scoring_mode_combo.grid(row=5, column=2, padx=5, pady=2, sticky="w")
+        tk.Label(input_frame, text=f"Tag scoring ('{SCORING_MODE_FROM_FILE}' uses {TAG_SCORING_FILE})").grid(row=5, column=2, padx=(110, 0), sticky="w")
 
         # New: Processing Mode Selection
         processing_mode_frame = ttk.LabelFrame(input_frame, text="Processing Mode")
@@ -102,6 +158,55 @@ class PhotoOrganizerApp:
 
         tk.Radiobutton(processing_mode_frame, text="Process JPGs & Paired RAWs (Default)", variable=self.processing_mode, value="jpg_and_raw").pack(anchor="w", padx=5, pady=2)
         tk.Radiobutton(processing_mode_frame, text="Process RAWs Only (Convert to JPG & Tag)", variable=self.processing_mode, value="raw_only").pack(anchor="w", padx=5, pady=2)
+        tk.Checkbutton(processing_mode_frame, text="Accuracy mode: respect EXIF rotation and tag several crops per photo (slower)", variable=self.multi_crop_tagging).pack(anchor="w", padx=5, pady=2)
+
+        tk.Checkbutton(input_frame, text="Update text search index in destination (search with photo_search.py)", variable=self.build_search_index).grid(row=7, column=0, columnspan=3, sticky="w", pady=2)
+
+        # Optional large tag vocabulary (one tag per line), scored in addition to the custom tags
+        tk.Label(input_frame, text="Extra Tag Vocabulary File:").grid(row=8, column=0, sticky="w", pady=2)
+        self.vocabulary_entry = tk.Entry(input_frame, textvariable=self.vocabulary_path, width=70, bd=2, relief="groove")
+        self.vocabulary_entry.grid(row=8, column=1, padx=5, pady=2, sticky="ew")
+        tk.Button(input_frame, text="Browse", command=self.browse_vocabulary_file).grid(row=8, column=2, padx=5, pady=2)
+
+        # Optional tagging worker processes started with tagging_service.py; empty means tag in this process
+        tk.Label(input_frame, text="Tagging Workers (host:port, ...):").grid(row=9, column=0, sticky="w", pady=2)
+        tk.Entry(input_frame, textvariable=self.tagging_workers, width=70, bd=2, relief="groove").grid(row=9, column=1, padx=5, pady=2, sticky="ew")
+
+        # Destination layout templates
+        tk.Label(input_frame, text="Folder Layout:").grid(row=10, column=0, sticky="w", pady=2)
+        tk.Entry(input_frame, textvariable=self.folder_layout, width=70, bd=2, relief="groove").grid(row=10, column=1, padx=5, pady=2, sticky="ew")
+        tk.Label(input_frame, text="Filename Layout:").grid(row=11, column=0, sticky="w", pady=2)
+        tk.Entry(input_frame, textvariable=self.filename_layout, width=70, bd=2, relief="groove").grid(row=11, column=1, padx=5, pady=2, sticky="ew")
+        tk.Label(input_frame, text="Fields: " + " ".join("{" + name + "}" for name in LAYOUT_FIELDS), fg="gray", wraplength=600, justify="left").grid(row=12, column=1, sticky="w", padx=5)
+
+        # Event grouping, used by the {event} layout field
+        tk.Label(input_frame, text="New Event After (hours):").grid(row=13, column=0, sticky="w", pady=2)
+        event_frame = tk.Frame(input_frame)
+        event_frame.grid(row=13, column=1, columnspan=2, sticky="w", padx=5)
+        Spinbox(event_frame, from_=0.5, to_=168, increment=0.5, textvariable=self.event_gap_hours, width=6, bd=2, relief="groove").pack(side=tk.LEFT)
+        tk.Checkbutton(event_frame, text="Also split events where the photos change subject", variable=self.refine_events_by_similarity).pack(side=tk.LEFT, padx=10)
+
+        # Tags as searchable keywords, in addition to (or instead of) {tags} in the filename layout
+        tk.Label(input_frame, text="Write Tags As Keywords:").grid(row=14, column=0, sticky="w", pady=2)
+        ttk.Combobox(input_frame, textvariable=self.metadata_mode, values=METADATA_MODES, state="readonly", width=10).grid(row=14, column=1, padx=5, pady=2, sticky="w")
+        tk.Label(input_frame, text="'xmp' = sidecar files, 'iptc' = inside JPEGs (needs pyexiv2)").grid(row=14, column=1, padx=(110, 0), sticky="w")
+
+        # For libraries with millions of files: keeps per-file state on disk beyond this budget
+        tk.Label(input_frame, text="Memory Budget (MB, 0 = no limit):").grid(row=15, column=0, sticky="w", pady=2)
+        Spinbox(input_frame, from_=0, to_=65536, increment=256, textvariable=self.memory_budget_mb, width=8, bd=2, relief="groove").grid(row=15, column=1, padx=5, pady=2, sticky="w")
+
+        # 'copy' leaves the source (e.g. a memory card) untouched
+        tk.Label(input_frame, text="Transfer Files By:").grid(row=16, column=0, sticky="w", pady=2)
+        transfer_frame = tk.Frame(input_frame)
+        transfer_frame.grid(row=16, column=1, columnspan=2, sticky="w", padx=5)
+        ttk.Combobox(transfer_frame, textvariable=self.transfer_mode, values=TRANSFER_MODES, state="readonly", width=6).pack(side=tk.LEFT)
+        tk.Label(transfer_frame, text="Parallel copies:").pack(side=tk.LEFT, padx=(10, 2))
+        Spinbox(transfer_frame, from_=1, to_=32, textvariable=self.io_concurrency, width=4, bd=2, relief="groove").pack(side=tk.LEFT)
+        tk.Checkbutton(transfer_frame, text="Write SHA-256 checksums of copies", variable=self.verify_checksums).pack(side=tk.LEFT, padx=10)
+
+        # Previews for the Gallery tab, made while preparing photos for tagging
+        tk.Label(input_frame, text="Preview Cache (MB, 0 = off):").grid(row=17, column=0, sticky="w", pady=2)
+        Spinbox(input_frame, from_=0, to_=65536, increment=512, textvariable=self.preview_cache_mb, width=8, bd=2, relief="groove").grid(row=17, column=1, padx=5, pady=2, sticky="w")
 
 
         # Configure column 1 to expand horizontally
@@ -109,10 +214,22 @@ class PhotoOrganizerApp:
 
         # --- Start Button (on main tab) ---
         self.start_button = tk.Button(main_tab, text="Start Photo Organization", command=self.start_organization, height=2, bg="#4CAF50", fg="white", font=("Arial", 12, "bold"))
-        self.start_button.pack(pady=15, fill=tk.X, padx=10)
+        self.start_button.pack(pady=(15, 5), fill=tk.X, padx=10)
+
+        # --- Progress (on main tab) ---
+        progress_frame = tk.Frame(main_tab)
+        progress_frame.pack(fill=tk.X, padx=10, pady=(0, 5))
+        self.progress_bar = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, mode='determinate', maximum=1.0)
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = tk.Button(progress_frame, text="Cancel", command=self.cancel_organization, state='disabled')
+        self.cancel_button.pack(side=tk.LEFT, padx=(5, 0))
+        self.progress_label = tk.Label(main_tab, text="", anchor="w")
+        self.progress_label.pack(anchor="w", padx=10)
 
         # --- Log Output (on main tab) ---
         tk.Label(main_tab, text="Process Log:").pack(pady=(5, 0), anchor="w", padx=10)
+        self.throughput_label = tk.Label(main_tab, text="Throughput: -", anchor="w", fg="gray25")
+        self.throughput_label.pack(anchor="w", padx=10)
         self.log_text = scrolledtext.ScrolledText(main_tab, wrap=tk.WORD, height=15, state='disabled', bg="#f0f0f0", bd=2, relief="sunken")
         self.log_text.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
 
@@ -121,7 +238,50 @@ class PhotoOrganizerApp:
         self.log_text.tag_config('success_tag', foreground='green')
         self.log_text.tag_config('info_tag', foreground='blue')
 
-        # Tab 2: Custom Tags
+        # Tab 2: Job Queue
+        queue_tab = ttk.Frame(self.notebook)
+        self.notebook.add(queue_tab, text="Job Queue")
+
+        tk.Label(queue_tab, text="Queue several source/destination pairs (e.g. card readers, phone dumps). Jobs share one loaded AI model,\n"
+                                 "and files of one job are moved while the next job is being tagged.", justify=tk.LEFT).pack(padx=10, pady=10, anchor="w")
+        self.job_listbox = tk.Listbox(queue_tab, height=15, selectmode=tk.EXTENDED)
+        self.job_listbox.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+
+        queue_buttons_frame = tk.Frame(queue_tab)
+        queue_buttons_frame.pack(pady=5)
+        tk.Button(queue_buttons_frame, text="Add Current Folders to Queue", command=self.add_job_to_queue).pack(side=tk.LEFT, padx=5)
+        tk.Button(queue_buttons_frame, text="Remove Selected", command=self.remove_selected_job).pack(side=tk.LEFT, padx=5)
+        tk.Button(queue_buttons_frame, text="Clear Finished", command=self.clear_finished_jobs).pack(side=tk.LEFT, padx=5)
+        self.run_queue_button = tk.Button(queue_buttons_frame, text="Run Queue", command=self.run_job_queue, bg="#4CAF50", fg="white")
+        self.run_queue_button.pack(side=tk.LEFT, padx=5)
+
+        # Tab 3: Gallery, shown from the preview cache so originals (RAWs in particular) are not decoded again
+        gallery_tab = ttk.Frame(self.notebook)
+        self.notebook.add(gallery_tab, text="Gallery")
+
+        gallery_controls = tk.Frame(gallery_tab)
+        gallery_controls.pack(fill=tk.X, padx=10, pady=10)
+        tk.Label(gallery_controls, text="Library Folder:").pack(side=tk.LEFT)
+        tk.Entry(gallery_controls, textvariable=self.gallery_folder, width=60, bd=2, relief="groove").pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        tk.Button(gallery_controls, text="Browse", command=self.browse_gallery_folder).pack(side=tk.LEFT, padx=2)
+        tk.Button(gallery_controls, text="Show", command=self.show_gallery).pack(side=tk.LEFT, padx=2)
+        tk.Button(gallery_controls, text="< Prev", command=lambda: self._change_gallery_page(-1)).pack(side=tk.LEFT, padx=(10, 2))
+        tk.Button(gallery_controls, text="Next >", command=lambda: self._change_gallery_page(1)).pack(side=tk.LEFT, padx=2)
+        self.gallery_page_label = tk.Label(gallery_controls, text="")
+        self.gallery_page_label.pack(side=tk.LEFT, padx=5)
+
+        gallery_body = tk.Frame(gallery_tab)
+        gallery_body.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        self.gallery_canvas = tk.Canvas(gallery_body, bg="#f0f0f0", highlightthickness=0)
+        gallery_scrollbar = tk.Scrollbar(gallery_body, orient=tk.VERTICAL, command=self.gallery_canvas.yview)
+        self.gallery_canvas.configure(yscrollcommand=gallery_scrollbar.set)
+        gallery_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.gallery_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.gallery_grid = tk.Frame(self.gallery_canvas, bg="#f0f0f0")
+        self.gallery_canvas.create_window((0, 0), window=self.gallery_grid, anchor="nw")
+        self.gallery_grid.bind("<Configure>", lambda e: self.gallery_canvas.configure(scrollregion=self.gallery_canvas.bbox("all")))
+
+        # Tab 4: Custom Tags
         tags_tab = ttk.Frame(self.notebook)
         self.notebook.add(tags_tab, text="Manage Custom Tags")
 
@@ -216,6 +376,17 @@ class PhotoOrganizerApp:
             self.destination_path.set(folder_selected)
             self._validate_path_entry(None)
 
+    def browse_gallery_folder(self):
+        folder_selected = filedialog.askdirectory()
+        if folder_selected:
+            self.gallery_folder.set(folder_selected)
+            self.show_gallery()
+
+    def browse_vocabulary_file(self):
+        file_selected = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if file_selected:
+            self.vocabulary_path.set(file_selected)
+
     def _validate_path_entry(self, event):
         current_source = self.source_path.get()
         current_dest = self.destination_path.get()
@@ -247,28 +418,65 @@ class PhotoOrganizerApp:
             self.destination_entry.config(bg='white')
 
     def log_message(self, message, level='info'):
-        self.log_queue.put((message, level))
+        self.log_pipeline.emit(message, level)
 
     def process_queue(self):
-        while not self.log_queue.empty():
-            message, level = self.log_queue.get()
+        organizer = self.active_organizer or self.job_queue.current_organizer()
+        self._refresh_job_list()
+        if organizer is not None:
+            organizer.metrics.set_queue_depth("gui_log", self.log_pipeline.pending_count())
+            self.throughput_label.config(text=f"Throughput: {organizer.metrics.live_line()}")
+            self._update_progress(organizer.get_progress())
+
+        events = self.log_pipeline.drain(MAX_LOG_EVENTS_PER_TICK)
+        if events:
+            # One insert call per tick: consecutive lines with the same level share one chunk
+            insert_args = []
+            chunk_lines = []
+            chunk_tag = None
+            for event in events:
+                tag = LOG_LEVEL_TAGS.get(event.level, ()) # debug or unknown level: no colour
+                if chunk_lines and tag != chunk_tag:
+                    insert_args += ["".join(chunk_lines), chunk_tag]
+                    chunk_lines = []
+                chunk_lines.append(event.message + "\n")
+                chunk_tag = tag
+            insert_args += ["".join(chunk_lines), chunk_tag]
+
             self.log_text.config(state='normal')
-            
-            if level == 'error':
-                self.log_text.insert(tk.END, message + "\n", 'error_tag')
-            elif level == 'warning':
-                self.log_text.insert(tk.END, message + "\n", 'warning_tag')
-            elif level == 'success':
-                self.log_text.insert(tk.END, message + "\n", 'success_tag')
-            elif level == 'info':
-                self.log_text.insert(tk.END, message + "\n", 'info_tag')
-            else: # debug or unknown level
-                self.log_text.insert(tk.END, message + "\n")
-            
+            self.log_text.insert(tk.END, *insert_args)
+
+            # Keep only the newest lines in the widget
+            line_count = int(self.log_text.index('end-1c').split('.')[0])
+            if line_count > VISIBLE_LOG_LINES:
+                self.log_text.delete("1.0", f"{line_count - VISIBLE_LOG_LINES + 1}.0")
+
             self.log_text.config(state='disabled')
             self.log_text.see(tk.END)
 
-        self.after_id = self.root.after(100, self.process_queue)
+        self.after_id = self.root.after(LOG_POLL_INTERVAL_MS, self.process_queue)
+
+    def _update_progress(self, progress):
+        if not progress["stage"]:
+            return
+        self.progress_bar['value'] = progress["fraction"]
+        text = f"{progress['stage'].capitalize()}: {progress['done']}/{progress['total']}"
+        if progress["eta_seconds"] is not None:
+            minutes, seconds = divmod(int(progress["eta_seconds"]), 60)
+            text += f" - about {minutes}:{seconds:02d} left in this stage"
+        self.progress_label.config(text=text)
+
+    def cancel_organization(self):
+        # The organizer may still be loading the model; the request is then applied once it exists
+        self.cancel_requested = True
+        organizer = self.active_organizer
+        if organizer is not None:
+            organizer.cancel()
+        self.job_queue.cancel()
+        if self.organizer_thread is not None:
+            self.cancel_button.config(state='disabled')
+            self.status_label.config(text="Status: Cancelling...")
+            self.log_message("Cancelling after the current file or batch...", level='warning')
 
     def _load_custom_tags(self):
         """Loads custom tags from the specified file."""
@@ -438,31 +646,49 @@ class PhotoOrganizerApp:
         else:
              return os.path.join(current_path, *path_components)
 
-    def start_organization(self):
+    def _read_organizer_options(self):
+        """
+        Validates the form and returns (source, destination, options) where options are the
+        PhotoOrganizer keyword arguments, or None after reporting the problem.
+        """
         source = self.source_path.get()
         destination = self.destination_path.get()
-        signature = self.signature_prefix.get()
         delimiter = self.tag_delimiter.get()
-        num_tags = self.num_top_tags_var.get()
-        confidence = self.tag_confidence_var.get()
-        selected_mode = self.processing_mode.get() # Get the selected mode
+        scoring_mode = self.scoring_mode.get()
+        if scoring_mode == SCORING_MODE_FROM_FILE:
+            scoring_mode = None
+        vocabulary_file = self.vocabulary_path.get().strip() or None
+
+        if vocabulary_file and not os.path.isfile(vocabulary_file):
+            messagebox.showerror("Invalid Input", f"The tag vocabulary file does not exist:\n{vocabulary_file}")
+            self.log_message(f"Error: Tag vocabulary file '{vocabulary_file}' does not exist.", level='error')
+            return None
+
+        folder_layout = self.folder_layout.get().strip() or DEFAULT_FOLDER_LAYOUT
+        filename_layout = self.filename_layout.get().strip() or DEFAULT_FILENAME_LAYOUT
+        try:
+            DestinationLayout(folder_layout, filename_layout)
+        except ValueError as e:
+            messagebox.showerror("Invalid Input", f"Invalid layout template:\n{e}")
+            self.log_message(f"Error: Invalid layout template: {e}", level='error')
+            return None
 
         # Basic validation before starting the thread
         if not source or not os.path.isdir(source):
             messagebox.showerror("Invalid Input", "Please select a valid source folder.")
             self.log_message("Error: Invalid source folder selected or it does not exist.", level='error')
-            return
+            return None
 
         if not destination:
             messagebox.showerror("Invalid Input", "Please select a destination folder.")
             self.log_message("Error: Destination folder not specified.", level='error')
-            return
+            return None
         
         # Ensure delimiter is not empty
         if not delimiter:
             messagebox.showerror("Invalid Input", "Tag delimiter cannot be empty.")
             self.log_message("Error: Tag delimiter is empty.", level='error')
-            return
+            return None
 
         # Check parent directory for writability (destination itself might not exist yet)
         parent_dest_dir = os.path.dirname(destination)
@@ -472,11 +698,11 @@ class PhotoOrganizerApp:
         if not os.path.exists(parent_dest_dir):
             messagebox.showerror("Invalid Input", f"The parent directory of the destination does not exist:\n{parent_dest_dir}")
             self.log_message(f"Error: Parent directory of destination '{destination}' does not exist.", level='error')
-            return
+            return None
         if not os.access(parent_dest_dir, os.W_OK):
             messagebox.showerror("Permission Error", f"Cannot write to the parent directory of the destination:\n{parent_dest_dir}\nPlease choose a writable location.")
             self.log_message(f"Error: Parent directory of destination '{destination}' is not writable.", level='error')
-            return
+            return None
 
         # Normalize the destination path to ensure it's the true *base* folder
         normalized_destination = self._normalize_destination_path(destination)
@@ -484,44 +710,147 @@ class PhotoOrganizerApp:
             self.log_message(f"Adjusted destination path from '{destination}' to '{normalized_destination}' for correct year/month structuring.", level='info')
             destination = normalized_destination # Use the normalized path
 
+        options = {
+            "file_id_prefix": self.signature_prefix.get(),
+            "tag_delimiter": delimiter,
+            "num_top_tags": self.num_top_tags_var.get(),
+            "tag_confidence_threshold": self.tag_confidence_var.get(),
+            "custom_tags": list(self.current_custom_tags),
+            "processing_mode": self.processing_mode.get(),
+            "build_search_index": self.build_search_index.get(),
+            "scoring_mode": scoring_mode,
+            "tag_vocabulary_file": vocabulary_file,
+            "multi_crop_tagging": self.multi_crop_tagging.get(),
+            "tagging_workers": self.tagging_workers.get().strip() or None,
+            "folder_layout": folder_layout,
+            "filename_layout": filename_layout,
+            "event_gap_hours": self.event_gap_hours.get(),
+            "event_similarity_threshold": EVENT_SIMILARITY_THRESHOLD if self.refine_events_by_similarity.get() else None,
+            "metadata_mode": self.metadata_mode.get(),
+            "memory_budget_mb": self.memory_budget_mb.get() or None,
+            "transfer_mode": self.transfer_mode.get(),
+            "io_concurrency": self.io_concurrency.get(),
+            "verify_checksums": self.verify_checksums.get(),
+            "preview_cache_mb": self.preview_cache_mb.get() or None,
+        }
+        return source, destination, options
+
+    def _on_window_shown(self):
+        self.log_message(f"Window ready {time.perf_counter() - APP_STARTED_AT:.2f}s after launch.", level='info')
+        scoring_mode = self.scoring_mode.get()
+        vocabulary_file = self.vocabulary_path.get().strip() or None
+        tagger_options = {
+            "custom_tags": list(self.current_custom_tags),
+            "scoring_mode": None if scoring_mode == SCORING_MODE_FROM_FILE else scoring_mode,
+            "vocabulary_file": vocabulary_file if vocabulary_file and os.path.isfile(vocabulary_file) else None,
+            "tagging_workers": self.tagging_workers.get().strip() or None,
+        }
+        if tagger_options["tagging_workers"]:
+            return # Inference runs in the worker processes
+        self.warmup_thread = threading.Thread(target=self._warm_up_model, args=(tagger_options,), daemon=True)
+        self.warmup_thread.start()
+
+    def _warm_up_model(self, tagger_options):
+        """Loads the tagger while the user fills in the form, so the first run starts tagging right away."""
+        self.log_message("Loading the AI model in the background...", level='info')
+        start = time.perf_counter()
+        try:
+            image_tagger = ImageTagger(custom_tags=tagger_options["custom_tags"], scoring_mode=tagger_options["scoring_mode"],
+                                       vocabulary_file=tagger_options["vocabulary_file"], log_callback=self.log_message)
+        except Exception as e:
+            self.log_message(f"Could not load the AI model in the background: {e}. It will be loaded when organizing starts.", level='warning')
+            return
+        self.warm_tagger = (tagger_options, image_tagger)
+        self.log_message(f"AI model ready ({time.perf_counter() - start:.1f}s).", level='success')
+
+    def _take_warm_tagger(self, tagger_options):
+        """The warm tagger if it was built with these options, else None. Waits for a warmup still in progress."""
+        if self.warmup_thread is not None and self.warmup_thread.is_alive():
+            self.log_message("Waiting for the AI model to finish loading...", level='info')
+            self.warmup_thread.join()
+        if self.warm_tagger is not None and self.warm_tagger[0] == tagger_options:
+            return self.warm_tagger[1]
+        return None
+
+    def _keep_warm_tagger(self, tagger_options, image_tagger):
+        # Remote worker pools hold connections and are cheap to recreate, so only local models are kept
+        if image_tagger is not None and not tagger_options["tagging_workers"]:
+            self.warm_tagger = (dict(tagger_options), image_tagger)
+
+    def _log_options(self, source, destination, options):
+        self.log_message(f"Source: {source}", level='info')
+        self.log_message(f"Destination: {destination} (normalized)", level='info')
+        self.log_message(f"Custom Prefix: '{options['file_id_prefix']}'", level='info')
+        self.log_message(f"Tag Delimiter: '{options['tag_delimiter']}'", level='info')
+        self.log_message(f"Max Tags per Image: {options['num_top_tags']}", level='info')
+        self.log_message(f"Min Tag Confidence: {options['tag_confidence_threshold']}", level='info')
+        self.log_message(f"Processing Mode: {options['processing_mode']}", level='info') # Log the selected mode
+        self.log_message(f"Update Search Index: {options['build_search_index']}", level='info')
+        self.log_message(f"Tag Scoring: {options['scoring_mode'] or SCORING_MODE_FROM_FILE}", level='info')
+        if options['tag_vocabulary_file']:
+            self.log_message(f"Tag Vocabulary File: {options['tag_vocabulary_file']}", level='info')
+        self.log_message(f"Accuracy Mode (multi-crop): {options['multi_crop_tagging']}", level='info')
+        if options['tagging_workers']:
+            self.log_message(f"Tagging Workers: {options['tagging_workers']}", level='info')
+        self.log_message(f"Layout: {options['folder_layout']}/{options['filename_layout']}", level='info')
+        self.log_message(f"Write Tags As Keywords: {options['metadata_mode']}", level='info')
+        if options['memory_budget_mb']:
+            self.log_message(f"Memory Budget: {options['memory_budget_mb']} MB", level='info')
+        if options['preview_cache_mb']:
+            self.log_message(f"Preview Cache: {options['preview_cache_mb']} MB", level='info')
+        if options['transfer_mode'] == "copy":
+            self.log_message(f"Transfer: copy ({options['io_concurrency']} parallel, checksums: {options['verify_checksums']})", level='info')
+        if "{event" in options['folder_layout'] + options['filename_layout']:
+            self.log_message(f"New Event After: {options['event_gap_hours']} hours (split by subject: {options['event_similarity_threshold'] is not None})", level='info')
+
+    def _set_running_ui(self, status_text):
         # Clear previous logs and update UI for start
         self.log_text.config(state='normal')
         self.log_text.delete(1.0, tk.END)
         self.log_text.config(state='disabled')
-        self.status_label.config(text="Status: Organizing photos...")
+        self.status_label.config(text=status_text)
         self.start_button.config(state='disabled', text="Processing...")
+        self.run_queue_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self.cancel_requested = False
+        self.progress_bar['value'] = 0
+        self.progress_label.config(text="")
 
+    def start_organization(self):
+        if self.organizer_thread is not None:
+            return
+        read_options = self._read_organizer_options()
+        if read_options is None:
+            return
+        source, destination, options = read_options
+
+        self._set_running_ui("Status: Organizing photos...")
         self.log_message("Starting organization process...", level='info')
-        self.log_message(f"Source: {source}", level='info')
-        self.log_message(f"Destination: {destination} (normalized)", level='info')
-        self.log_message(f"Custom Prefix: '{signature}'", level='info')
-        self.log_message(f"Tag Delimiter: '{delimiter}'", level='info')
-        self.log_message(f"Max Tags per Image: {num_tags}", level='info')
-        self.log_message(f"Min Tag Confidence: {confidence}", level='info')
-        self.log_message(f"Processing Mode: {selected_mode}", level='info') # Log the selected mode
+        self._log_options(source, destination, options)
 
         # Run organization in a separate thread to keep GUI responsive
         self.organizer_thread = threading.Thread(
             target=self._run_organization_in_thread,
-            args=(source, destination, signature, delimiter, num_tags, confidence, self.current_custom_tags, selected_mode) # Pass selected_mode
+            args=(source, destination, options)
         )
         self.organizer_thread.daemon = True
         self.organizer_thread.start()
 
-    def _run_organization_in_thread(self, source, destination, signature, delimiter, num_tags, confidence, custom_tags, processing_mode):
+    def _run_organization_in_thread(self, source, destination, options):
         """Method to be run in a separate thread for the core organization logic."""
         try:
+            tagger_options = tagger_options_for(options)
             organizer = PhotoOrganizer(
                 source_folder=source,
                 destination_base_folder=destination,
-                file_id_prefix=signature,
-                tag_delimiter=delimiter,
-                num_top_tags=num_tags,
-                tag_confidence_threshold=confidence,
-                custom_tags=custom_tags,
                 log_callback=self.log_message,
-                processing_mode=processing_mode # Pass the processing mode
+                image_tagger=self._take_warm_tagger(tagger_options),
+                **options
             )
+            self.active_organizer = organizer
+            self._keep_warm_tagger(tagger_options, organizer.image_tagger)
+            if self.cancel_requested:
+                organizer.cancel()
             success = organizer.organize_photos()
 
             if os.path.exists(TEMP_RESIZE_FOLDER):
@@ -533,7 +862,9 @@ class PhotoOrganizerApp:
                 except Exception as e:
                     self.log_message(f"Error during final cleanup of '{TEMP_RESIZE_FOLDER}': {e}", level='error')
             
-            if success:
+            if organizer.cancelled:
+                self.log_message("Organization cancelled. Files not yet processed are still in the source folder.", level='warning')
+            elif success:
                 self.log_message("Organization process finished successfully!", level='success')
                 messagebox.showinfo("Success", "Photo organization completed!")
             else:
@@ -544,17 +875,187 @@ class PhotoOrganizerApp:
             self.log_message(f"An unhandled error occurred during organization: {e}", level='error')
             messagebox.showerror("Error", f"An unexpected error occurred: {e}\nCheck log for details.")
         finally:
-            self.root.after(0, self._organization_complete_ui_update)
+            # While closing, the main thread is waiting for this thread and no longer serves Tk calls
+            if not self.closing:
+                self.root.after(0, self._organization_complete_ui_update)
+
+    def add_job_to_queue(self):
+        read_options = self._read_organizer_options()
+        if read_options is None:
+            return
+        source, destination, options = read_options
+        job = self.job_queue.add(OrganizeJob(source, destination, options))
+        self.log_message(f"Queued job #{job.job_id}: {source} -> {destination}", level='info')
+        self._refresh_job_list()
+
+    def remove_selected_job(self):
+        selection = self.job_listbox.curselection()
+        jobs = list(self.job_queue.jobs)
+        for index in selection:
+            if index < len(jobs):
+                self.job_queue.remove(jobs[index])
+        self._refresh_job_list()
+
+    def clear_finished_jobs(self):
+        self.job_queue.clear_finished()
+        self._refresh_job_list()
+
+    def _refresh_job_list(self):
+        descriptions = [job.describe() for job in self.job_queue.jobs]
+        if list(self.job_listbox.get(0, tk.END)) != descriptions:
+            self.job_listbox.delete(0, tk.END)
+            for description in descriptions:
+                self.job_listbox.insert(tk.END, description)
+
+    def run_job_queue(self):
+        if self.organizer_thread is not None:
+            return
+        jobs = self.job_queue.pending_jobs()
+        if not jobs:
+            messagebox.showwarning("Empty Queue", "Add at least one job with 'Add Current Folders to Queue' first.")
+            return
+
+        # The warm tagger serves the first job; the queue loads another one for jobs with other tag settings
+        self.job_queue.set_tagger_options(tagger_options_for(jobs[0].options))
+
+        self._set_running_ui(f"Status: Running {len(jobs)} queued jobs...")
+        self.log_message(f"Starting {len(jobs)} queued jobs...", level='info')
+
+        self.organizer_thread = threading.Thread(target=self._run_job_queue_in_thread, daemon=True)
+        self.organizer_thread.start()
+
+    def _run_job_queue_in_thread(self):
+        try:
+            if self.cancel_requested:
+                self.job_queue.cancel()
+            if self.job_queue.image_tagger is None:
+                self.job_queue.image_tagger = self._take_warm_tagger(self.job_queue.tagger_options)
+            success = self.job_queue.run()
+            self._keep_warm_tagger(self.job_queue.tagger_options, self.job_queue.image_tagger)
+            if self.cancel_requested:
+                self.log_message("Job queue cancelled. Files not yet processed are still in their source folders.", level='warning')
+            elif success:
+                self.log_message("All queued jobs finished successfully!", level='success')
+                messagebox.showinfo("Success", "All queued jobs completed!")
+            else:
+                self.log_message("Some queued jobs failed or completed with errors. Check log for details.", level='error')
+                messagebox.showerror("Failed", "Some queued jobs failed or completed with errors. Check log for details.")
+        except Exception as e:
+            self.log_message(f"An unhandled error occurred while running the job queue: {e}", level='error')
+            messagebox.showerror("Error", f"An unexpected error occurred: {e}\nCheck log for details.")
+        finally:
+            if not self.closing:
+                self.root.after(0, self._organization_complete_ui_update)
+
+    def _gallery_cache(self, library_folder):
+        max_mb = self.preview_cache_mb.get() or DEFAULT_PREVIEW_CACHE_MB
+        return PreviewCache(os.path.join(library_folder, PREVIEW_FOLDER_NAME), max_mb, log_callback=self.log_message)
+
+    def show_gallery(self):
+        library_folder = self.gallery_folder.get().strip() or self.destination_path.get().strip()
+        if not library_folder or not os.path.isdir(library_folder):
+            messagebox.showerror("Invalid Input", "Please select an organized library folder to show.")
+            return
+        self.gallery_folder.set(library_folder)
+        self.gallery_page_label.config(text="Scanning...")
+
+        def scan():
+            photos = library_photos(library_folder)
+            if not self.closing:
+                self.root.after(0, self._gallery_scanned, library_folder, photos)
+        threading.Thread(target=scan, daemon=True).start()
+
+    def _gallery_scanned(self, library_folder, photos):
+        self.gallery_photos = photos
+        self.gallery_page = 0
+        self.gallery_preview_cache = self._gallery_cache(library_folder)
+        self._load_gallery_page()
+
+    def _gallery_page_count(self):
+        return max(1, -(-len(self.gallery_photos) // GALLERY_PAGE_SIZE))
+
+    def _change_gallery_page(self, step):
+        new_page = min(max(self.gallery_page + step, 0), self._gallery_page_count() - 1)
+        if new_page != self.gallery_page:
+            self.gallery_page = new_page
+            self._load_gallery_page()
+
+    def _load_gallery_page(self):
+        page = self.gallery_page
+        photos = self.gallery_photos[page * GALLERY_PAGE_SIZE:(page + 1) * GALLERY_PAGE_SIZE]
+        self.gallery_page_label.config(text=f"Page {page + 1}/{self._gallery_page_count()} ({len(self.gallery_photos)} photos) - loading...")
+        cache = self.gallery_preview_cache
+
+        def load():
+            # Decoding the small previews happens here; only the Tk images are created on the main thread
+            thumbnails = []
+            for photo_files in photos:
+                thumbnail = None
+                preview_path = find_preview(cache, photo_files, GALLERY_THUMB_SIZE)
+                if preview_path is not None:
+                    try:
+                        with Image.open(preview_path) as img:
+                            img.thumbnail((GALLERY_THUMB_SIZE, GALLERY_THUMB_SIZE))
+                            thumbnail = img.copy()
+                    except Exception as e:
+                        self.log_message(f"Could not read preview '{preview_path}': {e}", level='warning')
+                thumbnails.append((photo_files, thumbnail))
+            if not self.closing:
+                self.root.after(0, self._show_gallery_page, page, thumbnails)
+        threading.Thread(target=load, daemon=True).start()
+
+    def _show_gallery_page(self, page, thumbnails):
+        if page != self.gallery_page:
+            return # The user already moved on to another page
+        for child in self.gallery_grid.winfo_children():
+            child.destroy()
+        self.gallery_images = []
+        for position, (photo_files, thumbnail) in enumerate(thumbnails):
+            caption = os.path.basename(photo_files[0]) + (" (+RAW)" if len(photo_files) > 1 else "")
+            tile = tk.Frame(self.gallery_grid, bg="#f0f0f0")
+            tile.grid(row=position // GALLERY_COLUMNS, column=position % GALLERY_COLUMNS, padx=4, pady=4, sticky="n")
+            if thumbnail is not None:
+                image = ImageTk.PhotoImage(thumbnail)
+                self.gallery_images.append(image)
+                picture = tk.Label(tile, image=image, cursor="hand2")
+                picture.bind("<Button-1>", lambda e, files=photo_files: self._open_gallery_preview(files))
+            else:
+                picture = tk.Label(tile, text="No preview", width=22, height=10, bg="#dddddd")
+            picture.pack()
+            tk.Label(tile, text=caption, wraplength=GALLERY_THUMB_SIZE, bg="#f0f0f0", font=("Arial", 8)).pack()
+        self.gallery_canvas.yview_moveto(0)
+        self.gallery_page_label.config(text=f"Page {page + 1}/{self._gallery_page_count()} ({len(self.gallery_photos)} photos)")
+
+    def _open_gallery_preview(self, photo_files):
+        preview_path = find_preview(self.gallery_preview_cache, photo_files, GALLERY_VIEW_SIZE)
+        if preview_path is None:
+            return
+        window = tk.Toplevel(self.root)
+        window.title(os.path.basename(photo_files[0]))
+        with Image.open(preview_path) as img:
+            image = ImageTk.PhotoImage(img)
+        label = tk.Label(window, image=image)
+        label.image = image
+        label.pack()
 
     def _organization_complete_ui_update(self):
         self.start_button.config(state='normal', text="Start Photo Organization")
+        self.run_queue_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
         self.status_label.config(text="Status: Ready")
         self.organizer_thread = None
+        self.active_organizer = None
 
     def on_closing(self):
         if self.organizer_thread and self.organizer_thread.is_alive():
             if messagebox.askyesno("Exit", "Organization is in progress. Do you want to stop and exit?"):
-                self.log_message("Exiting while organization is in progress. Temporary files may be left behind.", level='warning')
+                self.log_message("Exiting while organization is in progress. Stopping after the current file or batch.", level='warning')
+                self.closing = True
+                self.cancel_requested = True
+                if self.active_organizer is not None:
+                    self.active_organizer.cancel()
+                self.job_queue.cancel()
+                self.organizer_thread.join(CANCEL_JOIN_TIMEOUT)
                 try:
                     import shutil
                     if os.path.exists(TEMP_RESIZE_FOLDER):
@@ -562,11 +1063,13 @@ class PhotoOrganizerApp:
                         self.log_message(f"Forced cleanup of temporary folder: {TEMP_RESIZE_FOLDER}", level='info')
                 except Exception as e:
                     self.log_message(f"Error during forced cleanup on exit: {e}", level='error')
+                self.log_pipeline.close()
                 self.root.quit()
                 self.root.destroy()
             else:
                 return
         else:
+            self.log_pipeline.close()
             self.root.quit()
             self.root.destroy()
 
@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image
+
+from tag_scoring import TagScorer
+
+
+DEFAULT_NUM_IMAGES = 200
+DEFAULT_IMAGE_SIZE = (1024, 768)
+STUB_TAGS = ["a photo of Blue Sky", "a photo of Building", "a photo of Flower", "a photo of Landscape",
+             "a photo of Nature", "a photo of Night", "a photo of People", "a photo of Street"]
+STUB_EMBEDDING_DIM = 512
+
+EXIF_IFD_POINTER = 0x8769
+EXIF_DATETIME = 0x0132
+EXIF_DATETIME_ORIGINAL = 0x9003
+
+
+def generate_corpus(root, num_images=DEFAULT_NUM_IMAGES, seed=0, image_size=DEFAULT_IMAGE_SIZE,
+                    raw_pair_ratio=0.3, depth=4, collision_ratio=0.1, duplicate_ratio=0.05,
+                    raw_size_bytes=256 * 1024):
+    """
+    Writes a synthetic photo library under root and returns a description of what was written:
+    JPEGs with EXIF capture dates spread over a deep folder tree, fake RAW/DNG files paired with
+    some of them, repeated file names (with identical capture times, so they collide at the
+    destination) and byte-identical duplicates.
+    """
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+
+    folders = [root]
+    for i in range(max(1, num_images // 50)):
+        parts = [f"dir_{i}_{level}" for level in range(rng.randint(1, depth))]
+        folders.append(os.path.join(root, *parts))
+
+    start_date = datetime(2021, 1, 1)
+    written = {"images": 0, "raw_pairs": 0, "collisions": 0, "duplicates": 0, "bytes": 0}
+    previous = []
+    for i in range(num_images):
+        folder = rng.choice(folders)
+        os.makedirs(folder, exist_ok=True)
+
+        if previous and rng.random() < duplicate_ratio:
+            source_path, _ = rng.choice(previous)
+            target = os.path.join(folder, f"DUP_{i:06d}.jpg")
+            shutil.copyfile(source_path, target)
+            written["duplicates"] += 1
+            written["bytes"] += os.path.getsize(target)
+            continue
+
+        if previous and rng.random() < collision_ratio:
+            # Same name and capture time as an earlier photo, in a different folder
+            earlier_path, capture_time = rng.choice(previous)
+            name = os.path.basename(earlier_path)
+            folder = next((f for f in folders if f != os.path.dirname(earlier_path)), folder)
+            os.makedirs(folder, exist_ok=True)
+            written["collisions"] += 1
+        else:
+            name = f"IMG_{i:06d}.jpg"
+            capture_time = start_date + timedelta(seconds=rng.randint(0, 3 * 365 * 24 * 3600))
+
+        path = os.path.join(folder, name)
+        _write_jpeg(path, rng, image_size, capture_time)
+        written["images"] += 1
+        written["bytes"] += os.path.getsize(path)
+        previous.append((path, capture_time))
+
+        if rng.random() < raw_pair_ratio:
+            raw_path = os.path.splitext(path)[0] + rng.choice((".dng", ".cr2", ".arw"))
+            with open(raw_path, 'wb') as f:
+                f.write(rng.randbytes(raw_size_bytes))
+            written["raw_pairs"] += 1
+            written["bytes"] += raw_size_bytes
+
+    return written
+
+
+def _write_jpeg(path, rng, image_size, capture_time):
+    # Smooth gradients with a little noise compress like real photos rather than like flat colour
+    width, height = image_size
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    colours = np.array([rng.random() for _ in range(6)], dtype=np.float32).reshape(2, 3)
+    pixels = (x * colours[0] + y * colours[1]) * 127.0
+    noise = np.random.default_rng(rng.getrandbits(32)).integers(0, 32, size=(height, width, 3))
+    image = Image.fromarray(np.clip(pixels + noise, 0, 255).astype(np.uint8))
+
+    exif = Image.Exif()
+    date_str = capture_time.strftime("%Y:%m:%d %H:%M:%S")
+    exif[EXIF_DATETIME] = date_str
+    exif.get_ifd(EXIF_IFD_POINTER)[EXIF_DATETIME_ORIGINAL] = date_str
+    image.save(path, quality=85, exif=exif)
+
+
+class StubTagger:
+    """
+    Drop-in replacement for ImageTagger that needs no model: tags and embeddings are derived
+    from a hash of the image path, with an optional fixed delay per image to simulate inference.
+    """
+    def __init__(self, latency_per_image=0.0, candidate_tags=STUB_TAGS):
+        self.latency_per_image = latency_per_image
+        self.candidate_tags = list(candidate_tags)
+        self.scorer = TagScorer(self.candidate_tags)
+
+    def _seed(self, image_path):
+        return int.from_bytes(hashlib.md5(os.path.basename(image_path).encode("utf-8")).digest()[:4], "little")
+
+    def tag_images_batch(self, image_paths, num_top_tags=5, return_embeddings=False, num_crops=1):
+        if self.latency_per_image:
+            time.sleep(self.latency_per_image * len(image_paths) * num_crops)
+
+        results = {}
+        embeddings = {}
+        for image_path in image_paths:
+            rng = np.random.default_rng(self._seed(image_path))
+            probs = rng.dirichlet(np.ones(len(self.candidate_tags)))[None, :]
+            top_indices, top_probs = self.scorer.top_k(probs, num_top_tags)
+            results[image_path] = [(self.candidate_tags[idx], float(prob)) for idx, prob in zip(top_indices[0], top_probs[0])]
+            if return_embeddings:
+                embedding = rng.standard_normal(STUB_EMBEDDING_DIM).astype(np.float32)
+                embeddings[image_path] = embedding / np.linalg.norm(embedding)
+
+        return (results, embeddings) if return_embeddings else results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(num_images=DEFAULT_NUM_IMAGES, repeat=3, seed=0, tagger="stub", stub_latency_ms=0.0,
+                  processing_mode="jpg_and_raw", work_folder=None, organizer_options=None, log=print):
+    """
+    Generates a fresh corpus for every repetition, organizes it, and returns the per-stage timings
+    of each run plus the median over runs.
+    """
+    from main_logic import PhotoOrganizer
+
+    if tagger == "stub":
+        image_tagger = StubTagger(latency_per_image=stub_latency_ms / 1000.0)
+    else:
+        from image_tagger import ImageTagger
+        image_tagger = ImageTagger()
+
+    runs = []
+    for run_index in range(repeat):
+        run_folder = tempfile.mkdtemp(prefix="photo_bench_", dir=work_folder)
+        try:
+            source = os.path.join(run_folder, "source")
+            destination = os.path.join(run_folder, "destination")
+
+            generate_start = time.perf_counter()
+            corpus = generate_corpus(source, num_images=num_images, seed=seed + run_index)
+            generate_seconds = time.perf_counter() - generate_start
+
+            organizer = PhotoOrganizer(source, destination, processing_mode=processing_mode,
+                                       image_tagger=image_tagger, log_callback=lambda message, level='info': None,
+                                       **(organizer_options or {}))
+            organizer.organize_photos()
+
+            snapshot = organizer.metrics.snapshot()
+            runs.append({
+                "corpus": corpus,
+                "generate_seconds": round(generate_seconds, 4),
+                "total_seconds": snapshot["total_seconds"],
+                "peak_rss_bytes": snapshot["peak_rss_bytes"],
+                "stages": snapshot["stages"],
+                "processed": organizer.processed_count,
+                "skipped": organizer.skipped_count,
+                "errors": organizer.error_count,
+            })
+            log(f"run {run_index + 1}/{repeat}: " + ", ".join(
+                f"{name} {data['seconds']:.3f}s" for name, data in snapshot["stages"].items()))
+        finally:
+            shutil.rmtree(run_folder, ignore_errors=True)
+
+    stage_names = []
+    for run in runs:
+        stage_names += [name for name in run["stages"] if name not in stage_names]
+    median = {
+        name: {
+            "seconds": float(np.median([run["stages"][name]["seconds"] for run in runs if name in run["stages"]])),
+            "items_per_sec": float(np.median([run["stages"][name]["items_per_sec"] for run in runs if name in run["stages"]])),
+        }
+        for name in stage_names
+    }
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"num_images": num_images, "repeat": repeat, "seed": seed, "tagger": tagger,
+                   "stub_latency_ms": stub_latency_ms, "processing_mode": processing_mode,
+                   "organizer_options": organizer_options or {}},
+        "median": median,
+        "runs": runs,
+    }
+
+
+def compare_results(baseline, current):
+    """Returns a text table of median stage times, baseline vs current."""
+    lines = [f"{'stage':<12} {'baseline s':>11} {'current s':>11} {'change':>8}"]
+    for name, data in current["median"].items():
+        old = baseline.get("median", {}).get(name)
+        if old and old["seconds"]:
+            change = (data["seconds"] - old["seconds"]) / old["seconds"] * 100
+            lines.append(f"{name:<12} {old['seconds']:>11.3f} {data['seconds']:>11.3f} {change:>+7.1f}%")
+        else:
+            lines.append(f"{name:<12} {'-':>11} {data['seconds']:>11.3f} {'':>8}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the scan, prepare, tag and move stages on a synthetic photo corpus.")
+    parser.add_argument("-n", "--num-images", type=int, default=DEFAULT_NUM_IMAGES)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tagger", choices=("stub", "clip"), default="stub",
+                        help="'stub' runs offline without a model; 'clip' loads the real CLIP model")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Simulated inference time per image for the stub tagger")
+    parser.add_argument("--mode", choices=("jpg_and_raw", "raw_only"), default="jpg_and_raw")
+    parser.add_argument("--work-folder", help="Where corpora are generated (defaults to the system temp folder)")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--generate-only", metavar="FOLDER", help="Only write a corpus to FOLDER and exit")
+    args = parser.parse_args(argv)
+
+    if args.generate_only:
+        corpus = generate_corpus(args.generate_only, num_images=args.num_images, seed=args.seed)
+        print(json.dumps(corpus, indent=2))
+        return 0
+
+    results = run_benchmark(num_images=args.num_images, repeat=args.repeat, seed=args.seed, tagger=args.tagger,
+                            stub_latency_ms=args.stub_latency_ms, processing_mode=args.mode,
+                            work_folder=args.work_folder)
+
+    for name, data in results["median"].items():
+        print(f"{name:<12} median {data['seconds']:.3f}s  ({data['items_per_sec']:.1f}/s)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to '{args.output}'")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print(compare_results(json.load(f), results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import numpy as np
+
+
+EVENT_GAP_HOURS = 6.0
+# Image-similarity splits need at least this much time between photos
+EVENT_MIN_SPLIT_GAP_MINUTES = 30.0
+EVENT_SIMILARITY_THRESHOLD = 0.75
+SIMILARITY_BLOCK_SIZE = 65536
+
+
+def cluster_events(timestamps, gap_seconds=EVENT_GAP_HOURS * 3600, embeddings=None,
+                   similarity_threshold=None, min_split_gap_seconds=EVENT_MIN_SPLIT_GAP_MINUTES * 60,
+                   embedding_rows=None):
+    """
+    Groups photos into events and returns an int64 event id per timestamp, numbered in time order.
+
+    Photos are sorted by capture time and a new event starts wherever the gap to the previous
+    photo exceeds gap_seconds. With embeddings (one normalized row per timestamp, NaN rows for
+    photos without one) and a similarity_threshold, an event is also split where consecutive
+    photos at least min_split_gap_seconds apart look dissimilar. embedding_rows maps each
+    timestamp to its row in embeddings (which may be a float16 memmap); only a block of rows is
+    converted at a time. O(n log n) for the sort, the rest is a single vectorized pass.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if not len(timestamps):
+        return np.empty(0, dtype=np.int64)
+
+    order = np.argsort(timestamps, kind="stable")
+    gaps = np.diff(timestamps[order])
+    boundaries = gaps > gap_seconds
+
+    if embeddings is not None and similarity_threshold is not None:
+        rows = order if embedding_rows is None else np.asarray(embedding_rows)[order]
+        similarities = np.empty(len(gaps), dtype=np.float32)
+        for start in range(0, len(gaps), SIMILARITY_BLOCK_SIZE):
+            block = np.asarray(embeddings[rows[start:start + SIMILARITY_BLOCK_SIZE + 1]], dtype=np.float32)
+            similarities[start:start + len(block) - 1] = np.einsum("ij,ij->i", block[1:], block[:-1])
+        # Comparisons with NaN are False, so photos without an embedding never cause a split
+        with np.errstate(invalid="ignore"):
+            boundaries |= (gaps > min_split_gap_seconds) & (similarities < similarity_threshold)
+
+    event_ids = np.empty(len(timestamps), dtype=np.int64)
+    event_ids[order[0]] = 0
+    event_ids[order[1:]] = np.cumsum(boundaries)
+    return event_ids
+
+
+def event_labels(timestamps, event_ids):
+    """
+    Folder-friendly name per event id: the start date ('2024-03-05'), with '_2', '_3', ... for
+    further events starting on the same day.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if not len(timestamps):
+        return []
+    starts = np.full(int(event_ids.max()) + 1, np.inf)
+    np.minimum.at(starts, event_ids, timestamps)
+
+    labels = []
+    per_day = {}
+    for start in starts:
+        day = datetime.fromtimestamp(start).strftime("%Y-%m-%d")
+        per_day[day] = per_day.get(day, 0) + 1
+        labels.append(day if per_day[day] == 1 else f"{day}_{per_day[day]}")
+    return labels
@@ -0,0 +1,157 @@
+import os
+import sys
+
+import numpy as np
+
+
+# Rough RAM cost of one in-memory FileEntry, used to turn a memory budget into an entry count
+BYTES_PER_FILE_ENTRY = 200
+SPILL_READ_SIZE = 1 << 20
+
+
+def allocate_array(shape, dtype, fill, spill_folder=None, name=None):
+    """np.full, or a zero-copy memory-mapped .npy file in spill_folder when one is given."""
+    if spill_folder is None:
+        return np.full(shape, fill, dtype=dtype)
+    array = np.lib.format.open_memmap(os.path.join(spill_folder, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+    array[...] = fill
+    return array
+
+
+class FileEntry:
+    """One scanned file. The folder string is interned, so files in the same folder share it."""
+    __slots__ = ("directory", "name")
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+
+    def path(self):
+        return os.path.join(self.directory, self.name)
+
+
+class FileList:
+    """
+    Scanned files in scan order, iterated as full paths.
+
+    The first max_in_memory entries are kept as FileEntry records; any further ones are appended
+    to a spill file in spill_folder (folder id + name, NUL-separated) and streamed back on
+    iteration, so memory stays flat however many files a library holds.
+    """
+    def __init__(self, max_in_memory=None, spill_folder=None):
+        self.max_in_memory = max_in_memory
+        self.spill_folder = spill_folder
+        self._entries = []
+        self._count = 0
+        self._directories = []
+        self._directory_ids = {}
+        self._spill_path = None
+        self._spill_file = None
+
+    def append(self, directory, name):
+        directory = sys.intern(directory)
+        if self._spill_file is None and (self.max_in_memory is None or len(self._entries) < self.max_in_memory):
+            self._entries.append(FileEntry(directory, name))
+        else:
+            if self._spill_file is None:
+                self._spill_path = os.path.join(self.spill_folder, "files.bin")
+                self._spill_file = open(self._spill_path, 'w', encoding='utf-8', errors='surrogateescape', newline='')
+            directory_id = self._directory_ids.get(directory)
+            if directory_id is None:
+                directory_id = self._directory_ids[directory] = len(self._directories)
+                self._directories.append(directory)
+            self._spill_file.write(f"{directory_id}\0{name}\0")
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def is_spilled(self):
+        return self._spill_path is not None
+
+    def __iter__(self):
+        for entry in self._entries:
+            yield entry.path()
+        if self._spill_path is None:
+            return
+        if self._spill_file is not None:
+            self._spill_file.flush()
+        with open(self._spill_path, 'r', encoding='utf-8', errors='surrogateescape', newline='') as f:
+            pending = ""
+            while True:
+                block = f.read(SPILL_READ_SIZE)
+                if not block:
+                    break
+                fields = (pending + block).split("\0")
+                # An odd number of complete fields means a record is split across blocks
+                complete = len(fields) - 1
+                complete -= complete % 2
+                for i in range(0, complete, 2):
+                    yield os.path.join(self._directories[int(fields[i])], fields[i + 1])
+                pending = "\0".join(fields[complete:])
+
+    def chunks(self, size):
+        """Yields (index of first file, [paths]) for consecutive runs of at most size files."""
+        chunk = []
+        start = 0
+        for index, path in enumerate(self):
+            if not chunk:
+                start = index
+            chunk.append(path)
+            if len(chunk) >= size:
+                yield start, chunk
+                chunk = []
+        if chunk:
+            yield start, chunk
+
+    def close(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+
+class TagTable:
+    """Top tags per file as int32 tag indices and float16 probabilities, indexed by scan position."""
+
+    def __init__(self, num_files, candidate_tags, num_top_tags, spill_folder=None):
+        self.candidate_tags = candidate_tags
+        self._tag_index = {tag: i for i, tag in enumerate(candidate_tags)}
+        shape = (max(num_files, 1), max(num_top_tags, 1))
+        self.indices = allocate_array(shape, np.int32, -1, spill_folder, "tag_indices")
+        self.probs = allocate_array(shape, np.float16, 0, spill_folder, "tag_probs")
+
+    def set(self, row, tags_with_probs):
+        tags_with_probs = tags_with_probs[:self.indices.shape[1]]
+        for column, (tag, prob) in enumerate(tags_with_probs):
+            self.indices[row, column] = self._tag_index[tag]
+            self.probs[row, column] = prob
+
+    def get(self, row):
+        """[(tag, probability), ...] for a file, or None if it was never tagged."""
+        indices = self.indices[row]
+        if indices[0] < 0:
+            return None
+        probs = self.probs[row]
+        return [(self.candidate_tags[idx], float(prob)) for idx, prob in zip(indices.tolist(), probs.tolist()) if idx >= 0]
+
+
+class EmbeddingTable:
+    """Normalized image embeddings per file as float16 rows (NaN for files without one)."""
+
+    def __init__(self, num_files, spill_folder=None):
+        self.num_files = max(num_files, 1)
+        self.spill_folder = spill_folder
+        self.embeddings = None
+
+    def set(self, row, embedding):
+        if self.embeddings is None:
+            # The dimension is only known once the tagger returns the first embedding
+            self.embeddings = allocate_array((self.num_files, len(embedding)), np.float16, np.nan,
+                                             self.spill_folder, "embeddings")
+        self.embeddings[row] = embedding
+
+    def get(self, row):
+        if self.embeddings is None:
+            return None
+        embedding = self.embeddings[row].astype(np.float32)
+        return None if np.isnan(embedding[0]) else embedding
@@ -1,16 +1,105 @@
-import torch
-from transformers import CLIPProcessor, CLIPModel
 from PIL import Image
 import os
+import threading
+import numpy as np
 import re # Make sure re is imported if you're using it in candidate_tags for cleaning
 
+from metrics import timed_import
+from tag_scoring import TagScorer, load_tag_scoring_config, TAG_SCORING_FILE
+from tag_bank import TagEmbeddingBank, load_vocabulary_file, TAG_BANK_FOLDER
+
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+
+# torch and transformers take seconds to import, so they are loaded by the first ImageTagger
+# rather than with this module; that keeps the GUI and CLIs that never tag quick to start
+torch = None
+CLIPModel = None
+CLIPProcessor = None
+_model_import_lock = threading.Lock()
+
+
+def import_model_libraries():
+    global torch, CLIPModel, CLIPProcessor
+    with _model_import_lock:
+        if torch is not None:
+            return
+        with timed_import("torch"):
+            import torch as torch_module
+        with timed_import("transformers"):
+            from transformers import CLIPModel as model_class, CLIPProcessor as processor_class
+        CLIPModel, CLIPProcessor = model_class, processor_class
+        torch = torch_module
+
+
+def load_images(image_paths):
+    """Opens images as RGB, skipping unreadable files. Returns (images, paths_that_opened)."""
+    images = []
+    original_paths = []
+    for img_path in image_paths:
+        try:
+            with Image.open(img_path) as img:
+                images.append(img.convert("RGB"))
+            original_paths.append(img_path)
+        except Exception:
+            continue
+    return images, original_paths
+
+
+def square_crops(image, num_crops):
+    # Evenly spaced squares along the long axis; the first and last touch the image edges
+    width, height = image.size
+    side = min(width, height)
+    span = max(width, height) - side
+    crops = []
+    for i in range(num_crops):
+        offset = round(span * i / (num_crops - 1)) if num_crops > 1 else span // 2
+        box = (offset, 0, offset + side, side) if width >= height else (0, offset, side, offset + side)
+        crops.append(image.crop(box))
+    return crops
+
+
+def preprocess_image_paths(processor, image_paths, num_crops=1):
+    """
+    Loads and CLIP-preprocesses images (num_crops rows per image).
+    Returns (paths_that_opened, pixel_values) with pixel_values a float32 numpy array, or (paths, None).
+    """
+    images, original_paths = load_images(image_paths)
+    if not images:
+        return original_paths, None
+    if num_crops > 1:
+        images = [crop for image in images for crop in square_crops(image, num_crops)]
+    return original_paths, processor(images=images, return_tensors="np", padding=True).pixel_values.astype(np.float32)
+
+
+def format_tag_results(candidate_tags, original_paths, top_indices, top_probs, embeds, num_crops=1, return_embeddings=False):
+    """Turns scorer output into tag_images_batch's return value."""
+    results = {}
+    for i, original_path in enumerate(original_paths):
+        # Store the raw tag (e.g., "a photo of a landscape")
+        # The cleaning (removing "a photo of a ") should happen when constructing the filename
+        results[original_path] = [
+            (candidate_tags[idx], float(prob))
+            for idx, prob in zip(top_indices[i], top_probs[i])
+        ]
+
+    if not return_embeddings:
+        return results
+    if num_crops > 1 and embeds.shape[0] != len(original_paths):
+        embeds = embeds.reshape(len(original_paths), num_crops, -1).mean(axis=1)
+        embeds /= np.linalg.norm(embeds, axis=1, keepdims=True)
+    return results, {path: embeds[i] for i, path in enumerate(original_paths)}
+
+
 class ImageTagger:
-    def __init__(self, custom_tags=None):
+    def __init__(self, custom_tags=None, scoring_mode=None, tag_scoring_file=TAG_SCORING_FILE,
+                 vocabulary_file=None, tag_bank_folder=TAG_BANK_FOLDER, log_callback=None):
+        import_model_libraries()
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
-        self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(self.device)
+        self.model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).to(self.device)
         self.model.eval()
-        self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+        self.processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
 
         # Define candidate tags with full sentences/descriptive phrases
         self.base_candidate_tags = [
@@ -19,67 +108,96 @@ class ImageTagger:
         ]
 
         all_tags = self.base_candidate_tags + (custom_tags if custom_tags is not None else [])
+        if vocabulary_file:
+            all_tags += load_vocabulary_file(vocabulary_file)
         self.candidate_tags = sorted(list(set(all_tags)))
 
-        self.text_inputs = self.processor(
-            text=self.candidate_tags,
+        # Text embeddings never change for a given tag list, so they are encoded once in chunks and cached on disk
+        self.tag_bank = TagEmbeddingBank.load_or_build(
+            self.candidate_tags, self.encode_text, CLIP_MODEL_NAME,
+            cache_folder=tag_bank_folder, log=log_callback)
+        self.logit_scale = self.model.logit_scale.exp().item()
+
+        # scoring_mode overrides the mode from the config file; groups and calibration still apply
+        self.scorer = TagScorer.from_config(self.candidate_tags, load_tag_scoring_config(tag_scoring_file), mode=scoring_mode)
+
+    def _encode_text_tensor(self, texts):
+        text_inputs = self.processor(
+            text=texts,
             return_tensors="pt",
             padding=True,
             truncation=True
         ).to(self.device)
+        with torch.no_grad():
+            text_embeds = self.model.get_text_features(**text_inputs)
+        return text_embeds / text_embeds.norm(dim=-1, keepdim=True)
 
-    def tag_images_batch(self, image_paths, num_top_tags=5):
-        """
-        Tags a batch of images and returns a dictionary of {image_path: [(tag, probability), ...]}.
-        """
-        if not image_paths:
-            return {}
+    def _encode_image_tensor(self, images):
+        pixel_values = self.processor(images=images, return_tensors="pt", padding=True).pixel_values
+        return self._encode_pixel_tensor(pixel_values)
 
-        images = []
-        original_paths = []
+    def _encode_pixel_tensor(self, pixel_values):
+        with torch.no_grad():
+            image_embeds = self.model.get_image_features(pixel_values=pixel_values.to(self.device))
+        return image_embeds / image_embeds.norm(dim=-1, keepdim=True)
 
-        for img_path in image_paths:
-            try:
-                # Open each image file
-                img = Image.open(img_path).convert("RGB")
-                images.append(img)
-                original_paths.append(img_path) # Keep track of its original path
-            except Exception:
-                continue
+    def _load_images(self, image_paths):
+        return load_images(image_paths)
 
-        if not images:
-            return {}
-        # Preprocess Images with CLIP Processor
-        # 'return_tensors="pt"' ensures the output is PyTorch tensors.
-        image_inputs = self.processor(images=images, return_tensors="pt", padding=True)
-        pixel_values = image_inputs.pixel_values.to(self.device)
+    def encode_text(self, texts):
+        """
+        Returns L2-normalized CLIP text embeddings for a list of strings as a float32 numpy array.
+        """
+        return self._encode_text_tensor(list(texts)).cpu().numpy().astype("float32")
 
-        # perform CLIP Model
-        with torch.no_grad():
-            outputs = self.model(pixel_values=pixel_values, **self.text_inputs)
+    def embed_images(self, image_paths):
+        """
+        Returns (paths, embeddings) for the images that could be opened; embeddings are
+        L2-normalized float32 rows in the same order as paths.
+        """
+        images, original_paths = self._load_images(image_paths)
+        if not images:
+            return [], None
+        return original_paths, self._encode_image_tensor(images).cpu().numpy().astype("float32")
 
-        # 'outputs.logits_per_image' contains the raw similarity scores between each image and each text tag
-        logits_per_image = outputs.logits_per_image
+    def score_pixel_values(self, pixel_values, num_top_tags=5, num_crops=1):
+        """
+        Runs the model on already-preprocessed pixel values (num_crops consecutive rows per image).
+        Returns (top_indices, top_probs, embeddings) as numpy arrays: one row per image for the tags,
+        one row per crop for the embeddings.
+        """
+        embeds_np = self._encode_pixel_tensor(torch.from_numpy(pixel_values)).cpu().numpy().astype("float32")
 
-        # Apply softmax to convert raw similarity scores into probabilities
-        probs = logits_per_image.softmax(dim=1).cpu().numpy()
+        # Score against the tag bank block by block and extract Top Tags for the whole batch at once
+        top_indices, top_probs = self.scorer.score_blocked(embeds_np, self.tag_bank.embeddings, self.logit_scale,
+                                                           num_top_tags, crops_per_image=num_crops)
+        return top_indices, top_probs, embeds_np
 
-        # extract Top Tags
-        results = {}
-        for i, original_path in enumerate(original_paths):
-            image_probs = probs[i]
-            top_indices = image_probs.argsort()[-num_top_tags:][::-1]
+    def tag_images_batch(self, image_paths, num_top_tags=5, return_embeddings=False, num_crops=1):
+        """
+        Tags a batch of images and returns a dictionary of {image_path: [(tag, probability), ...]}.
+        With return_embeddings=True a second dictionary of {image_path: embedding} is returned as well.
+        With num_crops > 1 every image is scored as that many square crops along its long axis (all crops
+        in one forward pass); each tag keeps its best crop probability and embeddings are averaged.
+        """
+        original_paths, pixel_values = preprocess_image_paths(self.processor, image_paths, num_crops)
+        if pixel_values is None:
+            return ({}, {}) if return_embeddings else {}
 
-            # Store the raw tag (e.g., "a photo of a landscape")
-            # The cleaning (removing "a photo of a ") should happen when constructing the filename
-            top_tags_with_probs = [
-                (self.candidate_tags[idx], image_probs[idx])
-                for idx in top_indices
-            ]
+        top_indices, top_probs, embeds_np = self.score_pixel_values(pixel_values, num_top_tags, num_crops)
+        return format_tag_results(self.candidate_tags, original_paths, top_indices, top_probs, embeds_np,
+                                  num_crops, return_embeddings)
 
-            results[original_path] = top_tags_with_probs
-        
-        return results
+    def tag_batches(self, batches, num_top_tags=5, return_embeddings=False, num_crops=1):
+        """
+        Yields (batch, tag_images_batch result) for each batch of image paths, in order.
+        A batch that fails yields its exception in place of the result so the others still run.
+        """
+        for batch in batches:
+            try:
+                yield batch, self.tag_images_batch(batch, num_top_tags, return_embeddings, num_crops)
+            except Exception as e:
+                yield batch, e
     
     # for a single image (kept for consistency, but batch is preferred for efficiency)
     def tag_image(self, image_path, num_top_tags=5):
@@ -88,20 +206,12 @@ class ImageTagger:
         except Exception:
             return []
 
-        image_inputs = self.processor(images=image, return_tensors="pt", padding=True)
-        pixel_values = image_inputs.pixel_values.to(self.device)
-
-        with torch.no_grad():
-            outputs = self.model(pixel_values=pixel_values, **self.text_inputs)
-
-        logits_per_image = outputs.logits_per_image
-
-        probs = logits_per_image.softmax(dim=1)
-        top_indices = probs.argsort(dim=-1, descending=True)[0, :num_top_tags]
+        image_embeds = self._encode_image_tensor([image]).cpu().numpy().astype("float32")
+        top_indices, top_probs = self.scorer.score_blocked(image_embeds, self.tag_bank.embeddings, self.logit_scale, num_top_tags)
         
         top_tags_with_probs = [
-            (self.candidate_tags[idx], probs[0, idx].item())
-            for idx in top_indices
+            (self.candidate_tags[idx], float(prob))
+            for idx, prob in zip(top_indices[0], top_probs[0])
         ]
         
         return top_tags_with_probs
\ No newline at end of file
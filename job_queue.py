@@ -0,0 +1,196 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from main_logic import PhotoOrganizer, TEMP_RESIZE_FOLDER
+from image_tagger import ImageTagger
+from utils import print_log
+
+
+def tagger_options_for(options):
+    """The PhotoOrganizer options of a job that shape its ImageTagger, in JobQueue tagger_options form."""
+    return {
+        "custom_tags": options.get("custom_tags"),
+        "scoring_mode": options.get("scoring_mode"),
+        "vocabulary_file": options.get("tag_vocabulary_file"),
+        "tagging_workers": options.get("tagging_workers"),
+    }
+
+
+class OrganizeJob:
+    """One source folder to organize into one destination, with PhotoOrganizer keyword options."""
+    _next_id = 1
+
+    def __init__(self, source_folder, destination_base_folder, options=None):
+        self.job_id = OrganizeJob._next_id
+        OrganizeJob._next_id += 1
+        self.source_folder = source_folder
+        self.destination_base_folder = destination_base_folder
+        self.options = dict(options or {})
+        self.status = "queued"
+        self.organizer = None
+        self.success = None
+
+    def describe(self):
+        return f"#{self.job_id} [{self.status}] {self.source_folder} -> {self.destination_base_folder}"
+
+
+class JobQueue:
+    """
+    Runs queued jobs with one shared, already-loaded ImageTagger. A job whose tag settings
+    (tags, scoring, vocabulary, workers) differ from the loaded tagger's gets a new tagger.
+
+    Jobs are analyzed (scan, prepare, tag) one after another on the calling thread, while the
+    moves of finished analyses run on a single I/O thread. Moving job N therefore overlaps with
+    inference for job N+1, and a batch of imports takes roughly as long as the slower of the
+    two kinds of work rather than their sum. Moves stay serialized, so jobs that share a
+    destination never race on filename conflicts or the search index.
+    """
+    def __init__(self, tagger_options=None, log_callback=None, image_tagger=None):
+        self.tagger_options = dict(tagger_options or {})
+        self.log_callback = log_callback if log_callback else print_log
+        self.image_tagger = image_tagger
+        self._owns_tagger = False
+        self.jobs = []
+        self.analyzing_job = None
+        self.moving_job = None
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+
+    def add(self, job):
+        with self._lock:
+            self.jobs.append(job)
+        return job
+
+    def remove(self, job):
+        with self._lock:
+            if job.status == "queued":
+                self.jobs.remove(job)
+
+    def clear_finished(self):
+        with self._lock:
+            self.jobs = [job for job in self.jobs if job.status == "queued"]
+
+    def pending_jobs(self):
+        with self._lock:
+            return [job for job in self.jobs if job.status == "queued"]
+
+    def set_tagger_options(self, tagger_options):
+        """Keeps the warm tagger unless the options that shape it (tags, scoring, vocabulary, workers) changed."""
+        tagger_options = dict(tagger_options)
+        if tagger_options != self.tagger_options:
+            self.tagger_options = tagger_options
+            self._release_tagger()
+
+    def current_organizer(self):
+        """The organizer whose progress is most interesting right now: the one analyzing, else the one moving."""
+        job = self.analyzing_job or self.moving_job
+        return job.organizer if job is not None else None
+
+    def cancel(self):
+        self._cancel_event.set()
+        for job in (self.analyzing_job, self.moving_job):
+            if job is not None and job.organizer is not None:
+                job.organizer.cancel()
+
+    def _job_logger(self, job):
+        return lambda message, level='info': self.log_callback(f"[job {job.job_id}] {message}", level)
+
+    def run(self):
+        """Runs every queued job. Returns True if all of them completed without errors."""
+        self._cancel_event.clear()
+        jobs = self.pending_jobs()
+        if not jobs:
+            return True
+
+        move_futures = []
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-moves") as move_executor:
+            for job in jobs:
+                if self._cancel_event.is_set():
+                    job.status = "cancelled"
+                    continue
+
+                self._use_tagger_for(job)
+                job.status = "analyzing"
+                self.analyzing_job = job
+                try:
+                    self._load_tagger()
+                    # Built in here so a bad option (e.g. an unknown layout field) fails only this job
+                    job.organizer = PhotoOrganizer(
+                        job.source_folder, job.destination_base_folder,
+                        image_tagger=self.image_tagger,
+                        log_callback=self._job_logger(job),
+                        # Analysis of this job can overlap with moves of the previous one
+                        temp_folder=f"{TEMP_RESIZE_FOLDER}_job{job.job_id}",
+                        **job.options)
+                    if self._cancel_event.is_set():
+                        job.organizer.cancel()
+                    files_to_move = job.organizer.analyze_source()
+                except Exception as e:
+                    self.log_callback(f"[job {job.job_id}] Unhandled error during analysis: {e}", 'error')
+                    files_to_move = None
+                finally:
+                    self.analyzing_job = None
+
+                if files_to_move is None:
+                    job.status = "cancelled" if job.organizer is not None and job.organizer.cancelled else "failed"
+                    job.success = False
+                elif not files_to_move:
+                    job.status = "done"
+                    job.success = True
+                else:
+                    job.status = "waiting to move"
+                    move_futures.append(move_executor.submit(self._move_job, job, files_to_move))
+
+        for future in move_futures:
+            future.result()
+        if self.tagger_options.get("tagging_workers"):
+            # Worker pools hold connections and shared memory, and are cheap to reconnect
+            self._release_tagger()
+        return all(job.success for job in jobs)
+
+    def _use_tagger_for(self, job):
+        job_tagger_options = tagger_options_for(job.options)
+        if self.image_tagger is not None and not self.tagger_options:
+            # A tagger handed over without its options is taken to match the first job
+            self.tagger_options = job_tagger_options
+        elif job_tagger_options != self.tagger_options:
+            if self.image_tagger is not None:
+                self.log_callback(f"[job {job.job_id}] Uses different tag settings than the previous job; loading a tagger for it.", 'info')
+            self.set_tagger_options(job_tagger_options)
+
+    def _load_tagger(self):
+        if self.image_tagger is not None:
+            return
+        tagger_options = dict(self.tagger_options)
+        tagging_workers = tagger_options.pop("tagging_workers", None)
+        if tagging_workers:
+            from tagging_service import RemoteTaggerPool
+            self.image_tagger = RemoteTaggerPool(tagging_workers, log_callback=self.log_callback)
+        else:
+            self.log_callback("Loading the shared image tagger...", 'info')
+            self.image_tagger = ImageTagger(log_callback=self.log_callback, **tagger_options)
+        self._owns_tagger = True
+
+    def _release_tagger(self):
+        # Only a worker pool this queue created is closed; a tagger handed over belongs to the caller
+        if self._owns_tagger and hasattr(self.image_tagger, "close"):
+            self.image_tagger.close()
+        self.image_tagger = None
+        self._owns_tagger = False
+
+    def _move_job(self, job, files_to_move):
+        self.moving_job = job
+        job.status = "moving"
+        if self._cancel_event.is_set():
+            job.organizer.cancel()
+        try:
+            job.success = job.organizer.move_analyzed_files(files_to_move)
+        except Exception as e:
+            self.log_callback(f"[job {job.job_id}] Unhandled error while moving files: {e}", 'error')
+            job.success = False
+        finally:
+            self.moving_job = None
+        if job.organizer.cancelled:
+            job.status = "cancelled"
+        else:
+            job.status = "done" if job.success else "finished with errors"
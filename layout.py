@@ -0,0 +1,164 @@
+import os
+import re
+import string
+from datetime import datetime
+from functools import lru_cache
+
+from utils import sanitize_filename, get_camera_model
+
+
+DEFAULT_FOLDER_LAYOUT = "{year}/{month}-{month_name}"
+DEFAULT_FILENAME_LAYOUT = "{prefix}{sep}{datetime}{sep}{tags}"
+UNKNOWN_CAMERA = "Unknown_Camera"
+
+LAYOUT_FIELDS = {
+    "year": "4-digit year, e.g. 2024",
+    "month": "2-digit month, e.g. 03",
+    "month_name": "Month name, e.g. March",
+    "day": "2-digit day of the month",
+    "date": "YYYY-MM-DD",
+    "time": "HHMMSS",
+    "datetime": "YYYYMMDD_HHMMSS",
+    "camera": "Camera model from EXIF",
+    "tag": "Best tag",
+    "tags": "All kept tags, joined with the tag delimiter",
+    "event": "Event the photo belongs to",
+    "counter": "Running number within the destination folder (filename only), e.g. {counter:04d}",
+    "prefix": "Custom prefix",
+    "original": "Original file name without extension",
+    "sep": "Tag delimiter",
+}
+
+# Fixed-format fields, so a {counter} next to them is not confused with their digits
+_FIELD_PATTERNS = {
+    "year": r"\d{4}", "month": r"\d{2}", "month_name": r"[A-Za-z]+", "day": r"\d{2}",
+    "date": r"\d{4}-\d{2}-\d{2}", "time": r"\d{6}", "datetime": r"\d{8}_\d{6}",
+}
+
+MONTH_NAMES = [datetime(2000, month, 1).strftime("%B") for month in range(1, 13)]
+
+_PHOTO_OF_PREFIX = re.compile(r"^a photo of (a |an |the )?", re.IGNORECASE)
+_TAG_UNSAFE_CHARS = re.compile(r'[^a-zA-Z0-9\s._-]+')
+_WHITESPACE_RUN = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=None)
+def clean_tag(tag_full_phrase):
+    """'a photo of a Blue Sky!' -> 'Blue Sky'. Cached: there are only as many distinct tags as candidate tags."""
+    cleaned = _PHOTO_OF_PREFIX.sub("", tag_full_phrase).strip()
+    cleaned = _TAG_UNSAFE_CHARS.sub("", cleaned)
+    return _WHITESPACE_RUN.sub(" ", cleaned).strip()
+
+
+class LayoutTemplate:
+    """A str.format-style template, validated once; render() is a single format_map call."""
+
+    def __init__(self, template, allowed_fields=LAYOUT_FIELDS):
+        self.template = template
+        fields = set()
+        for _, field_name, _, _ in string.Formatter().parse(template):
+            if field_name is None:
+                continue
+            if field_name not in allowed_fields:
+                raise ValueError(f"Unknown layout field '{{{field_name}}}' in '{template}'. "
+                                 f"Available: {', '.join('{' + name + '}' for name in allowed_fields)}")
+            fields.add(field_name)
+        self.fields = frozenset(fields)
+
+        # Catches bad format specs such as '{counter:x4}' up front rather than on the first photo
+        try:
+            self.render({name: 1 if name == "counter" else "" for name in allowed_fields})
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid layout template '{template}': {e}") from None
+
+    def render(self, values):
+        return self.template.format_map(values)
+
+    def counter_pattern(self):
+        """
+        Regex matching base names this template renders, with the first {counter} as group 1.
+        Date fields match any date and free-text fields match anything, so names made for other
+        photos still match.
+        """
+        pattern = []
+        counter_seen = False
+        for literal_text, field_name, _, _ in string.Formatter().parse(self.template):
+            # Whitespace in literal text becomes '_' in file names, like sanitize_filename() does
+            pattern.append(r'_+'.join(re.escape(part) for part in re.split(r'\s+', literal_text)))
+            if field_name == "counter":
+                pattern.append(r'\d+' if counter_seen else r'(\d+)')
+                counter_seen = True
+            elif field_name is not None:
+                pattern.append(_FIELD_PATTERNS.get(field_name, r'.*?'))
+        return re.compile("".join(pattern))
+
+
+class DestinationLayout:
+    """
+    Builds the destination folder and file name of each photo from a folder template
+    (path components separated by '/') and a filename template. With base_folder set,
+    {counter} continues after the highest number already used in each destination folder.
+    """
+    def __init__(self, folder_template=DEFAULT_FOLDER_LAYOUT, filename_template=DEFAULT_FILENAME_LAYOUT,
+                 tag_delimiter=",", file_id_prefix="", base_folder=None):
+        self.folder = LayoutTemplate(folder_template, {name: desc for name, desc in LAYOUT_FIELDS.items() if name != "counter"})
+        self.filename = LayoutTemplate(filename_template)
+        self.fields = self.folder.fields | self.filename.fields
+        self.tag_delimiter = tag_delimiter
+        self.file_id_prefix = sanitize_filename(file_id_prefix)
+        self._repeated_delimiter = re.compile(r'(?:' + re.escape(tag_delimiter) + r')+') if tag_delimiter else None
+        self.base_folder = base_folder
+        self._counters = {}
+        self._counter_pattern = self.filename.counter_pattern() if "counter" in self.filename.fields else None
+
+    def _values(self, file_path, date_obj, tags_with_probs, event):
+        cleaned_tags = [tag for tag in (clean_tag(tag) for tag, _ in tags_with_probs) if tag]
+        year, month, day = f"{date_obj.year:04d}", f"{date_obj.month:02d}", f"{date_obj.day:02d}"
+        time_str = f"{date_obj.hour:02d}{date_obj.minute:02d}{date_obj.second:02d}"
+        values = {
+            "year": year, "month": month, "month_name": MONTH_NAMES[date_obj.month - 1], "day": day,
+            "date": f"{year}-{month}-{day}", "time": time_str, "datetime": f"{year}{month}{day}_{time_str}",
+            "tag": cleaned_tags[0] if cleaned_tags else "",
+            "tags": self.tag_delimiter.join(cleaned_tags),
+            "event": event if event is not None else "",
+            "prefix": self.file_id_prefix,
+            "original": os.path.splitext(os.path.basename(file_path))[0],
+            "sep": self.tag_delimiter,
+        }
+        # Only read EXIF again when a template actually asks for the camera
+        if "camera" in self.fields:
+            values["camera"] = get_camera_model(file_path) or UNKNOWN_CAMERA
+        return values
+
+    def build(self, file_path, date_obj, tags_with_probs, event=None):
+        """Returns (relative destination folder, new file name) for one photo."""
+        values = self._values(file_path, date_obj, tags_with_probs, event)
+
+        folder_parts = [sanitize_filename(part) for part in self.folder.render(values).replace("\\", "/").split("/")]
+        relative_folder = os.path.join(*[part for part in folder_parts if part.strip(".")] or [""])
+
+        if "counter" in self.filename.fields:
+            if relative_folder not in self._counters:
+                self._counters[relative_folder] = self._last_counter_in(relative_folder)
+            values["counter"] = self._counters[relative_folder] = self._counters[relative_folder] + 1
+
+        new_base_name = sanitize_filename(self.filename.render(values), allowed_delimiter_chars=self.tag_delimiter)
+        if self._repeated_delimiter is not None:
+            new_base_name = self._repeated_delimiter.sub(self.tag_delimiter, new_base_name).strip(self.tag_delimiter)
+        extension = os.path.splitext(file_path)[1].lower()
+        return relative_folder, (new_base_name or "untitled") + extension
+
+    def _last_counter_in(self, relative_folder):
+        """Highest counter in the names of files already in a destination folder, or 0."""
+        if self.base_folder is None:
+            return 0
+        try:
+            names = os.listdir(os.path.join(self.base_folder, relative_folder))
+        except OSError:
+            return 0
+        last = 0
+        for name in names:
+            match = self._counter_pattern.fullmatch(os.path.splitext(name)[0])
+            if match:
+                last = max(last, int(match.group(1)))
+        return last
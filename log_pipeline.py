@@ -0,0 +1,121 @@
+import time
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+
+
+LOG_FILE = "photo_organizer.log"
+VISIBLE_LOG_LINES = 2000
+
+# Most events per second shown in the GUI for each level; None means never sampled.
+# Everything is still written to the full log file.
+DISPLAY_RATE_LIMITS = {
+    'debug': 20,
+    'info': 50,
+    'success': None,
+    'warning': 100,
+    'error': None,
+}
+
+
+class LogEvent:
+    __slots__ = ("timestamp", "level", "message")
+
+    def __init__(self, timestamp, level, message):
+        self.timestamp = timestamp
+        self.level = level
+        self.message = message
+
+    def format(self):
+        return f"{datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S')} [{self.level.upper()}] {self.message}"
+
+
+class LogPipeline:
+    """
+    Structured log stream between the worker thread and the GUI.
+
+    emit() is cheap and thread-safe. Events beyond a level's per-second display limit are
+    counted and reported as one summary line instead of being shown individually, and only
+    the newest `ring_size` events wait for display, so the GUI does a bounded amount of work
+    per tick however fast the worker logs. Every event is also appended to `log_file_path`
+    by a background writer thread.
+    """
+    def __init__(self, ring_size=VISIBLE_LOG_LINES, rate_limits=None, log_file_path=LOG_FILE):
+        self.ring_size = ring_size
+        self.rate_limits = dict(DISPLAY_RATE_LIMITS if rate_limits is None else rate_limits)
+        self.log_file_path = log_file_path
+
+        self._lock = threading.Lock()
+        self._display = deque(maxlen=ring_size)
+        self._window_start = time.monotonic()
+        self._window_counts = {}
+        self._suppressed = {}
+
+        self._file_queue = queue.SimpleQueue()
+        self._writer = None
+        if log_file_path:
+            self._writer = threading.Thread(target=self._write_log_file, name="log-writer", daemon=True)
+            self._writer.start()
+
+    def emit(self, message, level='info'):
+        event = LogEvent(time.time(), level, message)
+        if self._writer is not None:
+            self._file_queue.put(event)
+
+        with self._lock:
+            self._roll_window()
+            limit = self.rate_limits.get(level)
+            count = self._window_counts.get(level, 0)
+            if limit is not None and count >= limit:
+                self._suppressed[level] = self._suppressed.get(level, 0) + 1
+                return
+            self._window_counts[level] = count + 1
+            self._display.append(event)
+
+    def _roll_window(self):
+        now = time.monotonic()
+        if now - self._window_start < 1.0:
+            return
+        for level, count in self._suppressed.items():
+            summary = f"... {count} more {level} messages not shown"
+            if self.log_file_path:
+                summary += f" (full log: {self.log_file_path})"
+            self._display.append(LogEvent(time.time(), level, summary))
+        self._suppressed = {}
+        self._window_counts = {}
+        self._window_start = now
+
+    def drain(self, max_events=None):
+        """Removes and returns up to max_events events waiting for display, oldest first."""
+        with self._lock:
+            self._roll_window()
+            count = len(self._display) if max_events is None else min(max_events, len(self._display))
+            return [self._display.popleft() for _ in range(count)]
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._display)
+
+    def _write_log_file(self):
+        with open(self.log_file_path, 'a', encoding='utf-8') as f:
+            while True:
+                event = self._file_queue.get()
+                if event is None:
+                    break
+                f.write(event.format() + "\n")
+                # Write out everything already queued before flushing once
+                while True:
+                    try:
+                        event = self._file_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if event is None:
+                        return
+                    f.write(event.format() + "\n")
+                f.flush()
+
+    def close(self, timeout=2.0):
+        if self._writer is not None and self._writer.is_alive():
+            self._file_queue.put(None)
+            self._writer.join(timeout)
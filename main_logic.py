@@ -1,12 +1,22 @@
 import os
 import shutil
+import tempfile
 from datetime import datetime
-from PIL import Image
-import re
-import rawpy
+from PIL import Image, ImageOps
+import time
+import threading
+import numpy as np
 
 from image_tagger import ImageTagger
-from utils import get_image_date, sanitize_filename, find_paired_file, is_image_file, is_raw_file, is_jpg_file, IMAGE_EXTENSIONS, RAW_EXTENSIONS
+from photo_search import PhotoSearchIndex
+from metrics import PipelineMetrics, timed_import
+from layout import DestinationLayout, DEFAULT_FOLDER_LAYOUT, DEFAULT_FILENAME_LAYOUT
+from events import cluster_events, event_labels, EVENT_GAP_HOURS
+from metadata import MetadataWriter, sidecar_path
+from transfer import FileTransferPool, TRANSFER_MODES, DEFAULT_IO_CONCURRENCY, CHECKSUM_MANIFEST
+from preview_cache import PreviewCache, preview_key, PREVIEW_FOLDER_NAME
+from file_store import FileList, TagTable, EmbeddingTable, allocate_array, BYTES_PER_FILE_ENTRY
+from utils import print_log, get_image_date, sanitize_filename, find_paired_file, is_image_file, is_raw_file, is_jpg_file, IMAGE_EXTENSIONS, RAW_EXTENSIONS
 
 
 TEMP_RESIZE_FOLDER = "temp_resized_images"
@@ -14,6 +24,24 @@ TARGET_RESIZE_DIM = 224
 NUM_TOP_TAGS = 5
 TAG_CONFIDENCE_THRESHOLD = 0.05
 BATCH_SIZE = 10
+MULTI_CROP_COUNT = 3
+# Files prepared and tagged per round when a memory budget is set
+PREPARE_CHUNK_SIZE = 1000
+SEARCH_INDEX_FLUSH_INTERVAL = 1000
+
+
+def import_rawpy():
+    """rawpy, imported on first use since only raw_only mode needs it; None if it is not installed."""
+    try:
+        with timed_import("rawpy"):
+            import rawpy
+        return rawpy
+    except ImportError:
+        return None
+
+
+class OrganizationCancelled(Exception):
+    """Raised inside the pipeline when cancel() was requested; caught by organize_photos."""
 
 class PhotoOrganizer:
     def __init__(self, source_folder, destination_base_folder,
@@ -21,7 +49,26 @@ class PhotoOrganizer:
                  num_top_tags=NUM_TOP_TAGS, tag_confidence_threshold=TAG_CONFIDENCE_THRESHOLD,
                  custom_tags=None,
                  log_callback=None,
-                 processing_mode="jpg_and_raw"):
+                 processing_mode="jpg_and_raw",
+                 build_search_index=False,
+                 scoring_mode=None,
+                 tag_vocabulary_file=None,
+                 multi_crop_tagging=False,
+                 metrics_export_path=None,
+                 image_tagger=None,
+                 progress_callback=None,
+                 temp_folder=TEMP_RESIZE_FOLDER,
+                 tagging_workers=None,
+                 folder_layout=DEFAULT_FOLDER_LAYOUT,
+                 filename_layout=DEFAULT_FILENAME_LAYOUT,
+                 event_gap_hours=EVENT_GAP_HOURS,
+                 event_similarity_threshold=None,
+                 metadata_mode="none",
+                 memory_budget_mb=None,
+                 transfer_mode="move",
+                 io_concurrency=DEFAULT_IO_CONCURRENCY,
+                 verify_checksums=False,
+                 preview_cache_mb=None):
         
         self.source_folder = source_folder
         self.destination_base_folder = destination_base_folder
@@ -29,107 +76,355 @@ class PhotoOrganizer:
         self.tag_delimiter = tag_delimiter
         self.num_top_tags = num_top_tags
         self.tag_confidence_threshold = tag_confidence_threshold
-        self.log_callback = log_callback if log_callback else self._default_log
+        self.log_callback = log_callback if log_callback else print_log
         self.processing_mode = processing_mode
+        self.multi_crop_tagging = multi_crop_tagging
+        self.temp_folder = temp_folder
+        # Validated here so a typo in a template fails before any model is loaded
+        self.layout = DestinationLayout(folder_layout, filename_layout, tag_delimiter, file_id_prefix, destination_base_folder)
+        self.event_gap_hours = event_gap_hours
+        self.event_similarity_threshold = event_similarity_threshold
         self.processed_count = 0
         self.skipped_count = 0
+        # Paired files and sidecars already moved with their photo, until the move loop reaches them.
+        # Pairs share a folder and the scan goes folder by folder, so this stays small
+        self.moved_with_photo = set()
         self.error_count = 0
-
-        self.image_tagger = ImageTagger(custom_tags=custom_tags)
-        self._log(f"ImageTagger initialized with {len(self.image_tagger.candidate_tags)} tags", level='info')
-
-        self.tagged_image_cache = {}
-
-    def _default_log(self, message, level='info'):
-        print(f"[{level.upper()}] {message}")
+        self.metrics = PipelineMetrics()
+        self.metrics_export_path = metrics_export_path
+        self.progress_callback = progress_callback
+        self.progress = {"stage": None, "done": 0, "total": 0, "started_at": None}
+        self.cancelled = False
+        self._cancel_event = threading.Event()
+
+        # An already-loaded tagger can be shared between organizers to skip the model load
+        if image_tagger is not None:
+            self.image_tagger = image_tagger
+        elif tagging_workers:
+            # Inference runs in separate worker processes ("host:port" list); see tagging_service.py
+            from tagging_service import RemoteTaggerPool
+            with self.metrics.stage("model_load", unit="models"):
+                self.image_tagger = RemoteTaggerPool(tagging_workers, log_callback=self._log)
+        else:
+            with self.metrics.stage("model_load", unit="models"):
+                self.image_tagger = ImageTagger(custom_tags=custom_tags, scoring_mode=scoring_mode,
+                                                vocabulary_file=tag_vocabulary_file, log_callback=self._log)
+        # Closed once analysis is done; a tagger passed in belongs to the caller
+        self._owned_tagger_pool = self.image_tagger if tagging_workers and image_tagger is None else None
+        self._log(f"ImageTagger initialized with {len(self.image_tagger.candidate_tags)} tags ({self.image_tagger.scorer.mode} scoring)", level='info')
+
+        # Per-file results, indexed by position in the scanned file list; created after the scan
+        self.memory_budget_mb = memory_budget_mb
+        self.spill_folder = None
+        self.tag_table = None
+        self.embedding_table = None
+        # Filled by the events stage, only when the layout uses {event}
+        self.timestamps = None
+        self.event_ids = None
+        self.event_names = []
+
+        # Only appended to, so the existing index is never loaded into memory
+        self.search_index = PhotoSearchIndex(destination_base_folder, load=False) if build_search_index else None
+        self._search_index_lock = threading.Lock()
+        # Tags as XMP sidecars or IPTC keywords, written in the background during the move stage
+        self.metadata_writer = None
+        if metadata_mode == "iptc" and transfer_mode == "copy" and verify_checksums:
+            # Embedded keywords would change the copies after their checksums were taken
+            self._log("IPTC keywords would invalidate the copy checksums; writing XMP sidecars instead.", level='warning')
+            metadata_mode = "xmp"
+        if metadata_mode != "none":
+            self.metadata_writer = MetadataWriter(metadata_mode, log_callback=self._log, metrics=self.metrics)
+
+        # 'copy' leaves the source untouched (e.g. a memory card) and copies on io_concurrency threads
+        if transfer_mode not in TRANSFER_MODES:
+            raise ValueError(f"Unknown transfer mode '{transfer_mode}'. Expected one of: {', '.join(TRANSFER_MODES)}")
+        self.transfer_mode = transfer_mode
+        self.transfer_pool = None
+        if transfer_mode == "copy":
+            manifest_path = os.path.join(destination_base_folder, CHECKSUM_MANIFEST) if verify_checksums else None
+            self.transfer_pool = FileTransferPool(io_concurrency, verify_checksums, manifest_path,
+                                                  log_callback=self._log, metrics=self.metrics)
+
+        # Opt-in previews in the destination, written from the decode the prepare stage does anyway
+        self.preview_cache = None
+        if preview_cache_mb:
+            self.preview_cache = PreviewCache(os.path.join(destination_base_folder, PREVIEW_FOLDER_NAME), preview_cache_mb,
+                                              log_callback=self._log, metrics=self.metrics)
 
     def _log(self, message, level='info'):
         if self.log_callback:
             self.log_callback(message, level)
 
-    def _generate_new_filename(self, original_filename, date_obj, tags_with_probs):
+    def cancel(self):
+        """Asks a running organize_photos to stop at the next file or batch boundary. Safe to call from any thread."""
+        self._cancel_event.set()
 
-        base, ext = os.path.splitext(original_filename)
-        
-        date_time_str = date_obj.strftime("%Y%m%d_%H%M%S") # Detailed date-time for filename
-
-        cleaned_tags = []
-        for tag_full_phrase, _ in tags_with_probs:
-            cleaned_tag_part = re.sub(r"^a photo of (a |an |the )?", "", tag_full_phrase, flags=re.IGNORECASE).strip()
-            cleaned_tag_part = re.sub(r'[^a-zA-Z0-9\s._-]+', '', cleaned_tag_part) 
-            cleaned_tag_part = re.sub(r'\s+', ' ', cleaned_tag_part)
-            cleaned_tag_part = cleaned_tag_part.strip()
-            
-            if cleaned_tag_part:
-                cleaned_tags.append(cleaned_tag_part)
+    def _check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise OrganizationCancelled()
 
-        tags_str_for_filename = self.tag_delimiter.join(cleaned_tags)
+    def _set_progress(self, stage, done, total):
+        if stage != self.progress["stage"]:
+            self.progress = {"stage": stage, "done": done, "total": total, "started_at": time.perf_counter()}
+        else:
+            self.progress.update(done=done, total=total)
+        if self.progress_callback:
+            self.progress_callback(self.get_progress())
+
+    def get_progress(self):
+        """
+        Returns {"stage", "done", "total", "fraction", "eta_seconds"} for the current stage.
+        The ETA is extrapolated from the throughput measured so far in that stage (None until known).
+        """
+        progress = dict(self.progress)
+        started_at = progress.pop("started_at")
+        done, total = progress["done"], progress["total"]
+        progress["fraction"] = done / total if total else 0.0
+        progress["eta_seconds"] = None
+        if started_at is not None and done:
+            elapsed = time.perf_counter() - started_at
+            progress["eta_seconds"] = (total - done) * elapsed / done
+        return progress
+
+    def _shrink_for_tagging(self, img):
+        if self.multi_crop_tagging:
+            # Upright, with the short side at model resolution, so every crop taken along the long axis is full detail.
+            # JPEGs are decoded at a reduced scale that keeps both sides at least TARGET_RESIZE_DIM
+            img.draft('RGB', (TARGET_RESIZE_DIM, TARGET_RESIZE_DIM))
+            img = ImageOps.exif_transpose(img)
+            short_side = min(img.size)
+            if short_side > TARGET_RESIZE_DIM:
+                scale = TARGET_RESIZE_DIM / short_side
+                img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+            return img
+
+        if max(img.size) > TARGET_RESIZE_DIM:
+            img.thumbnail((TARGET_RESIZE_DIM, TARGET_RESIZE_DIM), Image.LANCZOS)
+        return img
 
-        new_name_parts = []
-        if self.file_id_prefix:
-            new_name_parts.append(sanitize_filename(self.file_id_prefix))
-        
-        new_name_parts.append(date_time_str)
+    def organize_photos(self):
+        files_to_move = self.analyze_source()
+        if files_to_move is None:
+            return False
+        if not files_to_move:
+            return True
+        return self.move_analyzed_files(files_to_move)
+
+    def analyze_source(self):
+        """
+        Runs the scan, prepare and tag stages. Returns the files to move (possibly empty), or None
+        if the run failed or was cancelled. The tagger is only used here, so a shared tagger can
+        analyze the next source while move_analyzed_files() of this one runs on another thread.
+        """
+        try:
+            return self._analyze_source()
+        finally:
+            self._close_tagger_pool()
 
-        if tags_str_for_filename:
-            new_name_parts.append(tags_str_for_filename)
-        
-        if not new_name_parts:
-            new_name_parts.append("untitled")
+    def _analyze_source(self):
+        try:
+            with self.metrics.stage("scan", unit="files"):
+                all_files_to_process = self._scan_source()
+            if all_files_to_process is None:
+                self._release_file_state()
+                return None
+
+            if not all_files_to_process:
+                self._log("No relevant files found in the source folder based on the selected mode.", level='info')
+                self._cleanup_temp_folder()
+                self._release_file_state()
+                return []
+
+            self._log(f"Found {len(all_files_to_process)} files to process.", level='info')
+            self._allocate_file_state(len(all_files_to_process))
+
+            # Without a budget everything is prepared, then everything tagged; with one, a chunk at a time
+            chunk_size = PREPARE_CHUNK_SIZE if self.memory_budget_mb else len(all_files_to_process)
+            for start_index, chunk in all_files_to_process.chunks(chunk_size):
+                with self.metrics.stage("prepare", unit="images"):
+                    files_for_clip_tagging, original_path_map = self._prepare_for_tagging(chunk, start_index, len(all_files_to_process))
+
+                with self.metrics.stage("tag", unit="images"):
+                    self._tag_prepared_files(files_for_clip_tagging, original_path_map)
+                self._remove_temp_files(files_for_clip_tagging)
+            self._finish_previews()
+
+            if "event" in self.layout.fields:
+                with self.metrics.stage("events", unit="files"):
+                    self._detect_events(all_files_to_process)
+        except OrganizationCancelled:
+            self._finish_previews()
+            self._finish_cancelled()
+            return None
+
+        # Tags are cached by now; the thumbnails are no longer needed
+        self._cleanup_temp_folder()
+        return all_files_to_process
 
-        final_base_name_raw = self.tag_delimiter.join(new_name_parts)
+    def _close_tagger_pool(self):
+        # Worker connections and shared-memory blocks of a pool this organizer created
+        if self._owned_tagger_pool is not None:
+            self._owned_tagger_pool.close()
+            self._owned_tagger_pool = None
 
-        new_filename = sanitize_filename(final_base_name_raw, allowed_delimiter_chars=self.tag_delimiter) + ext.lower()
-        
-        new_filename = re.sub(r'(?:' + re.escape(self.tag_delimiter) + r')+', self.tag_delimiter, new_filename)
-        new_filename = new_filename.strip(self.tag_delimiter)
+    def move_analyzed_files(self, all_files_to_process):
+        """Runs the move stage for files returned by analyze_source(). Returns True if there were no errors."""
+        try:
+            with self.metrics.stage("move", unit="files"):
+                self._move_files(all_files_to_process)
+        except OrganizationCancelled:
+            self._finish_cancelled()
+            return False
 
-        return new_filename
+        self._finish_transfers()
+        self._finish_metadata()
+        self._flush_search_index()
+        self._cleanup_temp_folder()
+        self._release_file_state()
+        self._log(f"Organization process completed. Processed: {self.processed_count}, Skipped: {self.skipped_count}, Errors: {self.error_count}", level='success')
+        self._report_metrics()
+        return self.error_count == 0
 
+    def _finish_cancelled(self):
+        # Every move so far completed together with its paired file, so only bookkeeping is left
+        self.cancelled = True
+        self._finish_transfers(cancel=True)
+        self._finish_metadata()
+        self._flush_search_index()
+        self._cleanup_temp_folder()
+        self._release_file_state()
+        self._log(f"Organization cancelled. Processed: {self.processed_count}, Skipped: {self.skipped_count}, Errors: {self.error_count}. Remaining files were left in the source folder.", level='warning')
+        self._report_metrics()
 
-    def organize_photos(self):
+    def _finish_transfers(self, cancel=False):
+        # Keywords are only queued once a copy is done, so this has to finish before the metadata writer
+        if self.transfer_pool is None:
+            return
+        if cancel:
+            # Queued copies are dropped; groups being copied right now are finished in full
+            with self.metrics.stage("transfer_wait", unit="files"):
+                self.error_count += self.transfer_pool.cancel()
+        else:
+            if self.transfer_pool.pending:
+                self._log(f"Waiting for {self.transfer_pool.pending} copies...", level='info')
+            with self.metrics.stage("transfer_wait", unit="files"):
+                self.error_count += self.transfer_pool.finish()
+        self.processed_count += self.transfer_pool.copied_count
+        if self.transfer_pool.manifest_path:
+            self._log(f"Checksums written to '{self.transfer_pool.manifest_path}'.", level='info')
+
+    def _finish_previews(self):
+        if self.preview_cache is None:
+            return
+        with self.metrics.stage("previews", unit="images"):
+            self.preview_cache.finish()
+        self._log(f"Cached previews of {self.preview_cache.written_count} photos ({self.preview_cache.added_bytes / (1024 * 1024):.1f} MB).", level='info')
+
+    def _cache_previews(self, file_path, img):
+        try:
+            key = preview_key(file_path)
+            if not self.preview_cache.has(key):
+                # Decoded and shrunk once to preview size; the tagging thumbnail is then cut from that
+                img.draft(None, self.preview_cache.draft_size(img.size))
+                img.thumbnail(self.preview_cache.draft_size(img.size), Image.LANCZOS)
+                self.preview_cache.submit(key, img)
+        except Exception as e:
+            self._log(f"Warning: Could not cache a preview of '{os.path.basename(file_path)}': {e}", level='warning')
+
+    def _finish_metadata(self):
+        if self.metadata_writer is None:
+            return
+        if self.metadata_writer.pending:
+            self._log(f"Waiting for {self.metadata_writer.pending} metadata writes...", level='info')
+        with self.metrics.stage("metadata", unit="files"):
+            self.error_count += self.metadata_writer.finish()
+        self._log(f"Wrote keywords to {self.metadata_writer.written_count} files ({self.metadata_writer.mode}).", level='info')
+
+    def _scan_source(self):
         self._log(f"Scanning source folder for files based on mode: '{self.processing_mode}'...", level='info')
-        all_files_to_process = [] 
+        max_in_memory = None
+        if self.memory_budget_mb:
+            # A quarter of the budget for the file list; the rest of it is spilled to disk
+            max_in_memory = max(1, self.memory_budget_mb * 1024 * 1024 // 4 // BYTES_PER_FILE_ENTRY)
+        all_files_to_process = FileList(max_in_memory, self._get_spill_folder() if max_in_memory else None)
 
         if self.processing_mode == "jpg_and_raw":
             for root, _, files in os.walk(self.source_folder):
+                self._check_cancelled()
                 for file in files:
                     if is_image_file(file) or is_raw_file(file):
-                        all_files_to_process.append(os.path.join(root, file))
+                        all_files_to_process.append(root, file)
         elif self.processing_mode == "raw_only":
             for root, _, files in os.walk(self.source_folder):
+                self._check_cancelled()
                 for file in files:
                     if is_raw_file(file):
-                        all_files_to_process.append(os.path.join(root, file))
+                        all_files_to_process.append(root, file)
         else:
             self._log(f"Error: Unknown processing mode '{self.processing_mode}'. Aborting.", level='error')
-            return False
-
-
-        if not all_files_to_process:
-            self._log("No relevant files found in the source folder based on the selected mode.", level='info')
-            self._cleanup_temp_folder()
-            return True
-
-        self._log(f"Found {len(all_files_to_process)} files to process.", level='info')
-
+            return None
+
+        all_files_to_process.close()
+        if all_files_to_process.is_spilled():
+            self._log(f"File list exceeds the memory budget; spilled to '{self.spill_folder}'.", level='info')
+        self.metrics.record_batch("scan", 0.0, items=len(all_files_to_process))
+        return all_files_to_process
+
+    def _get_spill_folder(self):
+        if self.spill_folder is None:
+            self.spill_folder = tempfile.mkdtemp(prefix="photo_organizer_state_")
+        return self.spill_folder
+
+    def _spill_folder_for(self, nbytes):
+        """Where a per-file array of nbytes should live: None (RAM) unless it would take over a quarter of the memory budget."""
+        if self.memory_budget_mb and nbytes > self.memory_budget_mb * 1024 * 1024 // 4:
+            return self._get_spill_folder()
+        return None
+
+    def _allocate_file_state(self, num_files):
+        tag_bytes = num_files * self.num_top_tags * (4 + 2)
+        self.tag_table = TagTable(num_files, self.image_tagger.candidate_tags, self.num_top_tags, self._spill_folder_for(tag_bytes))
+        if self.search_index is not None or self._uses_event_embeddings():
+            # Embedding size is unknown until the first batch; 512 float16 values is CLIP ViT-B/32
+            self.embedding_table = EmbeddingTable(num_files, self._spill_folder_for(num_files * 512 * 2))
+        if "event" in self.layout.fields:
+            self.timestamps = allocate_array((max(num_files, 1),), np.float64, np.nan, self._spill_folder_for(num_files * 8), "timestamps")
+
+    def _release_file_state(self):
+        self.tag_table = None
+        self.embedding_table = None
+        self.timestamps = None
+        self.event_ids = None
+        if self.spill_folder is not None:
+            shutil.rmtree(self.spill_folder, ignore_errors=True)
+            self.spill_folder = None
+
+    def _prepare_for_tagging(self, files, start_index=0, total_files=None):
         files_for_clip_tagging = [] # Paths to temporary JPGs
-        original_path_map = {}
+        original_path_map = {} # Temporary JPG -> index of the original in the scanned file list
+        total_files = total_files if total_files is not None else len(files)
 
-        os.makedirs(TEMP_RESIZE_FOLDER, exist_ok=True)
+        os.makedirs(self.temp_folder, exist_ok=True)
+        rawpy = import_rawpy() if self.processing_mode == "raw_only" else None
 
-        for file_path in all_files_to_process:
+        for index, file_path in enumerate(files, start=start_index):
+            self._check_cancelled()
+            self._set_progress("prepare", index, total_files)
             temp_img_path = None
             original_file_name = os.path.basename(file_path)
+            prepare_start = time.perf_counter()
 
             if is_jpg_file(file_path):
                 if self.processing_mode == "jpg_and_raw":
                     try:
                         img = Image.open(file_path)
-                        if max(img.size) > TARGET_RESIZE_DIM:
-                            img.thumbnail((TARGET_RESIZE_DIM, TARGET_RESIZE_DIM), Image.LANCZOS)
-                        temp_img_path = os.path.join(TEMP_RESIZE_FOLDER, original_file_name)
+                        if self.preview_cache is not None:
+                            self._cache_previews(file_path, img)
+                        img = self._shrink_for_tagging(img)
+                        # Prefixed with the index: files from different folders may share a name
+                        temp_img_path = os.path.join(self.temp_folder, f"{index}_{original_file_name}")
                         img.save(temp_img_path)
+                        self.metrics.record_batch("decode", time.perf_counter() - prepare_start, nbytes=os.path.getsize(file_path), unit="images")
                         self._log(f"Prepared JPG '{original_file_name}' for tagging.", level='debug')
                     except Exception as e:
                         self._log(f"Warning: Could not prepare JPG '{original_file_name}' for tagging: {e}. It will be moved by date only.", level='warning')
@@ -143,13 +438,14 @@ class PhotoOrganizer:
                             with rawpy.imread(file_path) as raw:
                                 rgb_img_np = raw.postprocess(use_camera_wb=True, no_auto_bright=True)
                                 img = Image.fromarray(rgb_img_np)
-
-                                if max(img.size) > TARGET_RESIZE_DIM:
-                                    img.thumbnail((TARGET_RESIZE_DIM, TARGET_RESIZE_DIM), Image.LANCZOS)
+                                if self.preview_cache is not None:
+                                    self._cache_previews(file_path, img)
+                                img = self._shrink_for_tagging(img)
                                 
-                                temp_img_name = os.path.splitext(original_file_name)[0] + ".jpg"
-                                temp_img_path = os.path.join(TEMP_RESIZE_FOLDER, temp_img_name)
+                                temp_img_name = f"{index}_{os.path.splitext(original_file_name)[0]}.jpg"
+                                temp_img_path = os.path.join(self.temp_folder, temp_img_name)
                                 img.save(temp_img_path)
+                                self.metrics.record_batch("raw_convert", time.perf_counter() - prepare_start, nbytes=os.path.getsize(file_path), unit="images")
                                 self._log(f"Prepared RAW '{original_file_name}' as temporary JPG for tagging.", level='debug')
                         except Exception as e:
                             self._log(f"Warning: Could not convert RAW '{original_file_name}' to temporary JPG for tagging: {e}. It will be moved by date only.", level='warning')
@@ -162,54 +458,163 @@ class PhotoOrganizer:
             
             if temp_img_path and os.path.exists(temp_img_path):
                 files_for_clip_tagging.append(temp_img_path)
-                original_path_map[temp_img_path] = file_path
+                original_path_map[temp_img_path] = index
+                self.metrics.record_batch("prepare", time.perf_counter() - prepare_start, unit="images")
+                self.metrics.set_queue_depth("pending_tagging", len(files_for_clip_tagging))
+
+        self._set_progress("prepare", start_index + len(files), total_files)
+        return files_for_clip_tagging, original_path_map
 
+    def _tag_prepared_files(self, files_for_clip_tagging, original_path_map):
         if files_for_clip_tagging:
             self._log(f"Starting tagging", level='info')
             
-            num_batches = (len(files_for_clip_tagging) + BATCH_SIZE - 1) // BATCH_SIZE
-            for i in range(0, len(files_for_clip_tagging), BATCH_SIZE):
-                batch_temp_paths = files_for_clip_tagging[i:i + BATCH_SIZE]
-                
-                valid_batch_temp_paths = [p for p in batch_temp_paths if os.path.exists(p)]
-
-                if valid_batch_temp_paths:
-                    self._log(f"Tagging batch {i//BATCH_SIZE + 1}/{num_batches}...", level='info')
-                    try:
-                        tags_batch_results = self.image_tagger.tag_images_batch(valid_batch_temp_paths, self.num_top_tags)
-                        for temp_path, tags in tags_batch_results.items():
-                            original_path = original_path_map.get(temp_path)
-                            if original_path:
-                                self.tagged_image_cache[original_path] = tags
-                            else:
-                                self._log(f"Warning: Original path not found for temp file {temp_path}. Skipping tag cache.", level='warning')
-                    except Exception as e:
-                        self._log(f"Error during batch tagging for batch starting with {valid_batch_temp_paths[0] if valid_batch_temp_paths else 'N/A'}: {e}", level='error')
-                else:
-                    self._log(f"Skipping empty or invalid batch at index {i}.", level='warning')
+            num_crops = MULTI_CROP_COUNT if self.multi_crop_tagging else 1
+            return_embeddings = self.search_index is not None or self._uses_event_embeddings()
+            batches = [files_for_clip_tagging[i:i + BATCH_SIZE] for i in range(0, len(files_for_clip_tagging), BATCH_SIZE)]
+            valid_batches = [[p for p in batch if os.path.exists(p)] for batch in batches]
+            for batch, valid_batch in zip(batches, valid_batches):
+                if not valid_batch:
+                    self._log(f"Skipping empty or invalid batch starting with {batch[0]}.", level='warning')
+
+            tagged_count = 0
+            batch_start = time.perf_counter()
+            batches_to_tag = [batch for batch in valid_batches if batch]
+            results = self._tag_batch_results(batches_to_tag, return_embeddings, num_crops)
+            try:
+                for batch_number, (valid_batch_temp_paths, result) in enumerate(results, start=1):
+                    self._check_cancelled()
+                    if isinstance(result, Exception):
+                        self._log(f"Error during batch tagging for batch starting with {valid_batch_temp_paths[0]}: {result}", level='error')
+                    else:
+                        self._log(f"Tagged batch {batch_number}/{len(batches_to_tag)}", level='info')
+                        self._store_tag_results(result, original_path_map, return_embeddings)
+                    self.metrics.record_batch("tag", time.perf_counter() - batch_start, items=len(valid_batch_temp_paths), unit="images")
+                    batch_start = time.perf_counter()
+                    tagged_count += len(valid_batch_temp_paths)
+                    self._set_progress("tag", tagged_count, len(files_for_clip_tagging))
+                    self.metrics.set_queue_depth("pending_tagging", max(0, len(files_for_clip_tagging) - tagged_count))
+            finally:
+                results.close()
+            self._set_progress("tag", len(files_for_clip_tagging), len(files_for_clip_tagging))
         else:
             self._log("No JPEGs or convertible RAWs found for tagging. All files will be moved based on date only.", level='info')
 
-        self._log("Moving and renaming all files...", level='info')
-        for file_path in all_files_to_process:
-            self._process_single_file(file_path)
+    def _tag_batch_results(self, batches, return_embeddings, num_crops):
+        """Yields (batch, result or exception) in order; taggers with tag_batches() may run batches concurrently."""
+        if hasattr(self.image_tagger, "tag_batches"):
+            yield from self.image_tagger.tag_batches(batches, self.num_top_tags, return_embeddings, num_crops)
+            return
+        for batch in batches:
+            try:
+                yield batch, self.image_tagger.tag_images_batch(batch, self.num_top_tags, return_embeddings=return_embeddings, num_crops=num_crops)
+            except Exception as e:
+                yield batch, e
+
+    def _store_tag_results(self, result, original_path_map, return_embeddings):
+        if return_embeddings:
+            tags_batch_results, embeddings_batch = result
+            for temp_path, embedding in embeddings_batch.items():
+                if temp_path in original_path_map:
+                    self.embedding_table.set(original_path_map[temp_path], embedding)
+        else:
+            tags_batch_results = result
+        for temp_path, tags in tags_batch_results.items():
+            file_index = original_path_map.get(temp_path)
+            if file_index is not None:
+                self.tag_table.set(file_index, tags)
+            else:
+                self._log(f"Warning: Original path not found for temp file {temp_path}. Skipping tag cache.", level='warning')
+
+    def _uses_event_embeddings(self):
+        return "event" in self.layout.fields and self.event_similarity_threshold is not None
+
+    def _detect_events(self, all_files_to_process):
+        self._log("Grouping photos into events by capture time...", level='info')
+        for index, file_path in enumerate(all_files_to_process):
+            if index % 1000 == 0:
+                self._check_cancelled()
+                self._set_progress("events", index, len(all_files_to_process))
+            # Only photos moved on their own count; a sidecar's date is when it was last edited
+            if file_path.lower().endswith(".xmp") or self._travels_with_photo(file_path):
+                continue
+            file_date = get_image_date(file_path)
+            if file_date is not None:
+                # Kept for the move stage so every date is read only once
+                self.timestamps[index] = file_date.timestamp()
+        dated_rows = np.flatnonzero(~np.isnan(self.timestamps[:len(all_files_to_process)]))
+        if not len(dated_rows):
+            return
 
-        self._cleanup_temp_folder()
-        self._log(f"Organization process completed. Processed: {self.processed_count}, Skipped: {self.skipped_count}, Errors: {self.error_count}", level='success')
-        return self.error_count == 0
+        timestamps = self.timestamps[dated_rows]
+        embeddings = None
+        if self._uses_event_embeddings() and self.embedding_table.embeddings is not None:
+            embeddings = self.embedding_table.embeddings
+
+        event_ids = cluster_events(timestamps, self.event_gap_hours * 3600, embeddings, self.event_similarity_threshold,
+                                   embedding_rows=dated_rows)
+        self.event_names = event_labels(timestamps, event_ids)
+        self.event_ids = allocate_array((len(self.timestamps),), np.int32, -1, self._spill_folder_for(len(self.timestamps) * 4), "event_ids")
+        self.event_ids[dated_rows] = event_ids
+        if self.search_index is None:
+            self.embedding_table = None # Only needed for the events
+        self.metrics.record_batch("events", 0.0, items=len(dated_rows))
+        self._set_progress("events", len(all_files_to_process), len(all_files_to_process))
+        self._log(f"Grouped {len(dated_rows)} files into {len(self.event_names)} events.", level='info')
+
+    def _move_files(self, all_files_to_process):
+        self._log("Copying and renaming all files..." if self.transfer_pool else "Moving and renaming all files...", level='info')
+        for index, file_path in enumerate(all_files_to_process):
+            # Checked only between files: a file and its paired RAW/JPG are always moved together
+            self._check_cancelled()
+            self._set_progress("move", index, len(all_files_to_process))
+            try:
+                file_size = os.path.getsize(file_path)
+            except OSError:
+                file_size = 0
+            with self.metrics.timed_batch("move", nbytes=file_size):
+                self._process_single_file(file_path, index)
+            self.metrics.set_queue_depth("pending_moves", len(all_files_to_process) - index - 1)
+            if self.transfer_pool is not None:
+                self.metrics.set_queue_depth("pending_copies", self.transfer_pool.pending)
+        self._set_progress("move", len(all_files_to_process), len(all_files_to_process))
+
+    def _flush_search_index(self):
+        if self.search_index is not None:
+            try:
+                self.search_index.flush(reload=False)
+                self._log(f"Added {self.search_index.added_count} photos to the search index.", level='info')
+            except Exception as e:
+                self._log(f"Error updating search index: {e}", level='error')
 
-    def _process_single_file(self, file_path):
+    def _report_metrics(self):
+        self._log("Stage timings:\n" + self.metrics.summary_table(), level='info')
+        if self.metrics_export_path:
+            try:
+                self.metrics.export(self.metrics_export_path)
+                self._log(f"Metrics written to '{self.metrics_export_path}'.", level='info')
+            except Exception as e:
+                self._log(f"Error writing metrics to '{self.metrics_export_path}': {e}", level='error')
+
+    def _process_single_file(self, file_path, file_index):
         file_name = os.path.basename(file_path)
-        
-        file_date = get_image_date(file_path)
+        if os.path.normcase(file_path) in self.moved_with_photo:
+            self.moved_with_photo.discard(os.path.normcase(file_path))
+            return
+        if self._travels_with_photo(file_path):
+            return
+
+        file_date = None
+        # A cached date does not mean the file is still there: paired RAWs move with their JPG
+        if self.timestamps is not None and not np.isnan(self.timestamps[file_index]) and os.path.exists(file_path):
+            file_date = datetime.fromtimestamp(self.timestamps[file_index])
+        else:
+            file_date = get_image_date(file_path)
         if file_date is None:
             self._log(f"Could not determine date for {file_name}. Skipping.", level='warning')
             self.skipped_count += 1
             return
 
-        year_folder = str(file_date.year)
-        month_name = file_date.strftime("%m-%B") # e.g., 01-January
-
         tags_for_filename = []
         
         is_primary_file_for_tagging = False
@@ -219,8 +624,8 @@ class PhotoOrganizer:
             is_primary_file_for_tagging = True
 
         # retrieve tags from cache if available and this is a primary file
-        if is_primary_file_for_tagging and file_path in self.tagged_image_cache:
-            all_tags_with_probs = self.tagged_image_cache[file_path]
+        all_tags_with_probs = self.tag_table.get(file_index) if is_primary_file_for_tagging else None
+        if all_tags_with_probs is not None:
             tags_for_filename = [
                 (tag, prob) for tag, prob in all_tags_with_probs
                 if prob >= self.tag_confidence_threshold
@@ -232,10 +637,13 @@ class PhotoOrganizer:
             tags_for_filename = []
 
 
-        # Construct new filename
-        new_filename = self._generate_new_filename(file_name, file_date, tags_for_filename)
+        # Construct destination folder and new filename from the layout templates
+        event = None
+        if self.event_ids is not None and self.event_ids[file_index] >= 0:
+            event = self.event_names[self.event_ids[file_index]]
+        relative_dir, new_filename = self.layout.build(file_path, file_date, tags_for_filename, event)
 
-        destination_dir = os.path.join(self.destination_base_folder, year_folder, month_name)
+        destination_dir = os.path.join(self.destination_base_folder, relative_dir)
         os.makedirs(destination_dir, exist_ok=True)
 
         final_destination_path = os.path.join(destination_dir, new_filename)
@@ -243,7 +651,7 @@ class PhotoOrganizer:
         # Handle filename conflicts by appending a counter
         counter = 1
         original_attempt_path = final_destination_path
-        while os.path.exists(final_destination_path):
+        while self._destination_taken(final_destination_path):
             # If the file already exists at the exact destination and is the same file, skip
             if os.path.abspath(file_path) == os.path.abspath(final_destination_path):
                 self._log(f"Skipping '{file_name}': Already exists at destination and is identical.", level='info')
@@ -254,65 +662,134 @@ class PhotoOrganizer:
             final_destination_path = f"{name}_{counter}{ext}"
             counter += 1
 
-        try:
-            shutil.move(file_path, final_destination_path)
-            self._log(f"Moved: '{file_name}' -> '{os.path.relpath(final_destination_path, self.destination_base_folder)}'", level='info')
-            self.processed_count += 1
-
-            if self.processing_mode == "jpg_and_raw":
-                # If the current file is a JPG, check for a paired RAW
-                if is_jpg_file(file_path): 
-                    paired_raw_file = find_paired_file(file_path, RAW_EXTENSIONS)
-                    if paired_raw_file and os.path.exists(paired_raw_file):
-                        paired_raw_name_base, paired_raw_ext = os.path.splitext(os.path.basename(paired_raw_file))
-                        # Use the same new base name as the JPG, but with the RAW extension
-                        new_paired_path = os.path.join(destination_dir, f"{os.path.splitext(new_filename)[0]}{paired_raw_ext.lower()}")
-                        
-                        paired_counter = 1
-                        initial_paired_path = new_paired_path
-                        while os.path.exists(new_paired_path):
-                            if os.path.abspath(paired_raw_file) == os.path.abspath(new_paired_path):
-                                self._log(f"Skipping paired RAW '{os.path.basename(paired_raw_file)}': Already exists at destination and is identical.", level='info')
-                                break # Already in place, no need to move
-                            paired_name_base, paired_ext = os.path.splitext(initial_paired_path)
-                            new_paired_path = f"{paired_name_base}_{paired_counter}{paired_ext}"
-                            paired_counter += 1
-
-                        if not os.path.exists(new_paired_path) or os.path.abspath(paired_raw_file) != os.path.abspath(new_paired_path):
-                            shutil.move(paired_raw_file, new_paired_path)
-                            self._log(f"Moved paired RAW: '{os.path.basename(paired_raw_file)}' -> '{os.path.relpath(new_paired_path, self.destination_base_folder)}'", level='info')
-            
-            elif self.processing_mode == "raw_only":
-                if is_raw_file(file_path):
-                    paired_jpg_file = find_paired_file(file_path, IMAGE_EXTENSIONS)
-                    if paired_jpg_file and os.path.exists(paired_jpg_file):
-                        if os.path.abspath(paired_jpg_file) != os.path.abspath(file_path):
-                            paired_jpg_name_base, paired_jpg_ext = os.path.splitext(os.path.basename(paired_jpg_file))
-                            new_paired_path = os.path.join(destination_dir, f"{os.path.splitext(new_filename)[0]}{paired_jpg_ext.lower()}")
-                            
-                            paired_counter = 1
-                            initial_paired_path = new_paired_path
-                            while os.path.exists(new_paired_path):
-                                if os.path.abspath(paired_jpg_file) == os.path.abspath(new_paired_path):
-                                    self._log(f"Skipping paired JPG '{os.path.basename(paired_jpg_file)}': Already exists at destination and is identical.", level='info')
-                                    break
-                                paired_name_base, paired_ext = os.path.splitext(initial_paired_path)
-                                new_paired_path = f"{paired_name_base}_{paired_counter}{paired_ext}"
-                                paired_counter += 1
-
-                            if not os.path.exists(new_paired_path) or os.path.abspath(paired_jpg_file) != os.path.abspath(new_paired_path):
-                                shutil.move(paired_jpg_file, new_paired_path)
-                                self._log(f"Moved paired JPG: '{os.path.basename(paired_jpg_file)}' -> '{os.path.relpath(new_paired_path, self.destination_base_folder)}'", level='info')
+        transfers = [(file_path, final_destination_path)]
+        paired_file = None
+        if self.processing_mode == "jpg_and_raw" and is_jpg_file(file_path):
+            paired_file = find_paired_file(file_path, RAW_EXTENSIONS)
+        elif self.processing_mode == "raw_only" and is_raw_file(file_path):
+            paired_file = find_paired_file(file_path, IMAGE_EXTENSIONS)
+        if paired_file and os.path.exists(paired_file) and os.path.abspath(paired_file) != os.path.abspath(file_path):
+            # Same new base name as the primary file, with the paired file's extension
+            new_paired_path = self._paired_destination(paired_file, destination_dir, new_filename)
+            if new_paired_path is not None:
+                transfers.append((paired_file, new_paired_path))
+        # An existing .xmp sidecar goes along under the photo's new name, so keywords are merged into it
+        source_sidecar = self._source_sidecar(file_path)
+        if source_sidecar is not None and source_sidecar not in [source for source, _ in transfers]:
+            new_sidecar_path = sidecar_path(final_destination_path)
+            if self._destination_taken(new_sidecar_path):
+                self._log(f"Leaving sidecar '{os.path.basename(source_sidecar)}' in the source: '{os.path.relpath(new_sidecar_path, self.destination_base_folder)}' already exists.", level='warning')
+            else:
+                transfers.append((source_sidecar, new_sidecar_path))
 
+        if self.transfer_pool is not None:
+            self._queue_copies(transfers, file_index, tags_for_filename)
+            return
+
+        moved_paths = []
+        try:
+            for source, destination in transfers:
+                shutil.move(source, destination)
+                moved_paths.append(destination)
+                self._log(f"{self._transfer_label(source, file_path, 'Moved')}: '{os.path.basename(source)}' -> '{os.path.relpath(destination, self.destination_base_folder)}'", level='info')
+                if source == file_path:
+                    self.processed_count += 1
+                    self._add_to_search_index(destination, file_index)
+                else:
+                    self.moved_with_photo.add(os.path.normcase(source))
         except Exception as e:
             self._log(f"Error moving '{file_name}': {e}", level='error')
             self.error_count += 1
 
+        if self.metadata_writer is not None and moved_paths:
+            self.metadata_writer.submit(moved_paths, tags_for_filename)
+            self.metrics.set_queue_depth("metadata_writes", self.metadata_writer.pending)
+
+    def _queue_copies(self, transfers, file_index, tags_for_filename):
+        for source, destination in transfers:
+            self._log(f"{self._transfer_label(source, transfers[0][0], 'Copying')}: '{os.path.basename(source)}' -> '{os.path.relpath(destination, self.destination_base_folder)}'", level='info')
+        primary_destination = transfers[0][1]
+
+        def on_done(copied):
+            # Runs on a copying thread once the files exist; the primary file is always copied first
+            if primary_destination in copied:
+                self._add_to_search_index(primary_destination, file_index)
+            if self.metadata_writer is not None:
+                # IPTC keywords are embedded into the copy, so they are written only once it exists
+                self.metadata_writer.submit(copied, tags_for_filename)
+        # Copied sidecars get the keywords merged in afterwards, so their checksums would not hold
+        rewritten = [destination for _, destination in transfers
+                     if self.metadata_writer is not None and destination.lower().endswith(".xmp")]
+        self.transfer_pool.submit(transfers, on_done, unlisted=rewritten)
+
+    def _source_sidecar(self, file_path):
+        """The .xmp sidecar next to file_path that should travel with it, or None."""
+        if file_path.lower().endswith(".xmp"):
+            return None
+        if self.processing_mode == "jpg_and_raw" and is_raw_file(file_path) and find_paired_file(file_path, ('.JPG', '.JPEG')):
+            return None # Travels with the JPG instead
+        return find_paired_file(file_path, ('.XMP',))
+
+    def _travels_with_photo(self, file_path):
+        # A RAW whose JPG pairs back to it, and the sidecar of a photo being processed, are moved or
+        # copied by that photo, never on their own (which would give them a name without its tags)
+        if self.processing_mode == "jpg_and_raw" and is_raw_file(file_path) and not file_path.lower().endswith(".xmp"):
+            primary_file = find_paired_file(file_path, ('.JPG', '.JPEG'))
+            return primary_file is not None and find_paired_file(primary_file, RAW_EXTENSIONS) == file_path
+        if not file_path.lower().endswith(".xmp"):
+            return False
+        photo_extensions = tuple(ext for ext in RAW_EXTENSIONS if ext != ".xmp")
+        if self.processing_mode == "jpg_and_raw":
+            photo_extensions = IMAGE_EXTENSIONS + photo_extensions
+        return find_paired_file(file_path, photo_extensions) is not None
+
+    def _transfer_label(self, source, primary_path, verb):
+        if source == primary_path:
+            return verb
+        if source.lower().endswith(".xmp"):
+            return f"{verb} sidecar"
+        return f"{verb} paired {'RAW' if is_raw_file(source) else 'JPG'}"
+
+    def _destination_taken(self, path):
+        return os.path.exists(path) or (self.transfer_pool is not None and self.transfer_pool.is_reserved(path))
+
+    def _paired_destination(self, paired_file, destination_dir, new_filename):
+        """Conflict-free destination for a paired file, or None if it is already in place."""
+        paired_ext = os.path.splitext(paired_file)[1].lower()
+        new_paired_path = os.path.join(destination_dir, f"{os.path.splitext(new_filename)[0]}{paired_ext}")
+        paired_counter = 1
+        initial_paired_path = new_paired_path
+        while self._destination_taken(new_paired_path):
+            if os.path.abspath(paired_file) == os.path.abspath(new_paired_path):
+                self._log(f"Skipping paired file '{os.path.basename(paired_file)}': Already exists at destination and is identical.", level='info')
+                return None
+            paired_name_base, paired_ext = os.path.splitext(initial_paired_path)
+            new_paired_path = f"{paired_name_base}_{paired_counter}{paired_ext}"
+            paired_counter += 1
+        return new_paired_path
+
+    def _add_to_search_index(self, destination_path, file_index):
+        embedding = self.embedding_table.get(file_index) if self.search_index is not None else None
+        if embedding is not None:
+            # Copies are added from the copying threads
+            with self._search_index_lock:
+                self.search_index.add(destination_path, embedding)
+                if self.search_index.pending_count() >= SEARCH_INDEX_FLUSH_INTERVAL:
+                    self.search_index.flush(reload=False)
+
+    def _remove_temp_files(self, temp_paths):
+        # Thumbnails of a tagged chunk, so the temp folder never holds more than one chunk
+        for temp_path in temp_paths:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
     def _cleanup_temp_folder(self):
         """Removes the temporary folder for resized images."""
-        if os.path.exists(TEMP_RESIZE_FOLDER):
+        if os.path.exists(self.temp_folder):
             try:
-                shutil.rmtree(TEMP_RESIZE_FOLDER)
-                self._log(f"Cleaned up temporary folder: {TEMP_RESIZE_FOLDER}", level='debug')
+                shutil.rmtree(self.temp_folder)
+                self._log(f"Cleaned up temporary folder: {self.temp_folder}", level='debug')
             except Exception as e:
-                self._log(f"Error cleaning up temporary folder '{TEMP_RESIZE_FOLDER}': {e}", level='error')
+                self._log(f"Error cleaning up temporary folder '{self.temp_folder}': {e}", level='error')
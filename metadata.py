@@ -0,0 +1,273 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from utils import print_log, is_image_file, is_raw_file, find_paired_file, IMAGE_EXTENSIONS
+from layout import clean_tag
+from image_tagger import ImageTagger
+
+try:
+    import pyexiv2 # Optional: only needed to embed IPTC keywords
+except ImportError:
+    pyexiv2 = None
+
+
+METADATA_MODES = ("none", "xmp", "iptc")
+METADATA_WRITE_WORKERS = 8
+RETAG_BATCH_SIZE = 32
+IPTC_EXTENSIONS = ('.jpg', '.jpeg', '.tif', '.tiff')
+
+NS_X = "adobe:ns:meta/"
+NS_RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+NS_DC = "http://purl.org/dc/elements/1.1/"
+# Remembers which keywords were written by the organizer, so a retag replaces only those
+NS_ORGANIZER = "urn:photo-organizer:1.0/"
+
+for _prefix, _uri in (("x", NS_X), ("rdf", NS_RDF), ("dc", NS_DC), ("photoorganizer", NS_ORGANIZER)):
+    ET.register_namespace(_prefix, _uri)
+
+
+def sidecar_path(image_path):
+    """IMG_0001.CR2 -> IMG_0001.xmp, shared by a RAW and its paired JPG like other .xmp files."""
+    return os.path.splitext(image_path)[0] + ".xmp"
+
+
+def _bag_items(parent, tag):
+    element = parent.find(tag)
+    if element is None:
+        return []
+    return [li.text or "" for li in element.iter(f"{{{NS_RDF}}}li")]
+
+
+def _set_bag(parent, tag, items):
+    for element in parent.findall(tag):
+        parent.remove(element)
+    bag = ET.SubElement(ET.SubElement(parent, tag), f"{{{NS_RDF}}}Bag")
+    for item in items:
+        ET.SubElement(bag, f"{{{NS_RDF}}}li").text = item
+
+
+def read_xmp_keywords(path):
+    """dc:subject keywords of an XMP sidecar, or [] if it does not exist."""
+    if not os.path.exists(path):
+        return []
+    description = ET.parse(path).getroot().find(f".//{{{NS_RDF}}}Description")
+    return _bag_items(description, f"{{{NS_DC}}}subject") if description is not None else []
+
+
+def write_xmp_keywords(path, keywords):
+    """
+    Sets the organizer's keywords in an XMP sidecar, creating it if needed. Keywords added by
+    other tools are kept; the ones this organizer wrote last time are replaced.
+    """
+    if os.path.exists(path):
+        tree = ET.parse(path)
+        root = tree.getroot()
+    else:
+        root = ET.Element(f"{{{NS_X}}}xmpmeta")
+        tree = ET.ElementTree(root)
+    rdf = root if root.tag == f"{{{NS_RDF}}}RDF" else root.find(f"{{{NS_RDF}}}RDF")
+    if rdf is None:
+        rdf = ET.SubElement(root, f"{{{NS_RDF}}}RDF")
+    description = rdf.find(f"{{{NS_RDF}}}Description")
+    if description is None:
+        description = ET.SubElement(rdf, f"{{{NS_RDF}}}Description", {f"{{{NS_RDF}}}about": ""})
+
+    previous_auto = set(_bag_items(description, f"{{{NS_ORGANIZER}}}keywords"))
+    kept = [k for k in _bag_items(description, f"{{{NS_DC}}}subject") if k not in previous_auto]
+    _set_bag(description, f"{{{NS_DC}}}subject", kept + [k for k in keywords if k not in kept])
+    _set_bag(description, f"{{{NS_ORGANIZER}}}keywords", list(keywords))
+
+    # Written next to the target and swapped in, so a crash never leaves a half-written sidecar
+    temp_path = path + ".tmp"
+    tree.write(temp_path, encoding="utf-8", xml_declaration=True)
+    os.replace(temp_path, path)
+
+
+def write_iptc_keywords(image_path, keywords):
+    with pyexiv2.Image(image_path) as image:
+        image.modify_iptc({"Iptc.Application2.Keywords": list(keywords)})
+
+
+class MetadataWriter:
+    """
+    Writes tags as keywords on a thread pool while the caller carries on moving files. Only a few
+    writes per thread are queued at once, so memory stays flat however many files are moved.
+
+    'xmp' writes a sidecar next to each file; 'iptc' embeds keywords into JPEG/TIFF files and
+    falls back to sidecars for everything else (and entirely when pyexiv2 is not installed).
+    """
+    def __init__(self, mode="xmp", max_workers=METADATA_WRITE_WORKERS, log_callback=None, metrics=None):
+        if mode not in METADATA_MODES or mode == "none":
+            raise ValueError(f"Unknown metadata mode '{mode}'. Expected 'xmp' or 'iptc'.")
+        self.log_callback = log_callback if log_callback else print_log
+        if mode == "iptc" and pyexiv2 is None:
+            self.log_callback("pyexiv2 is not installed; writing XMP sidecars instead of IPTC keywords.", 'warning')
+            mode = "xmp"
+        self.mode = mode
+        self.metrics = metrics
+        self.written_count = 0
+        self.error_count = 0
+        self.pending = 0
+        self._lock = threading.Lock()
+        # pyexiv2 does not promise thread safety, so embedded writes take turns; sidecars run in parallel
+        self._iptc_lock = threading.Lock()
+        # At most a few writes per thread are queued; submit() blocks beyond that
+        self._slots = threading.BoundedSemaphore(max_workers * 4)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metadata")
+
+    def submit(self, file_paths, tags_with_probs):
+        """
+        Queues keywords for one photo; file_paths are the photo and its paired files at their final
+        location. Without tags, only existing sidecars are touched (to drop stale keywords).
+        """
+        keywords = [tag for tag in (clean_tag(tag) for tag, _ in tags_with_probs) if tag]
+        self._slots.acquire()
+        with self._lock:
+            self.pending += 1
+        self._executor.submit(self._write_queued, list(file_paths), keywords)
+
+    def _write_queued(self, file_paths, keywords):
+        try:
+            self._write(file_paths, keywords)
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+    def _write(self, file_paths, keywords):
+        start = time.perf_counter()
+        targets = []
+        for file_path in file_paths:
+            if self.mode == "iptc" and file_path.lower().endswith(IPTC_EXTENSIONS):
+                targets.append(("iptc", file_path))
+            elif ("xmp", sidecar_path(file_path)) not in targets:
+                targets.append(("xmp", sidecar_path(file_path)))
+
+        written = 0
+        for kind, path in targets:
+            if not keywords and (kind == "iptc" or not os.path.exists(path)):
+                continue
+            try:
+                if kind == "iptc":
+                    with self._iptc_lock:
+                        write_iptc_keywords(path, keywords)
+                else:
+                    write_xmp_keywords(path, keywords)
+                written += 1
+            except Exception as e:
+                with self._lock:
+                    self.error_count += 1
+                self.log_callback(f"Error writing keywords to '{path}': {e}", 'error')
+        with self._lock:
+            self.written_count += written
+        if self.metrics is not None and written:
+            self.metrics.record_batch("metadata", time.perf_counter() - start, items=written)
+
+    def finish(self):
+        """Waits for every queued write. Returns the number of failed writes."""
+        self._executor.shutdown(wait=True)
+        return self.error_count
+
+
+def _raw_preview(rawpy, raw_path, preview_path, size):
+    # Decoded like the organizer's raw_only mode, then shrunk so the temporary JPG stays small
+    with rawpy.imread(raw_path) as raw:
+        img = Image.fromarray(raw.postprocess(use_camera_wb=True, no_auto_bright=True))
+    img.thumbnail((size, size), Image.LANCZOS)
+    img.save(preview_path)
+
+
+def retag_library(library_folder, image_tagger, mode="xmp", num_top_tags=5, tag_confidence_threshold=0.05,
+                  log=print):
+    """
+    Tags every image under library_folder again and rewrites its keywords in place; nothing is
+    moved or renamed. RAW files share the sidecar of their paired JPG; RAW files without one are
+    decoded with rawpy and tagged themselves, or skipped (and counted) when it is not installed.
+    """
+    image_paths = []
+    raw_paths = []
+    for root, dirs, files in os.walk(library_folder):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for file in files:
+            path = os.path.join(root, file)
+            if is_image_file(file):
+                image_paths.append(path)
+            elif is_raw_file(file) and not file.lower().endswith(".xmp") and find_paired_file(path, IMAGE_EXTENSIONS) is None:
+                raw_paths.append(path)
+
+    writer = MetadataWriter(mode, log_callback=lambda message, level='info': log(message))
+
+    def retag_batch(tag_paths, keyword_paths):
+        results = image_tagger.tag_images_batch(tag_paths, num_top_tags)
+        for path, tags in results.items():
+            writer.submit([keyword_paths[path]], [(tag, prob) for tag, prob in tags if prob >= tag_confidence_threshold])
+
+    for i in range(0, len(image_paths), RETAG_BATCH_SIZE):
+        batch = image_paths[i:i + RETAG_BATCH_SIZE]
+        retag_batch(batch, {path: path for path in batch})
+        log(f"Retagged {min(i + RETAG_BATCH_SIZE, len(image_paths))}/{len(image_paths)} images")
+
+    skipped = 0
+    if raw_paths:
+        # Imported here: the organizer (and rawpy) are only needed for RAW files without a JPG
+        from main_logic import import_rawpy, TARGET_RESIZE_DIM
+        rawpy = import_rawpy()
+        if rawpy is None:
+            skipped = len(raw_paths)
+            log(f"Skipped {skipped} RAW files without a JPG: rawpy is not installed (pip install rawpy)")
+        else:
+            temp_folder = tempfile.mkdtemp(prefix="retag_raw_")
+            try:
+                for i in range(0, len(raw_paths), RETAG_BATCH_SIZE):
+                    previews = {}
+                    for j, raw_path in enumerate(raw_paths[i:i + RETAG_BATCH_SIZE], start=i):
+                        preview_path = os.path.join(temp_folder, f"{j}.jpg")
+                        try:
+                            _raw_preview(rawpy, raw_path, preview_path, TARGET_RESIZE_DIM)
+                            previews[preview_path] = raw_path
+                        except Exception as e:
+                            skipped += 1
+                            log(f"Could not decode RAW '{raw_path}': {e}")
+                    if previews:
+                        retag_batch(list(previews), previews)
+                    for preview_path in previews:
+                        os.remove(preview_path)
+                    log(f"Retagged {min(i + RETAG_BATCH_SIZE, len(raw_paths))}/{len(raw_paths)} RAW files")
+            finally:
+                shutil.rmtree(temp_folder, ignore_errors=True)
+
+    errors = writer.finish()
+    log(f"Wrote keywords for {writer.written_count} files ({errors} errors, {skipped} RAW files skipped)")
+    return errors == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-tag an organized library in place by rewriting keywords (no files are moved).")
+    parser.add_argument("library", help="Folder to retag")
+    parser.add_argument("--mode", choices=("xmp", "iptc"), default="xmp", help="XMP sidecars or embedded IPTC keywords")
+    parser.add_argument("--tags-file", help="Custom tags, one per line (e.g. the app's custom_tags.txt)")
+    parser.add_argument("--vocabulary-file", help="Large tag vocabulary file")
+    parser.add_argument("-k", "--top-k", type=int, default=5, help="Most tags per image")
+    parser.add_argument("--threshold", type=float, default=0.05, help="Minimum tag confidence")
+    args = parser.parse_args(argv)
+
+    custom_tags = None
+    if args.tags_file:
+        with open(args.tags_file, 'r', encoding='utf-8') as f:
+            custom_tags = [line.strip() for line in f if line.strip()]
+
+    image_tagger = ImageTagger(custom_tags=custom_tags, vocabulary_file=args.vocabulary_file)
+    return 0 if retag_library(args.library, image_tagger, args.mode, args.top_k, args.threshold) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
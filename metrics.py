@@ -0,0 +1,217 @@
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# Seconds taken by the first import of heavy modules in this process, reported with every run's metrics
+IMPORT_SECONDS = {}
+_import_lock = threading.Lock()
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes, or None if it cannot be determined."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS reports bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, "peak_wset", memory_info.rss)
+    return None
+
+
+@contextmanager
+def timed_import(name):
+    """Records how long the first import of a module takes: `with timed_import("torch"): import torch`."""
+    already_loaded = name in sys.modules
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if not already_loaded and name in sys.modules:
+            with _import_lock:
+                IMPORT_SECONDS.setdefault(name, time.perf_counter() - start)
+
+
+def record_import_seconds(name, seconds):
+    with _import_lock:
+        IMPORT_SECONDS.setdefault(name, seconds)
+
+
+class StageStats:
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.wall_seconds = 0.0
+        self.busy_seconds = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.batches = 0
+        self.max_batch_seconds = 0.0
+        self.started_at = None
+
+    def elapsed(self):
+        running = time.perf_counter() - self.started_at if self.started_at is not None else 0.0
+        return (self.wall_seconds + running) or self.busy_seconds
+
+    def to_dict(self):
+        elapsed = self.elapsed()
+        return {
+            "unit": self.unit,
+            "seconds": round(elapsed, 4),
+            "busy_seconds": round(self.busy_seconds, 4),
+            "items": self.items,
+            "bytes": self.bytes,
+            "batches": self.batches,
+            "max_batch_seconds": round(self.max_batch_seconds, 4),
+            "items_per_sec": round(self.items / elapsed, 2) if elapsed else 0.0,
+            "mb_per_sec": round(self.bytes / elapsed / 1e6, 2) if elapsed else 0.0,
+        }
+
+
+class PipelineMetrics:
+    """
+    Thread-safe timings and throughput for each stage of an organization run.
+
+    Stages are timed with `with metrics.stage("tag", unit="images"):`, work inside them is
+    reported with record_batch(), and queue sizes with set_queue_depth().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.queue_depths = {}
+        self.current_stage = None
+        self.started_at = time.perf_counter()
+
+    def _get_stage(self, name, unit="files"):
+        if name not in self.stages:
+            self.stages[name] = StageStats(name, unit)
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name, unit="files"):
+        with self._lock:
+            stats = self._get_stage(name, unit)
+            stats.started_at = time.perf_counter()
+            self.current_stage = name
+        try:
+            yield stats
+        finally:
+            with self._lock:
+                stats.wall_seconds += time.perf_counter() - stats.started_at
+                stats.started_at = None
+                if self.current_stage == name:
+                    self.current_stage = None
+
+    def record_batch(self, name, seconds, items=1, nbytes=0, unit="files"):
+        with self._lock:
+            stats = self._get_stage(name, unit)
+            stats.busy_seconds += seconds
+            stats.items += items
+            stats.bytes += nbytes
+            stats.batches += 1
+            stats.max_batch_seconds = max(stats.max_batch_seconds, seconds)
+
+    @contextmanager
+    def timed_batch(self, name, items=1, nbytes=0, unit="files"):
+        """record_batch() for the enclosed block, for callers that know its size up front."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_batch(name, time.perf_counter() - start, items, nbytes, unit)
+
+    def set_queue_depth(self, name, depth):
+        with self._lock:
+            _, peak = self.queue_depths.get(name, (0, 0))
+            self.queue_depths[name] = (depth, max(peak, depth))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "total_seconds": round(time.perf_counter() - self.started_at, 4),
+                "peak_rss_bytes": peak_rss_bytes(),
+                "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+                "queue_depths": {name: {"current": current, "peak": peak}
+                                 for name, (current, peak) in self.queue_depths.items()},
+                "import_seconds": {name: round(seconds, 4) for name, seconds in IMPORT_SECONDS.items()},
+            }
+
+    def live_line(self):
+        """One-line status of the running stage, e.g. for a GUI label."""
+        with self._lock:
+            name = self.current_stage
+            stats = self.stages.get(name) if name else None
+            if stats is None:
+                return "Idle"
+            data = stats.to_dict()
+        line = f"{name}: {data['items']} {data['unit']} at {data['items_per_sec']:.1f} {data['unit']}/s"
+        if data["bytes"]:
+            line += f", {data['mb_per_sec']:.1f} MB/s"
+        rss = peak_rss_bytes()
+        if rss:
+            line += f" | peak RSS {rss / 1e6:.0f} MB"
+        return line
+
+    def summary_table(self):
+        snapshot = self.snapshot()
+        rows = [("stage", "seconds", "items", "items/s", "MB/s", "batches", "max batch s")]
+        for name, data in snapshot["stages"].items():
+            rows.append((name, f"{data['seconds']:.2f}", f"{data['items']} {data['unit']}",
+                         f"{data['items_per_sec']:.1f}", f"{data['mb_per_sec']:.1f}",
+                         str(data["batches"]), f"{data['max_batch_seconds']:.3f}"))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows]
+
+        lines.append(f"total {snapshot['total_seconds']:.2f}s")
+        if snapshot["peak_rss_bytes"]:
+            lines[-1] += f", peak RSS {snapshot['peak_rss_bytes'] / 1e6:.0f} MB"
+        for name, depths in snapshot["queue_depths"].items():
+            lines.append(f"queue '{name}': peak depth {depths['peak']}")
+        if snapshot["import_seconds"]:
+            lines.append("imports: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in snapshot["import_seconds"].items()))
+        return "\n".join(lines)
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix="photo_organizer"):
+        """Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, metric_type, samples):
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for labels, value in samples:
+                label_str = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_str}}} {value}" if label_str else f"{prefix}_{name} {value}")
+
+        stages = snapshot["stages"].items()
+        metric("stage_seconds", "gauge", [({"stage": name}, data["seconds"]) for name, data in stages])
+        metric("stage_items_total", "counter", [({"stage": name, "unit": data["unit"]}, data["items"]) for name, data in stages])
+        metric("stage_bytes_total", "counter", [({"stage": name}, data["bytes"]) for name, data in stages])
+        metric("stage_items_per_second", "gauge", [({"stage": name}, data["items_per_sec"]) for name, data in stages])
+        metric("queue_depth_peak", "gauge", [({"queue": name}, depths["peak"]) for name, depths in snapshot["queue_depths"].items()])
+        metric("run_seconds", "gauge", [({}, snapshot["total_seconds"])])
+        metric("import_seconds", "gauge", [({"module": name}, seconds) for name, seconds in snapshot["import_seconds"].items()])
+        if snapshot["peak_rss_bytes"]:
+            metric("peak_rss_bytes", "gauge", [({}, snapshot["peak_rss_bytes"])])
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Writes JSON for '.json' paths and Prometheus text for anything else."""
+        content = self.to_json() if path.lower().endswith(".json") else self.to_prometheus()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+from utils import is_image_file
+from image_tagger import ImageTagger
+
+
+INDEX_FOLDER_NAME = ".photo_index"
+EMBEDDINGS_FILE = "embeddings.f32"
+PATHS_FILE = "paths.txt"
+META_FILE = "meta.json"
+INDEX_BATCH_SIZE = 32
+
+class PhotoSearchIndex:
+    """
+    Persisted CLIP image-embedding index for an organized photo library.
+
+    Embeddings are stored as a flat float32 file and paths (relative to the library)
+    as one line per row, so new photos can be appended without rewriting the index.
+    """
+    def __init__(self, library_folder, load=True):
+        self.library_folder = library_folder
+        self.index_folder = os.path.join(library_folder, INDEX_FOLDER_NAME)
+        self.paths = []
+        self.embeddings = None
+        self.dim = None
+        self._pending_paths = []
+        self._pending_embeddings = []
+        self.added_count = 0
+        if load:
+            self.load()
+
+    def _index_file(self, name):
+        return os.path.join(self.index_folder, name)
+
+    def load(self):
+        self.paths = []
+        self.embeddings = None
+        self.dim = None
+
+        meta_path = self._index_file(META_FILE)
+        if not os.path.exists(meta_path):
+            return
+
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            self.dim = json.load(f)["dim"]
+
+        with open(self._index_file(PATHS_FILE), 'r', encoding='utf-8') as f:
+            paths = [line.rstrip("\n") for line in f if line.strip()]
+
+        raw = np.fromfile(self._index_file(EMBEDDINGS_FILE), dtype=np.float32)
+        embeddings = raw[:(raw.size // self.dim) * self.dim].reshape(-1, self.dim)
+
+        # An interrupted append can leave one file a row ahead of the other
+        row_count = min(len(paths), embeddings.shape[0])
+        paths = paths[:row_count]
+        embeddings = embeddings[:row_count]
+
+        # A path re-added later supersedes its earlier rows
+        latest_row = {path: i for i, path in enumerate(paths)}
+        if len(latest_row) != row_count:
+            keep = sorted(latest_row.values())
+            paths = [paths[i] for i in keep]
+            embeddings = embeddings[keep]
+
+        self.paths = paths
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.paths) + len(self._pending_paths)
+
+    def pending_count(self):
+        return len(self._pending_paths)
+
+    def add(self, file_path, embedding):
+        """Queues a photo for the index; call flush() to persist queued additions."""
+        rel_path = os.path.relpath(file_path, self.library_folder)
+        self._pending_paths.append(rel_path.replace(os.sep, "/"))
+        self._pending_embeddings.append(np.asarray(embedding, dtype=np.float32))
+
+    def flush(self, reload=True):
+        """Appends queued photos to the index files. With reload=False the in-memory index is not refreshed."""
+        if not self._pending_paths:
+            return 0
+
+        new_embeddings = np.vstack(self._pending_embeddings).astype(np.float32)
+        if self.dim is None and os.path.exists(self._index_file(META_FILE)):
+            with open(self._index_file(META_FILE), 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)["dim"]
+        if self.dim is None:
+            self.dim = new_embeddings.shape[1]
+        elif new_embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding size {new_embeddings.shape[1]} does not match index size {self.dim}")
+
+        os.makedirs(self.index_folder, exist_ok=True)
+        with open(self._index_file(EMBEDDINGS_FILE), 'ab') as f:
+            new_embeddings.tofile(f)
+        with open(self._index_file(PATHS_FILE), 'a', encoding='utf-8') as f:
+            for rel_path in self._pending_paths:
+                f.write(rel_path + "\n")
+        with open(self._index_file(META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"dim": self.dim}, f)
+
+        added = len(self._pending_paths)
+        self.added_count += added
+        self._pending_paths = []
+        self._pending_embeddings = []
+        if reload:
+            self.load()
+        return added
+
+    def clear(self):
+        for name in (EMBEDDINGS_FILE, PATHS_FILE, META_FILE):
+            if os.path.exists(self._index_file(name)):
+                os.remove(self._index_file(name))
+        self._pending_paths = []
+        self._pending_embeddings = []
+        self.load()
+
+    def search(self, query_embedding, top_k=10):
+        """Returns [(absolute_path, score), ...] for the top_k most similar photos, best first."""
+        if self.embeddings is None or not len(self.paths):
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        scores = self.embeddings @ query
+
+        top_k = min(top_k, scores.shape[0])
+        top_indices = np.argpartition(-scores, top_k - 1)[:top_k]
+        top_indices = top_indices[np.argsort(-scores[top_indices])]
+
+        return [
+            (os.path.join(self.library_folder, *self.paths[idx].split("/")), float(scores[idx]))
+            for idx in top_indices
+        ]
+
+
+def rebuild_index(library_folder, image_tagger, log=print):
+    """Re-indexes every image under library_folder from scratch."""
+    index = PhotoSearchIndex(library_folder)
+    index.clear()
+
+    image_paths = []
+    for root, dirs, files in os.walk(library_folder):
+        dirs[:] = [d for d in dirs if d != INDEX_FOLDER_NAME]
+        for file in files:
+            if is_image_file(file):
+                image_paths.append(os.path.join(root, file))
+
+    for i in range(0, len(image_paths), INDEX_BATCH_SIZE):
+        paths, embeddings = image_tagger.embed_images(image_paths[i:i + INDEX_BATCH_SIZE])
+        for path, embedding in zip(paths, embeddings if embeddings is not None else []):
+            index.add(path, embedding)
+        # Appended only; reloading after every batch would make the rebuild quadratic
+        index.flush(reload=False)
+        log(f"Indexed {min(i + INDEX_BATCH_SIZE, len(image_paths))}/{len(image_paths)} images")
+
+    index.load()
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search an organized photo library with a free-text query.")
+    parser.add_argument("library", help="Destination folder that was organized by the app")
+    parser.add_argument("query", nargs="?", help="Free-text description, e.g. 'dog on a beach at sunset'")
+    parser.add_argument("-k", "--top-k", type=int, default=10, help="Number of results to show")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index every image in the library")
+    args = parser.parse_args(argv)
+
+    if not args.rebuild and not args.query:
+        parser.error("a query is required unless --rebuild is given")
+
+    image_tagger = ImageTagger()
+
+    if args.rebuild:
+        index = rebuild_index(args.library, image_tagger)
+    else:
+        index = PhotoSearchIndex(args.library)
+
+    if not args.query:
+        return 0
+
+    if not len(index):
+        print(f"No search index found in '{args.library}'. Run with --rebuild first.")
+        return 1
+
+    start = time.perf_counter()
+    query_embedding = image_tagger.encode_text([args.query])[0]
+    results = index.search(query_embedding, args.top_k)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    for path, score in results:
+        print(f"{score:.3f}  {path}")
+    print(f"{len(results)} results from {len(index)} photos in {elapsed_ms:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+from utils import print_log, is_image_file, is_raw_file
+
+
+PREVIEW_FOLDER_NAME = ".photo_previews"
+PREVIEW_SIZES = (256, 1024)
+DEFAULT_PREVIEW_CACHE_MB = 2048
+PREVIEW_WRITE_WORKERS = 4
+# Bytes hashed from the end of a file to key its previews
+KEY_SAMPLE_BYTES = 256 * 1024
+# A full cache is trimmed to this fraction of its limit, so trimming does not run after every photo
+TRIM_TARGET = 0.9
+PREVIEW_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp"}
+# WebP previews are about a third smaller but take several times longer to encode than JPEG
+DEFAULT_PREVIEW_FORMAT = "jpeg"
+
+
+def preview_key(file_path):
+    """
+    Content key of a photo: a hash of its last KEY_SAMPLE_BYTES. Keywords and EXIF live at the
+    start of JPEG/TIFF files, so moving, renaming or writing keywords into a photo keeps its key.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - KEY_SAMPLE_BYTES))
+        return hashlib.blake2b(f.read(KEY_SAMPLE_BYTES), digest_size=16).hexdigest()
+
+
+class PreviewCache:
+    """
+    Persistent previews of photos at PREVIEW_SIZES (long side in pixels), keyed by preview_key().
+
+    Files live in cache_folder/<2 hex chars>/<key>_<size>.jpg (or .webp); either format is read.
+    get() refreshes a preview's modification time, and trim() deletes the least recently used
+    previews once the cache exceeds max_mb. Previews are encoded on a small thread pool.
+    """
+    def __init__(self, cache_folder, max_mb=DEFAULT_PREVIEW_CACHE_MB, sizes=PREVIEW_SIZES,
+                 preview_format=DEFAULT_PREVIEW_FORMAT, max_workers=PREVIEW_WRITE_WORKERS, log_callback=None, metrics=None):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_mb * 1024 * 1024
+        self.sizes = tuple(sorted(sizes, reverse=True))
+        self.log_callback = log_callback if log_callback else print_log
+        if preview_format == "webp" and not features.check("webp"):
+            self.log_callback("This Pillow build cannot write WebP; caching JPEG previews instead.", 'warning')
+            preview_format = "jpeg"
+        self.preview_format = preview_format
+        self.metrics = metrics
+        self.written_count = 0
+        self.added_bytes = 0
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers * 4)
+        self._executor = None
+        self._max_workers = max_workers
+
+    def path_for(self, key, size, preview_format=None):
+        extension = PREVIEW_EXTENSIONS[preview_format or self.preview_format]
+        return os.path.join(self.cache_folder, key[:2], f"{key}_{size}{extension}")
+
+    def has(self, key):
+        return all(os.path.exists(self.path_for(key, size)) for size in self.sizes)
+
+    def get(self, key, size):
+        """Path of the smallest cached preview at least size pixels long (else the largest), or None."""
+        candidates = [s for s in reversed(self.sizes) if s >= size] + list(self.sizes)
+        for candidate in candidates:
+            for preview_format in PREVIEW_EXTENSIONS:
+                path = self.path_for(key, candidate, preview_format)
+                try:
+                    os.utime(path) # Marks the preview as recently used
+                    return path
+                except OSError:
+                    continue
+        return None
+
+    def get_for_file(self, file_path, size):
+        try:
+            return self.get(preview_key(file_path), size)
+        except OSError:
+            return None
+
+    def draft_size(self, image_size):
+        """Largest preview size of an image with the same aspect ratio, e.g. for Image.draft()."""
+        scale = min(1.0, self.sizes[0] / max(image_size))
+        return (max(1, round(image_size[0] * scale)), max(1, round(image_size[1] * scale)))
+
+    def _preview_image(self, image):
+        # Upright, RGB and at most the largest preview size; never the caller's image object
+        preview = ImageOps.exif_transpose(image)
+        if preview is image:
+            preview = image.copy()
+        if preview.mode not in ("RGB", "L"):
+            preview = preview.convert("RGB")
+        preview.thumbnail((self.sizes[0], self.sizes[0]), Image.LANCZOS)
+        return preview
+
+    def submit(self, key, image):
+        """
+        Queues previews of an already decoded image, which is left unchanged; the caller may
+        keep shrinking it in place. Encoding happens on the pool.
+        """
+        preview = self._preview_image(image)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="previews")
+        self._slots.acquire()
+        with self._lock:
+            self.pending += 1
+        self._executor.submit(self._write_queued, key, preview)
+
+    def add(self, key, image):
+        """Writes previews of an image right away."""
+        self._write(key, self._preview_image(image))
+
+    def _write_queued(self, key, preview):
+        try:
+            self._write(key, preview)
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+    def _write(self, key, preview):
+        start = time.perf_counter()
+        written = 0
+        try:
+            os.makedirs(os.path.dirname(self.path_for(key, 0)), exist_ok=True)
+            for size in self.sizes: # Largest first, each one shrunk from the previous
+                preview.thumbnail((size, size), Image.LANCZOS)
+                path = self.path_for(key, size)
+                temp_path = path + ".tmp"
+                if self.preview_format == "webp":
+                    preview.save(temp_path, "WEBP", quality=80, method=2)
+                else:
+                    preview.save(temp_path, "JPEG", quality=85)
+                os.replace(temp_path, path)
+                written += os.path.getsize(path)
+            with self._lock:
+                self.written_count += 1
+                self.added_bytes += written
+        except Exception as e:
+            self.log_callback(f"Error writing preview '{key}': {e}", 'error')
+        if self.metrics is not None and written:
+            self.metrics.record_batch("previews", time.perf_counter() - start, nbytes=written, unit="images")
+
+    def finish(self):
+        """Waits for queued previews, then trims the cache to its size limit."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return self.trim()
+
+    def trim(self):
+        """Deletes least recently used previews while the cache is over its limit. Returns the bytes freed."""
+        if not os.path.isdir(self.cache_folder):
+            return 0
+        entries = []
+        total = 0
+        for shard in os.scandir(self.cache_folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return 0
+
+        entries.sort()
+        target = self.max_bytes * TRIM_TARGET
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= target:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+        self.log_callback(f"Preview cache trimmed by {freed / (1024 * 1024):.1f} MB to stay under {self.max_bytes // (1024 * 1024)} MB.", 'info')
+        return freed
+
+
+def library_photos(library_folder):
+    """
+    Photos under library_folder, each as the list of its files sharing a base name (a JPG and its
+    RAW), non-RAW file first. Hidden folders such as the preview cache are skipped.
+    """
+    photos = {}
+    for root, dirs, files in os.walk(library_folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file in sorted(files):
+            # Sidecars count as RAW files elsewhere, but are never photos
+            if file.lower().endswith(".xmp") or not (is_image_file(file) or is_raw_file(file)):
+                continue
+            path = os.path.join(root, file)
+            photos.setdefault(os.path.splitext(path)[0], []).append(path)
+    return [sorted(paths, key=is_raw_file) for paths in photos.values()]
+
+
+def find_preview(cache, photo_files, size):
+    """
+    Path of a cached preview for one photo, or None. A missing preview is made from the photo's
+    non-RAW file if it has one; RAW files are never decoded here.
+    """
+    for file_path in photo_files:
+        path = cache.get_for_file(file_path, size)
+        if path is not None:
+            return path
+    for file_path in photo_files:
+        if is_raw_file(file_path):
+            continue
+        try:
+            key = preview_key(file_path)
+            with Image.open(file_path) as img:
+                img.draft(None, cache.draft_size(img.size))
+                cache.add(key, img)
+            return cache.get(key, size)
+        except Exception as e:
+            cache.log_callback(f"Could not make a preview of '{file_path}': {e}", 'warning')
+    return None
@@ -0,0 +1,97 @@
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+
+TAG_BANK_FOLDER = "tag_bank_cache"
+TEXT_ENCODE_CHUNK_SIZE = 256
+
+
+def load_vocabulary_file(path):
+    """Reads one tag per line, skipping blank lines and '#' comments."""
+    tags = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            tag = line.strip()
+            if tag and not tag.startswith("#"):
+                tags.append(tag)
+    return tags
+
+
+def _bank_key(model_name, tags):
+    digest = hashlib.sha1(model_name.encode("utf-8"))
+    for tag in tags:
+        digest.update(b"\n")
+        digest.update(tag.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TagEmbeddingBank:
+    """
+    L2-normalized text embeddings for a tag vocabulary, one row per tag.
+
+    Banks are cached on disk as float16 .npy files keyed by model and tag list, and
+    memory-mapped on load so even very large vocabularies open instantly.
+    """
+    def __init__(self, tags, embeddings):
+        self.tags = tags
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.tags)
+
+    @classmethod
+    def load_or_build(cls, tags, encode_text, model_name, cache_folder=TAG_BANK_FOLDER,
+                      chunk_size=TEXT_ENCODE_CHUNK_SIZE, log=None):
+        """
+        encode_text(list_of_strings) must return normalized float32 embeddings, one row per string.
+        """
+        bank_path = os.path.join(cache_folder, _bank_key(model_name, tags) + ".npy")
+        bank = cls._load_cached(tags, bank_path)
+        if bank is not None:
+            return bank
+
+        if log:
+            log(f"Encoding {len(tags)} tags into embedding bank '{bank_path}'...", level='info')
+
+        os.makedirs(cache_folder, exist_ok=True)
+        # A temp file of its own, since several processes (e.g. local tagging workers) may build the same bank
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(bank_path) + ".", suffix=".tmp.npy", dir=cache_folder)
+        os.close(fd)
+        try:
+            embeddings = None
+            for start in range(0, len(tags), chunk_size):
+                chunk_embeddings = encode_text(tags[start:start + chunk_size])
+                if embeddings is None:
+                    embeddings = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float16,
+                                                           shape=(len(tags), chunk_embeddings.shape[1]))
+                embeddings[start:start + chunk_embeddings.shape[0]] = chunk_embeddings
+
+            if embeddings is None:
+                return cls(tags, np.zeros((0, 0), dtype=np.float16))
+
+            embeddings.flush()
+            del embeddings
+            # Another process may have finished the same bank meanwhile; keep its copy
+            bank = cls._load_cached(tags, bank_path)
+            if bank is not None:
+                return bank
+            os.replace(temp_path, bank_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return cls(tags, np.load(bank_path, mmap_mode='r'))
+
+    @classmethod
+    def _load_cached(cls, tags, bank_path):
+        """The bank at bank_path if it exists and matches the tags, else None."""
+        if not os.path.exists(bank_path):
+            return None
+        try:
+            embeddings = np.load(bank_path, mmap_mode='r')
+            if embeddings.shape[0] == len(tags):
+                return cls(tags, embeddings)
+        except Exception:
+            pass
+        return None
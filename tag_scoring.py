@@ -0,0 +1,198 @@
+import os
+import json
+import numpy as np
+
+
+TAG_SCORING_FILE = "tag_scoring.json"
+SCORING_MODES = ("softmax", "grouped", "sigmoid")
+DEFAULT_SCORING_MODE = "softmax"
+
+# Sigmoid calibration: a tag is 50% likely when its cosine similarity equals 'bias',
+# and 'scale' controls how quickly the probability rises around that point.
+DEFAULT_SIGMOID_BIAS = 0.25
+DEFAULT_SIGMOID_SCALE = 50.0
+
+DEFAULT_GROUP = "default"
+
+# Tags scored per matrix-multiply block; bounds scoring memory for very large vocabularies
+SCORE_BLOCK_SIZE = 4096
+
+
+def load_tag_scoring_config(path=TAG_SCORING_FILE):
+    """
+    Loads tag groups and per-tag calibration from a JSON file, e.g.
+    {"mode": "grouped",
+     "groups": {"lighting": ["a photo of Bright", "a photo of Dark"]},
+     "calibration": {"a photo of Dark": {"bias": 0.23, "scale": 60}}}
+    Returns an empty config if the file does not exist.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    mode = config.get("mode")
+    if mode is not None and mode not in SCORING_MODES:
+        raise ValueError(f"Unknown tag scoring mode '{mode}' in '{path}'. Expected one of {SCORING_MODES}.")
+    return config
+
+
+class TagScorer:
+    """
+    Turns image/tag cosine similarities into per-tag probabilities.
+
+    softmax: one softmax over every tag (the original behaviour).
+    grouped: an independent softmax per tag group, so adding tags to one group
+             does not dilute the probabilities of another.
+    sigmoid: an independent, calibrated sigmoid per tag, so probabilities do not
+             depend on vocabulary size at all.
+    """
+    def __init__(self, candidate_tags, mode=DEFAULT_SCORING_MODE, groups=None, calibration=None):
+        if mode not in SCORING_MODES:
+            raise ValueError(f"Unknown tag scoring mode '{mode}'. Expected one of {SCORING_MODES}.")
+        self.mode = mode
+        self.candidate_tags = list(candidate_tags)
+
+        tag_index = {tag: i for i, tag in enumerate(self.candidate_tags)}
+
+        # Tags not listed in any group share the default group
+        self.group_names = [DEFAULT_GROUP]
+        self.tag_group = np.zeros(len(self.candidate_tags), dtype=np.int32)
+        for group_name, group_tags in (groups or {}).items():
+            group_id = len(self.group_names)
+            self.group_names.append(group_name)
+            for tag in group_tags:
+                if tag in tag_index:
+                    self.tag_group[tag_index[tag]] = group_id
+
+        # Softmax normalization groups: the tag groups in grouped mode, a single group otherwise
+        if mode == "grouped":
+            self.normalizer_group, self.num_normalizer_groups = self.tag_group, len(self.group_names)
+        else:
+            self.normalizer_group, self.num_normalizer_groups = np.zeros_like(self.tag_group), 1
+
+        self.sigmoid_bias = np.full(len(self.candidate_tags), DEFAULT_SIGMOID_BIAS, dtype=np.float32)
+        self.sigmoid_scale = np.full(len(self.candidate_tags), DEFAULT_SIGMOID_SCALE, dtype=np.float32)
+        for tag, params in (calibration or {}).items():
+            if tag in tag_index:
+                self.sigmoid_bias[tag_index[tag]] = params.get("bias", DEFAULT_SIGMOID_BIAS)
+                self.sigmoid_scale[tag_index[tag]] = params.get("scale", DEFAULT_SIGMOID_SCALE)
+
+    @classmethod
+    def from_config(cls, candidate_tags, config, mode=None):
+        return cls(
+            candidate_tags,
+            mode=mode or config.get("mode", DEFAULT_SCORING_MODE),
+            groups=config.get("groups"),
+            calibration=config.get("calibration"),
+        )
+
+    def probabilities(self, similarities, logit_scale):
+        """
+        similarities: (num_images, num_tags) cosine similarities. Returns float32 probabilities of the same shape.
+        Reference for score_blocked(), which is what tagging uses; it needs the full similarity matrix.
+        """
+        similarities = np.asarray(similarities, dtype=np.float32)
+
+        if self.mode == "sigmoid":
+            return 1.0 / (1.0 + np.exp(-self.sigmoid_scale * (similarities - self.sigmoid_bias)))
+
+        logits = logit_scale * similarities
+        if self.mode == "softmax":
+            logits = logits - logits.max(axis=1, keepdims=True)
+            exp_logits = np.exp(logits)
+            return exp_logits / exp_logits.sum(axis=1, keepdims=True)
+
+        return self._grouped_softmax(logits)
+
+    def _grouped_softmax(self, logits):
+        num_images = logits.shape[0]
+        num_groups = len(self.group_names)
+
+        group_max = np.full((num_groups, num_images), -np.inf, dtype=np.float32)
+        np.maximum.at(group_max, self.tag_group, logits.T)
+        exp_logits = np.exp(logits - group_max.T[:, self.tag_group])
+
+        group_sum = np.zeros((num_groups, num_images), dtype=np.float32)
+        np.add.at(group_sum, self.tag_group, exp_logits.T)
+        return exp_logits / group_sum.T[:, self.tag_group]
+
+    def _group_log_normalizers(self, image_embeds, tag_embeddings, logit_scale, block_size):
+        # Streaming log-sum-exp per group, one block of tags at a time
+        num_images = image_embeds.shape[0]
+        num_groups = self.num_normalizer_groups
+        group_max = np.full((num_groups, num_images), -np.inf, dtype=np.float32)
+        group_sum = np.zeros((num_groups, num_images), dtype=np.float32)
+
+        for start in range(0, tag_embeddings.shape[0], block_size):
+            block = np.asarray(tag_embeddings[start:start + block_size], dtype=np.float32)
+            logits = logit_scale * (image_embeds @ block.T)
+            block_groups = self.normalizer_group[start:start + block.shape[0]]
+
+            block_max = np.full_like(group_max, -np.inf)
+            np.maximum.at(block_max, block_groups, logits.T)
+            new_max = np.maximum(group_max, block_max)
+            finite = np.isfinite(new_max)
+            group_sum *= np.exp(np.where(finite, group_max - np.where(finite, new_max, 0), 0))
+            np.add.at(group_sum, block_groups, np.exp(logits - new_max.T[:, block_groups]).T)
+            group_max = new_max
+
+        with np.errstate(divide='ignore'):
+            return (group_max + np.log(group_sum)).T
+
+    def _block_probabilities(self, similarities, start, logit_scale, log_normalizers):
+        end = start + similarities.shape[1]
+        if self.mode == "sigmoid":
+            return 1.0 / (1.0 + np.exp(-self.sigmoid_scale[start:end] * (similarities - self.sigmoid_bias[start:end])))
+        return np.exp(logit_scale * similarities - log_normalizers[:, self.normalizer_group[start:end]])
+
+    def score_blocked(self, image_embeds, tag_embeddings, logit_scale, k, block_size=SCORE_BLOCK_SIZE, crops_per_image=1):
+        """
+        Same result as top_k(probabilities(image_embeds @ tag_embeddings.T)), but the tag matrix is
+        processed block by block so only (num_images, block_size) scores exist at any time.
+        tag_embeddings may be a memory-mapped array. Returns (indices, values) like top_k.
+        With crops_per_image > 1, consecutive rows are crops of one image and each tag keeps
+        its highest crop probability.
+        """
+        image_embeds = np.asarray(image_embeds, dtype=np.float32)
+        num_images = image_embeds.shape[0] // crops_per_image
+
+        log_normalizers = None
+        if self.mode != "sigmoid":
+            log_normalizers = self._group_log_normalizers(image_embeds, tag_embeddings, logit_scale, block_size)
+
+        best_indices = np.empty((num_images, 0), dtype=np.int64)
+        best_values = np.empty((num_images, 0), dtype=np.float32)
+        for start in range(0, tag_embeddings.shape[0], block_size):
+            block = np.asarray(tag_embeddings[start:start + block_size], dtype=np.float32)
+            probs = self._block_probabilities(image_embeds @ block.T, start, logit_scale, log_normalizers)
+            if crops_per_image > 1:
+                probs = probs.reshape(num_images, crops_per_image, -1).max(axis=1)
+
+            block_indices, block_values = self.top_k(probs, k)
+            best_indices, best_values = self._merge_top_k(
+                best_indices, best_values, block_indices + start, block_values, k)
+
+        return best_indices, best_values
+
+    @classmethod
+    def _merge_top_k(cls, indices_a, values_a, indices_b, values_b, k):
+        values = np.concatenate([values_a, values_b.astype(np.float32)], axis=1)
+        indices = np.concatenate([indices_a, indices_b], axis=1)
+        order, merged_values = cls.top_k(values, k)
+        return np.take_along_axis(indices, order, axis=1), merged_values
+
+    @staticmethod
+    def top_k(probs, k):
+        """
+        Vectorized top-k over a whole batch. Returns (indices, values), each (num_images, k),
+        sorted by descending probability.
+        """
+        k = min(k, probs.shape[1])
+        if k <= 0:
+            empty = np.empty((probs.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(probs.dtype)
+
+        top_indices = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+        top_values = np.take_along_axis(probs, top_indices, axis=1)
+        order = np.argsort(-top_values, axis=1)
+        return np.take_along_axis(top_indices, order, axis=1), np.take_along_axis(top_values, order, axis=1)
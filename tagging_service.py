@@ -0,0 +1,376 @@
+import sys
+import json
+import time
+import queue
+import socket
+import ipaddress
+import struct
+import argparse
+import threading
+import subprocess
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from utils import print_log
+
+
+DEFAULT_PORT = 5701
+FRAME_HEADER = struct.Struct("!II") # JSON header length, payload length
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+CONNECT_TIMEOUT = 10.0
+
+
+def send_frame(sock, header, payload=b""):
+    """Sends one message: a JSON header followed by an optional raw binary payload."""
+    header_bytes = json.dumps(header).encode("utf-8")
+    sock.sendall(FRAME_HEADER.pack(len(header_bytes), len(payload)) + header_bytes)
+    if payload:
+        sock.sendall(payload)
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            raise ConnectionError("Connection closed by peer")
+        received += count
+    return buffer
+
+
+def recv_frame(sock):
+    """Returns (header, payload) for the next message, or (None, None) if the peer closed the connection."""
+    try:
+        header_size, payload_size = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    except ConnectionError:
+        return None, None
+    header = json.loads(_recv_exact(sock, header_size).decode("utf-8"))
+    payload = _recv_exact(sock, payload_size) if payload_size else b""
+    return header, payload
+
+
+def _attach_shared_memory(name):
+    # The client owns the block; this process's resource tracker must not unlink it on exit
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: # Python < 3.13
+        block = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+
+def _is_loopback(host):
+    try:
+        address = ipaddress.ip_address(host.split("%")[0])
+    except ValueError:
+        return False
+    mapped = getattr(address, "ipv4_mapped", None) # ::ffff:127.0.0.1
+    return address.is_loopback or (mapped is not None and mapped.is_loopback)
+
+
+class TaggingRequestHandler(socketserver.BaseRequestHandler):
+    """Serves one client connection until it closes."""
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        attached = {}
+        try:
+            while True:
+                header, payload = recv_frame(self.request)
+                if header is None:
+                    break
+                try:
+                    reply, reply_payload = self._dispatch(header, payload, attached)
+                except Exception as e:
+                    reply, reply_payload = {"ok": False, "error": str(e)}, b""
+                send_frame(self.request, reply, reply_payload)
+        finally:
+            for block in attached.values():
+                block.close()
+
+    def _dispatch(self, header, payload, attached):
+        tagger = self.server.image_tagger
+        op = header.get("op")
+        if op == "info":
+            return {"ok": True, "candidate_tags": tagger.candidate_tags, "scoring_mode": tagger.scorer.mode}, b""
+        if op != "tag":
+            raise ValueError(f"Unknown operation '{op}'")
+
+        shape = tuple(header["shape"])
+        if header.get("shm"):
+            # Only a client on this machine can share memory; a remote one must not name local blocks
+            if not _is_loopback(self.client_address[0]):
+                raise PermissionError("Shared memory is only accepted from local clients")
+            name = header["shm"]
+            if name not in attached:
+                # A new name means the client replaced its block (e.g. with a bigger one)
+                for block in attached.values():
+                    block.close()
+                attached.clear()
+                attached[name] = _attach_shared_memory(name)
+            # Copied out so the client may reuse the block as soon as the reply is sent
+            pixel_values = np.ndarray(shape, dtype=np.float32, buffer=attached[name].buf).copy()
+        else:
+            pixel_values = np.frombuffer(payload, dtype=np.float32).reshape(shape)
+
+        with self.server.inference_lock:
+            top_indices, top_probs, embeds = tagger.score_pixel_values(
+                pixel_values, header.get("num_top_tags", 5), header.get("num_crops", 1))
+
+        reply = {"ok": True, "top_indices": top_indices.tolist(), "top_probs": top_probs.tolist()}
+        if not header.get("return_embeddings"):
+            return reply, b""
+        reply["embeddings_shape"] = list(embeds.shape)
+        return reply, np.ascontiguousarray(embeds, dtype=np.float32).tobytes()
+
+
+class TaggingServer(socketserver.ThreadingTCPServer):
+    """
+    Tagging worker: owns one loaded ImageTagger and answers tag requests for preprocessed
+    pixel batches. Several clients may connect; inference itself runs one batch at a time.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, image_tagger):
+        self.image_tagger = image_tagger
+        self.inference_lock = threading.Lock()
+        super().__init__(address, TaggingRequestHandler)
+
+
+class WorkerConnection:
+    """A client connection to one tagging worker, with an optional shared-memory block for pixel data."""
+
+    def __init__(self, address, use_shared_memory=False, timeout=None):
+        self.address = address
+        self.use_shared_memory = use_shared_memory
+        self.sock = socket.create_connection(address, timeout=CONNECT_TIMEOUT)
+        self.sock.settimeout(timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.shm = None
+
+    def request(self, header, payload=b""):
+        send_frame(self.sock, header, payload)
+        reply, reply_payload = recv_frame(self.sock)
+        if reply is None:
+            raise ConnectionError(f"Tagging worker {self.describe()} closed the connection")
+        if not reply.get("ok"):
+            raise RuntimeError(f"Tagging worker {self.describe()}: {reply.get('error')}")
+        return reply, reply_payload
+
+    def _shared_block(self, nbytes):
+        if self.shm is None or self.shm.size < nbytes:
+            self._release_shared_memory()
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        return self.shm
+
+    def tag(self, pixel_values, num_top_tags, num_crops, return_embeddings):
+        """Returns (top_indices, top_probs, embeddings or None) for one preprocessed batch."""
+        header = {"op": "tag", "shape": list(pixel_values.shape), "num_top_tags": num_top_tags,
+                  "num_crops": num_crops, "return_embeddings": return_embeddings}
+        payload = b""
+        if self.use_shared_memory:
+            block = self._shared_block(pixel_values.nbytes)
+            np.ndarray(pixel_values.shape, dtype=np.float32, buffer=block.buf)[...] = pixel_values
+            header["shm"] = block.name
+        else:
+            payload = np.ascontiguousarray(pixel_values, dtype=np.float32).tobytes()
+
+        reply, reply_payload = self.request(header, payload)
+        embeds = None
+        if return_embeddings:
+            embeds = np.frombuffer(reply_payload, dtype=np.float32).reshape(reply["embeddings_shape"])
+        return np.array(reply["top_indices"], dtype=np.int64), np.array(reply["top_probs"], dtype=np.float32), embeds
+
+    def describe(self):
+        return f"{self.address[0]}:{self.address[1]}"
+
+    def _release_shared_memory(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        self._release_shared_memory()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def parse_worker_address(text, default_port=DEFAULT_PORT):
+    """'host:port', 'host', ':port' or '[ipv6]:port' -> (host, port)."""
+    text = text.strip()
+    if text.startswith("["): # [IPv6]:port
+        host, _, port = text[1:].partition("]")
+        port = port.lstrip(":")
+    elif text.count(":") == 1:
+        host, port = text.split(":")
+    else:
+        host, port = text, ""
+    return (host or "127.0.0.1"), int(port) if port else default_port
+
+
+class RemoteTaggerPool:
+    """
+    Drop-in replacement for ImageTagger that sends batches to tagging workers.
+
+    Images are loaded and CLIP-preprocessed here; only pixel arrays travel to the workers (through
+    shared memory for workers on this machine) and only top tags and embeddings come back. With
+    tag_batches() every worker has one batch in flight at a time, so throughput grows with the
+    number of workers.
+    """
+    def __init__(self, worker_addresses, use_shared_memory="auto", timeout=None, log_callback=None):
+        from transformers import CLIPProcessor
+        from image_tagger import CLIP_MODEL_NAME
+        from tag_scoring import TagScorer
+
+        self.log_callback = log_callback if log_callback else print_log
+        if isinstance(worker_addresses, str):
+            worker_addresses = [a for a in worker_addresses.split(",") if a.strip()]
+        addresses = [parse_worker_address(a) if isinstance(a, str) else tuple(a) for a in worker_addresses]
+        if not addresses:
+            raise ValueError("At least one tagging worker address is required")
+
+        self.connections = []
+        try:
+            for host, port in addresses:
+                shared = host in LOCAL_HOSTS if use_shared_memory == "auto" else bool(use_shared_memory)
+                self.connections.append(WorkerConnection((host, port), use_shared_memory=shared, timeout=timeout))
+            infos = [connection.request({"op": "info"})[0] for connection in self.connections]
+        except Exception:
+            self.close()
+            raise
+
+        self.candidate_tags = infos[0]["candidate_tags"]
+        for connection, info in zip(self.connections[1:], infos[1:]):
+            if info["candidate_tags"] != self.candidate_tags or info["scoring_mode"] != infos[0]["scoring_mode"]:
+                self.close()
+                raise ValueError(f"Tagging worker {connection.describe()} uses different tags or scoring than "
+                                 f"{self.connections[0].describe()}")
+        self.scorer = TagScorer(self.candidate_tags, mode=infos[0]["scoring_mode"])
+        self.processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+
+        self._idle = queue.Queue()
+        for connection in self.connections:
+            self._idle.put(connection)
+        self.log_callback(f"Connected to {len(self.connections)} tagging worker(s): "
+                          + ", ".join(connection.describe() for connection in self.connections), 'info')
+
+    def tag_images_batch(self, image_paths, num_top_tags=5, return_embeddings=False, num_crops=1):
+        """Same contract as ImageTagger.tag_images_batch, run on whichever worker is free."""
+        from image_tagger import preprocess_image_paths, format_tag_results
+
+        original_paths, pixel_values = preprocess_image_paths(self.processor, image_paths, num_crops)
+        if pixel_values is None:
+            return ({}, {}) if return_embeddings else {}
+
+        connection = self._idle.get()
+        try:
+            top_indices, top_probs, embeds = connection.tag(pixel_values, num_top_tags, num_crops, return_embeddings)
+        finally:
+            self._idle.put(connection)
+        return format_tag_results(self.candidate_tags, original_paths, top_indices, top_probs, embeds,
+                                  num_crops, return_embeddings)
+
+    def tag_batches(self, batches, num_top_tags=5, return_embeddings=False, num_crops=1):
+        """
+        Yields (batch, result) in input order while keeping every worker busy. Preprocessing of
+        upcoming batches overlaps with inference. A failed batch yields its exception as the result.
+        """
+        batches = list(batches)
+        executor = ThreadPoolExecutor(max_workers=len(self.connections), thread_name_prefix="tag-client")
+        try:
+            futures = [executor.submit(self.tag_images_batch, batch, num_top_tags, return_embeddings, num_crops)
+                       for batch in batches]
+            for batch, future in zip(batches, futures):
+                try:
+                    yield batch, future.result()
+                except Exception as e:
+                    yield batch, e
+        finally:
+            # Reached early when the consumer stops (e.g. on cancel): drop batches not yet started
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+
+
+def serve(host, port, custom_tags=None, scoring_mode=None, vocabulary_file=None, threads=None):
+    import torch
+    from image_tagger import ImageTagger
+
+    if threads:
+        torch.set_num_threads(threads)
+    image_tagger = ImageTagger(custom_tags=custom_tags, scoring_mode=scoring_mode, vocabulary_file=vocabulary_file)
+    with TaggingServer((host, port), image_tagger) as server:
+        print(f"[INFO] Tagging worker listening on {host}:{port} with {len(image_tagger.candidate_tags)} tags", flush=True)
+        server.serve_forever()
+
+
+def spawn_local_workers(count, base_port=DEFAULT_PORT, extra_args=()):
+    """Starts `count` worker processes on consecutive localhost ports and returns the Popen objects."""
+    return [subprocess.Popen([sys.executable, __file__, "serve", "--host", "127.0.0.1", "--port", str(base_port + i),
+                              *extra_args])
+            for i in range(count)]
+
+
+def _read_tags_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run CLIP tagging workers for the photo organizer.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_tagger_arguments(subparser):
+        subparser.add_argument("--tags-file", help="Custom tags, one per line (e.g. the app's custom_tags.txt)")
+        subparser.add_argument("--vocabulary-file", help="Large tag vocabulary file")
+        subparser.add_argument("--scoring-mode", help="Overrides the scoring mode from tag_scoring.json")
+        subparser.add_argument("--threads", type=int, help="Torch threads per worker")
+
+    serve_parser = subparsers.add_parser("serve", help="Run one worker")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Use 0.0.0.0 to accept clients from the LAN")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    add_tagger_arguments(serve_parser)
+
+    spawn_parser = subparsers.add_parser("spawn-local", help="Run several workers on this machine")
+    spawn_parser.add_argument("count", type=int)
+    spawn_parser.add_argument("--base-port", type=int, default=DEFAULT_PORT)
+    add_tagger_arguments(spawn_parser)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        custom_tags = _read_tags_file(args.tags_file) if args.tags_file else None
+        serve(args.host, args.port, custom_tags, args.scoring_mode, args.vocabulary_file, args.threads)
+        return 0
+
+    extra_args = []
+    for option, value in (("--tags-file", args.tags_file), ("--vocabulary-file", args.vocabulary_file),
+                          ("--scoring-mode", args.scoring_mode), ("--threads", args.threads)):
+        if value:
+            extra_args += [option, str(value)]
+    processes = spawn_local_workers(args.count, args.base_port, extra_args)
+    print("Tagging workers: " + ",".join(f"127.0.0.1:{args.base_port + i}" for i in range(args.count)), flush=True)
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
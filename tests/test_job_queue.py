@@ -0,0 +1,55 @@
+from benchmark import StubTagger, generate_corpus
+from job_queue import JobQueue, OrganizeJob
+
+
+class ClosableStubTagger(StubTagger):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class RecordingQueue(JobQueue):
+    """Builds stub taggers instead of loading CLIP, recording the options of each one."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.built = []
+
+    def _load_tagger(self):
+        if self.image_tagger is None:
+            self.built.append(dict(self.tagger_options))
+            self.image_tagger = ClosableStubTagger(candidate_tags=self.tagger_options["custom_tags"] or ["a photo of a Dog"])
+            self._owns_tagger = True
+
+
+def test_job_with_other_tags_gets_its_own_tagger(tmp_path):
+    generate_corpus(str(tmp_path / "a"), 3, seed=1)
+    generate_corpus(str(tmp_path / "b"), 3, seed=2)
+    queue = RecordingQueue(log_callback=lambda message, level='info': None)
+    first = queue.add(OrganizeJob(str(tmp_path / "a"), str(tmp_path / "out_a"), {"custom_tags": ["a photo of a Dog"]}))
+    second = queue.add(OrganizeJob(str(tmp_path / "b"), str(tmp_path / "out_b"), {"custom_tags": ["a photo of a Cat"]}))
+
+    assert queue.run()
+    assert [options["custom_tags"] for options in queue.built] == [["a photo of a Dog"], ["a photo of a Cat"]]
+    assert first.organizer.image_tagger is not second.organizer.image_tagger
+
+
+def test_bad_job_fails_and_the_next_one_runs(tmp_path):
+    generate_corpus(str(tmp_path / "a"), 3, seed=1)
+    queue = JobQueue(log_callback=lambda message, level='info': None, image_tagger=StubTagger())
+    bad = queue.add(OrganizeJob(str(tmp_path / "a"), str(tmp_path / "out"), {"folder_layout": "{bogus}"}))
+    good = queue.add(OrganizeJob(str(tmp_path / "a"), str(tmp_path / "out")))
+
+    assert not queue.run()
+    assert (bad.status, good.status) == ("failed", "done")
+
+
+def test_worker_pools_are_closed_when_replaced_and_after_the_run(tmp_path):
+    generate_corpus(str(tmp_path / "a"), 3, seed=1)
+    queue = RecordingQueue(log_callback=lambda message, level='info': None)
+    first = queue.add(OrganizeJob(str(tmp_path / "a"), str(tmp_path / "out"), {"tagging_workers": "127.0.0.1:5701"}))
+    second = queue.add(OrganizeJob(str(tmp_path / "a"), str(tmp_path / "out"), {"tagging_workers": "127.0.0.1:5702"}))
+
+    assert queue.run()
+    assert first.organizer.image_tagger.closed and second.organizer.image_tagger.closed
+    assert queue.image_tagger is None
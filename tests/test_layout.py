@@ -0,0 +1,26 @@
+import os
+from datetime import datetime
+
+from layout import DestinationLayout
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+
+def test_counter_continues_after_existing_files(tmp_path):
+    layout = DestinationLayout("{year}", "{date}{sep}{counter:04d}{sep}{tags}", base_folder=str(tmp_path))
+    _touch(os.path.join(tmp_path, "2024", "2024-05-01,0007,Beach.jpg"))
+    _touch(os.path.join(tmp_path, "2024", "2024-05-02,0012.cr2"))
+    _touch(os.path.join(tmp_path, "2024", "unrelated.jpg"))
+
+    date = datetime(2024, 6, 1, 12, 0, 0)
+    assert layout.build("IMG_1.jpg", date, [("a photo of a Dog", 0.9)]) == ("2024", "2024-06-01,0013,Dog.jpg")
+    assert layout.build("IMG_2.jpg", date, []) == ("2024", "2024-06-01,0014.jpg")
+    assert layout.build("IMG_3.jpg", datetime(2025, 1, 1), []) == ("2025", "2025-01-01,0001.jpg")
+
+
+def test_counter_without_base_folder_starts_at_one():
+    layout = DestinationLayout("{year}", "IMG {counter}")
+    assert layout.build("a.jpg", datetime(2024, 1, 1), []) == ("2024", "IMG_1.jpg")
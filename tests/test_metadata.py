@@ -0,0 +1,71 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+import main_logic
+import metadata
+from benchmark import StubTagger
+from metadata import MetadataWriter, read_xmp_keywords, retag_library
+
+
+def test_submit_blocks_once_the_queue_is_full(tmp_path, monkeypatch):
+    release = threading.Event()
+    write_xmp_keywords = metadata.write_xmp_keywords
+
+    def slow_write(path, keywords):
+        release.wait(5)
+        write_xmp_keywords(path, keywords)
+    monkeypatch.setattr(metadata, "write_xmp_keywords", slow_write)
+
+    writer = MetadataWriter("xmp", max_workers=1, log_callback=lambda message, level='info': None)
+    photos = [str(tmp_path / f"IMG_{i}.jpg") for i in range(10)]
+    submitting = threading.Thread(target=lambda: [writer.submit([photo], [("a photo of a Dog", 0.9)]) for photo in photos])
+    submitting.start()
+    submitting.join(0.5)
+
+    assert submitting.is_alive()
+    assert writer.pending == 4
+    release.set()
+    submitting.join(5)
+    assert writer.finish() == 0
+    assert writer.written_count == 10 and writer.pending == 0
+    assert read_xmp_keywords(str(tmp_path / "IMG_9.xmp")) == ["Dog"]
+
+
+class _FakeRaw:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def postprocess(self, **kwargs):
+        return np.zeros((600, 800, 3), dtype=np.uint8)
+
+
+def _library_with_lone_raw(tmp_path):
+    Image.new("RGB", (64, 48), "red").save(tmp_path / "IMG_1.jpg")
+    (tmp_path / "IMG_1.cr2").write_bytes(b"raw data") # Shares the JPG's sidecar
+    (tmp_path / "IMG_2.cr2").write_bytes(b"raw data")
+
+
+def test_retag_decodes_raws_without_a_jpg(tmp_path, monkeypatch):
+    _library_with_lone_raw(tmp_path)
+    monkeypatch.setattr(main_logic, "import_rawpy", lambda: SimpleNamespace(imread=lambda path: _FakeRaw()))
+
+    assert retag_library(str(tmp_path), StubTagger(), log=lambda message: None)
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".xmp")) == ["IMG_1.xmp", "IMG_2.xmp"]
+    assert read_xmp_keywords(str(tmp_path / "IMG_2.xmp"))
+
+
+def test_retag_reports_raws_it_cannot_decode(tmp_path, monkeypatch):
+    _library_with_lone_raw(tmp_path)
+    monkeypatch.setattr(main_logic, "import_rawpy", lambda: None)
+    messages = []
+
+    assert retag_library(str(tmp_path), StubTagger(), log=messages.append)
+    assert any("Skipped 1 RAW files" in message for message in messages)
+    assert not (tmp_path / "IMG_2.xmp").exists()
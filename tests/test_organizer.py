@@ -0,0 +1,67 @@
+import hashlib
+import os
+from datetime import datetime
+
+from PIL import Image
+
+from benchmark import StubTagger
+from main_logic import PhotoOrganizer
+from metadata import read_xmp_keywords, write_xmp_keywords
+
+
+def test_checksum_manifest_holds_after_keywords_are_merged(tmp_path):
+    source, destination = tmp_path / "source", tmp_path / "destination"
+    source.mkdir()
+    Image.new("RGB", (64, 48), "red").save(source / "IMG_1.jpg")
+    (source / "IMG_1.cr2").write_bytes(b"raw data")
+    write_xmp_keywords(str(source / "IMG_1.xmp"), [])
+
+    organizer = PhotoOrganizer(str(source), str(destination), image_tagger=StubTagger(), transfer_mode="copy",
+                               verify_checksums=True, metadata_mode="xmp", build_search_index=False,
+                               log_callback=lambda message, level='info': None)
+    assert organizer.organize_photos()
+
+    manifest = destination / "checksums.sha256"
+    listed = []
+    for line in manifest.read_text(encoding="utf-8").splitlines():
+        digest, relative = line.split(" *", 1)
+        assert hashlib.sha256((destination / relative).read_bytes()).hexdigest() == digest
+        listed.append(os.path.splitext(relative)[1])
+    assert sorted(listed) == [".cr2", ".jpg"]
+
+    sidecars = [os.path.join(root, name) for root, _, names in os.walk(destination) for name in names if name.endswith(".xmp")]
+    assert len(sidecars) == 1 and read_xmp_keywords(sidecars[0])
+
+
+def test_files_moved_with_their_photo_are_not_skipped(tmp_path):
+    source, destination = tmp_path / "source", tmp_path / "destination"
+    source.mkdir()
+    Image.new("RGB", (64, 48), "red").save(source / "IMG_1.jpg")
+    (source / "IMG_1.cr2").write_bytes(b"raw data")
+    write_xmp_keywords(str(source / "IMG_1.xmp"), [])
+
+    organizer = PhotoOrganizer(str(source), str(destination), image_tagger=StubTagger(), metadata_mode="xmp",
+                               log_callback=lambda message, level='info': None)
+    files = organizer.analyze_source()
+    # The JPG first, so its RAW and sidecar are already gone when the loop reaches them
+    assert organizer.move_analyzed_files(sorted(files, key=lambda path: not path.endswith(".jpg")))
+
+    assert (organizer.processed_count, organizer.skipped_count) == (1, 0)
+    assert not os.listdir(source)
+
+
+def test_sidecars_do_not_bridge_events(tmp_path):
+    source, destination = tmp_path / "source", tmp_path / "destination"
+    source.mkdir()
+    for name, day in (("IMG_1", 1), ("IMG_2", 3)):
+        Image.new("RGB", (64, 48), "red").save(source / f"{name}.jpg")
+        os.utime(source / f"{name}.jpg", (0, datetime(2024, 5, day, 12).timestamp()))
+    # Edited in between the two shoots
+    write_xmp_keywords(str(source / "IMG_1.xmp"), [])
+    os.utime(source / "IMG_1.xmp", (0, datetime(2024, 5, 2, 12).timestamp()))
+
+    organizer = PhotoOrganizer(str(source), str(destination), image_tagger=StubTagger(),
+                               folder_layout="{event}", event_gap_hours=30,
+                               log_callback=lambda message, level='info': None)
+    assert organizer.organize_photos()
+    assert len(os.listdir(destination)) == 2
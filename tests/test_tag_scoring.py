@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from tag_scoring import TagScorer, SCORING_MODES
+
+
+def _normalized(rng, rows, dim):
+    vectors = rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _reference_probabilities(scorer, image_embeds, tag_embeddings, logit_scale, crops_per_image):
+    probs = scorer.probabilities(image_embeds @ tag_embeddings.T, logit_scale)
+    if crops_per_image > 1:
+        probs = probs.reshape(-1, crops_per_image, probs.shape[1]).max(axis=1)
+    return probs
+
+
+@pytest.mark.parametrize("mode", SCORING_MODES)
+@pytest.mark.parametrize("with_groups", [False, True])
+@pytest.mark.parametrize("crops_per_image", [1, 3])
+def test_score_blocked_matches_probabilities(mode, with_groups, crops_per_image):
+    rng = np.random.default_rng(0)
+    tags = [f"a photo of tag {i}" for i in range(1000)]
+    groups = {"small": tags[100:110], "other": tags[500:700]} if with_groups else None
+    scorer = TagScorer(tags, mode=mode, groups=groups)
+    image_embeds = _normalized(rng, 4 * crops_per_image, 32)
+    tag_embeddings = _normalized(rng, len(tags), 32)
+
+    indices, values = scorer.score_blocked(image_embeds, tag_embeddings, 100.0, 5,
+                                           block_size=128, crops_per_image=crops_per_image)
+    reference = _reference_probabilities(scorer, image_embeds, tag_embeddings, 100.0, crops_per_image)
+    _, expected_values = TagScorer.top_k(reference, 5)
+
+    np.testing.assert_allclose(values, expected_values, rtol=1e-4, atol=1e-7)
+    # Compared through the reference probabilities, so tags tied in float32 may come in either order
+    np.testing.assert_allclose(np.take_along_axis(reference, indices, axis=1), expected_values, rtol=1e-4, atol=1e-7)
+
+
+def test_softmax_ignores_groups():
+    tags = [f"tag {i}" for i in range(20)]
+    similarities = np.random.default_rng(1).uniform(0, 0.3, (2, len(tags))).astype(np.float32)
+    plain = TagScorer(tags, mode="softmax").probabilities(similarities, 100.0)
+    with_groups = TagScorer(tags, mode="softmax", groups={"g": tags[:5]}).probabilities(similarities, 100.0)
+    np.testing.assert_allclose(plain, with_groups)
+    np.testing.assert_allclose(plain.sum(axis=1), 1.0, rtol=1e-5)
@@ -0,0 +1,44 @@
+import os
+import threading
+
+import transfer
+from transfer import FileTransferPool
+
+
+def _write(path, data=b"photo"):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_cancel_finishes_started_group_and_drops_queued(tmp_path, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    copy_file = transfer.copy_file
+
+    def slow_copy(source, destination, *args):
+        started.set()
+        release.wait(5)
+        return copy_file(source, destination, *args)
+    monkeypatch.setattr(transfer, "copy_file", slow_copy)
+
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    groups = [[(_write(str(src / f"IMG_{i}{ext}")), str(dst / f"out_{i}{ext}")) for ext in (".jpg", ".cr2")]
+              for i in range(3)]
+
+    pool = FileTransferPool(io_concurrency=1, log_callback=lambda message, level='info': None)
+    for group in groups:
+        pool.submit(group)
+    assert started.wait(5)
+    cancelling = threading.Thread(target=pool.cancel)
+    cancelling.start()
+    while not pool.cancelled:
+        cancelling.join(0.01)
+    release.set()
+    cancelling.join(5)
+
+    assert sorted(os.listdir(dst)) == ["out_0.cr2", "out_0.jpg"]
+    assert pool.copied_count == 1
+    assert pool.pending == 0
@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import errno
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import print_log
+
+
+TRANSFER_MODES = ("move", "copy")
+DEFAULT_IO_CONCURRENCY = 4
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+CHECKSUM_MANIFEST = "checksums.sha256"
+PARTIAL_SUFFIX = ".part"
+# copy_file_range/sendfile cannot be used for this pair of files; fall back to a buffered copy
+_ZERO_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+def _zero_copy(fsrc, fdst, size):
+    """Copies in the kernel with copy_file_range or sendfile. Returns False if neither applies."""
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    for name in ("copy_file_range", "sendfile"):
+        if not hasattr(os, name) or (name == "sendfile" and not sys.platform.startswith("linux")):
+            continue
+        copy = getattr(os, name)
+        copied = 0
+        try:
+            while copied < size:
+                if name == "copy_file_range":
+                    sent = copy(in_fd, out_fd, min(COPY_BUFFER_SIZE, size - copied))
+                else:
+                    sent = copy(out_fd, in_fd, copied, min(COPY_BUFFER_SIZE, size - copied))
+                if not sent:
+                    break
+                copied += sent
+            return True
+        except OSError as e:
+            if copied or e.errno not in _ZERO_COPY_UNSUPPORTED:
+                raise
+    return False
+
+
+def copy_file(src, dst, checksum=False, buffer=None):
+    """
+    Copies src to dst with its timestamps and permissions. The data goes to dst + '.part' first
+    and is renamed into place, so an interrupted copy never looks complete. With checksum=True
+    the SHA-256 of the data is computed from the same reads that feed the copy and returned.
+    """
+    size = os.path.getsize(src)
+    partial_path = dst + PARTIAL_SUFFIX
+    digest = hashlib.sha256() if checksum else None
+    try:
+        with open(src, 'rb') as fsrc, open(partial_path, 'wb') as fdst:
+            if digest is not None or not _zero_copy(fsrc, fdst, size):
+                buffer = buffer if buffer is not None else bytearray(COPY_BUFFER_SIZE)
+                view = memoryview(buffer)
+                while True:
+                    count = fsrc.readinto(buffer)
+                    if not count:
+                        break
+                    if digest is not None:
+                        digest.update(view[:count])
+                    fdst.write(view[:count])
+        if os.path.getsize(partial_path) != size:
+            raise OSError(f"Copied {os.path.getsize(partial_path)} of {size} bytes")
+        shutil.copystat(src, partial_path)
+        os.replace(partial_path, dst)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
+    return digest.hexdigest() if digest is not None else None
+
+
+class FileTransferPool:
+    """
+    Copies files on io_concurrency threads while the caller keeps deciding destinations.
+
+    Each submit() is one group (a photo and its paired RAW/JPG) copied in order on one thread.
+    Destinations are reserved as soon as a group is queued, so names chosen for later files do
+    not collide with copies still in flight (check is_reserved() alongside os.path.exists()).
+    At most a few groups per thread are queued at once; submit() blocks beyond that.
+    cancel() drops the queued groups; groups already started are copied in full, so a photo is never
+    left without its paired file.
+    """
+    def __init__(self, io_concurrency=DEFAULT_IO_CONCURRENCY, verify_checksums=False, manifest_path=None,
+                 log_callback=None, metrics=None):
+        self.io_concurrency = max(1, io_concurrency)
+        self.verify_checksums = verify_checksums
+        self.manifest_path = manifest_path
+        self.log_callback = log_callback if log_callback else print_log
+        self.metrics = metrics
+        self.copied_count = 0
+        self.error_count = 0
+        self.pending = 0
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._reserved = set()
+        self._slots = threading.BoundedSemaphore(self.io_concurrency * 4)
+        self._buffers = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=self.io_concurrency, thread_name_prefix="transfer")
+
+    def is_reserved(self, path):
+        with self._lock:
+            return path in self._reserved
+
+    def submit(self, transfers, on_done=None, unlisted=()):
+        """
+        Queues [(source, destination), ...]. A failed copy stops the rest of its group.
+        on_done(copied_destinations) runs on the copying thread once the first file is copied.
+        Destinations in unlisted are left out of the checksum manifest, e.g. sidecars that
+        on_done rewrites after copying.
+        """
+        self._slots.acquire()
+        with self._lock:
+            self._reserved.update(destination for _, destination in transfers)
+            self.pending += 1
+        self._executor.submit(self._copy_group, list(transfers), on_done, frozenset(unlisted))
+
+    def _copy_group(self, transfers, on_done, unlisted=frozenset()):
+        copied = []
+        try:
+            # Checked only before a group starts: a photo and its paired files are copied together
+            if self.cancelled:
+                return
+            # One reusable buffer per thread instead of one allocation per file
+            if not hasattr(self._buffers, "buffer"):
+                self._buffers.buffer = bytearray(COPY_BUFFER_SIZE)
+            for source, destination in transfers:
+                start = time.perf_counter()
+                try:
+                    digest = copy_file(source, destination, self.verify_checksums, self._buffers.buffer)
+                except Exception as e:
+                    with self._lock:
+                        self.error_count += 1
+                    self.log_callback(f"Error copying '{source}' to '{destination}': {e}", 'error')
+                    break
+                copied.append(destination)
+                if digest is not None and self.manifest_path and destination not in unlisted:
+                    relative = os.path.relpath(destination, os.path.dirname(self.manifest_path)).replace(os.sep, "/")
+                    with self._lock, open(self.manifest_path, 'a', encoding='utf-8') as f:
+                        f.write(f"{digest} *{relative}\n")
+                if self.metrics is not None:
+                    self.metrics.record_batch("transfer", time.perf_counter() - start, nbytes=os.path.getsize(destination))
+            if copied:
+                with self._lock:
+                    self.copied_count += 1
+                if on_done is not None:
+                    on_done(copied)
+        finally:
+            with self._lock:
+                self._reserved.difference_update(destination for _, destination in transfers)
+                self.pending -= 1
+            self._slots.release()
+
+    def finish(self):
+        """Waits for every queued copy. Returns the number of failed copies."""
+        self._executor.shutdown(wait=True)
+        return self.error_count
+
+    def cancel(self):
+        """
+        Drops queued groups and waits only for the groups being copied right now, which are
+        finished in full. Returns the number of failed copies.
+        """
+        self.cancelled = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        # Dropped groups never ran, so their reservations and pending count are cleared here
+        with self._lock:
+            self._reserved.clear()
+            self.pending = 0
+        return self.error_count
@@ -3,6 +3,7 @@ from datetime import datetime
 from PIL import Image
 from PIL.ExifTags import TAGS, GPSTAGS
 import re
+from functools import lru_cache
 
 # Define common image and RAW extensions
 IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
@@ -16,7 +17,7 @@ def get_image_date(filepath):
                 for tag_id, value in exif_data.items():
                     tag_name = TAGS.get(tag_id, tag_id)
                     if tag_name == 'DateTimeOriginal' or tag_name == 'DateTimeDigitized':
-                        return datetime.strptime(value, "%Y:%m:%d %H")
+                        return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
     except Exception:
         pass
 
@@ -26,17 +27,41 @@ def get_image_date(filepath):
         print(f"Warning: Could not get file system date for {filepath}: {e}")
         return None 
 
-def sanitize_filename(filename, allowed_delimiter_chars=""):
+def print_log(message, level='info'):
+    """Fallback log_callback(message, level) for classes used without a GUI."""
+    print(f"[{level.upper()}] {message}")
+
+EXIF_MODEL = 0x0110
+
+def get_camera_model(filepath):
+    """Camera model from EXIF, or None if the file has none or cannot be read."""
+    try:
+        with Image.open(filepath) as img:
+            model = img.getexif().get(EXIF_MODEL)
+            if model:
+                return str(model).strip().strip('\x00') or None
+    except Exception:
+        pass
+    return None
+
+_WHITESPACE_RUN = re.compile(r'\s+')
+_UNDERSCORE_RUN = re.compile(r'__+')
+
+@lru_cache(maxsize=64)
+def _unsafe_chars_pattern(allowed_delimiter_chars):
     safe_chars_pattern = r'a-zA-Z0-9\s._\-'
     
     if allowed_delimiter_chars:
         escaped_delimiter_chars = re.escape(allowed_delimiter_chars)
         safe_chars_pattern += escaped_delimiter_chars
 
-    sanitized = re.sub(r'[^' + safe_chars_pattern + r']', '', filename)
+    return re.compile(r'[^' + safe_chars_pattern + r']')
+
+def sanitize_filename(filename, allowed_delimiter_chars=""):
+    sanitized = _unsafe_chars_pattern(allowed_delimiter_chars).sub('', filename)
 
-    sanitized = re.sub(r'\s+', '_', sanitized)    
-    sanitized = re.sub(r'__+', '_', sanitized)
+    sanitized = _WHITESPACE_RUN.sub('_', sanitized)    
+    sanitized = _UNDERSCORE_RUN.sub('_', sanitized)
     return sanitized.strip('_')
 
 def find_paired_file(image_path, paired_extensions):